@@ -1,782 +1,667 @@
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, Blueprint, current_app, g, render_template, request, jsonify, make_response, Response
+import hashlib
+import itertools
 import os
-import json
-import threading
 import time
-import copy
-import secrets
-from threading import Lock
-
-app = Flask(__name__)
-app.secret_key = 'eden_game_secret_key_2026'
-
-# 全局锁：确保 /join 请求串行执行
-join_lock = Lock()
-
-# 配置
+from functools import lru_cache
+import export
+import metrics
+import profiling
+import qr
+from commands import CommandTimeout
+from compression import AssetCache, ResponseCompressor, asset_response, ASSET_MAX_AGE, PAGE_MAX_AGE
+from rooms import RoomRegistry, GameConfig, DEFAULT_ROOM, MAX_BATCH_VOTES, cookie_name
+from players import MAX_PLAYER_ID
+from ratelimit import RateLimiter, Admission, retry_after
+from werkzeug.middleware.proxy_fix import ProxyFix
+from settlement import Rules
+from storage import StorageError
+
+# 配置（create_app(**overrides) 可按名字覆盖）
 START_BALANCE = 10000
-MAX_PLAYERS = 70
+MAX_PLAYERS = int(os.environ.get('EDEN_MAX_PLAYERS', 70))  # 每局玩家上限，可到上万
 MAX_ROUNDS = 8
 VOTING_DURATION = 60
 REWARD = 1000    # 奖励
 PENALTY = 2000   # 惩罚（原为1000）
-
-game_state = {
-    'current_round': 1,
-    'round_status': 'waiting',  # 'waiting', 'voting', 'ended'
-    'game_ended': False,
-    'voting_start_time': None
+FINAL_ROUND_MARGIN = 10  # 第8轮：红 >= 有效玩家数 - 10 即全体胜利
+CHECKPOINT_EVERY = 500  # 日志累计多少条后压缩为检查点
+SNAPSHOT_RETENTION = int(os.environ.get('EDEN_SNAPSHOT_RETENTION', MAX_ROUNDS))  # 保留多少轮可回退的快照
+STORAGE = os.environ.get('EDEN_STORAGE', 'json')  # 存储后端：json（默认）或 sqlite
+ROOMS_DIR = 'rooms'  # 默认房间仍使用当前目录下的 game_data.json，其余房间各占 rooms/<id>/
+ROOM_IDLE_SECONDS = 1800  # 空闲房间写检查点后卸载
+PUBLIC_URL = os.environ.get('EDEN_PUBLIC_URL')  # 二维码里的地址前缀（反向代理后面时设置），默认用请求的 Host
+QRCODE_SIZE = 480  # 二维码 PNG 默认边长（像素）
+QRCODE_MAX_AGE = 86400
+RATE_LIMITS = os.environ.get('EDEN_RATE_LIMITS', '1') != '0'  # 按玩家 / IP 限流（见 ratelimit.py）
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('EDEN_MAX_CONCURRENT', 64))  # 同时处理的请求上限，0 表示不限
+PROXY_HOPS = int(os.environ.get('EDEN_PROXY_HOPS', 0))  # 前面有几层反向代理：按 X-Forwarded-For 取客户端 IP
+LONGPOLL_TIMEOUT = 25      # 手机长轮询默认最多挂多久（秒），短于常见代理的空闲超时
+LONGPOLL_MAX_TIMEOUT = 55
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')  # 共用的 CSS / JS
+
+bp = Blueprint('eden', __name__)
+
+
+def create_app(**overrides):
+    # 只建对象，不读盘、不起线程：房间在第一次被访问时才加载（检查点 + 其后的日志），
+    # 投票截止时间在第一个请求到来时恢复，所以 import / 建 app 的开销与游戏历史大小无关
+    app = Flask(__name__, static_folder=None)  # /static 由内存中的 AssetCache 提供
+    app.secret_key = 'eden_game_secret_key_2026'
+    app.config.update(
+        START_BALANCE=START_BALANCE, MAX_PLAYERS=MAX_PLAYERS, MAX_ROUNDS=MAX_ROUNDS,
+        VOTING_DURATION=VOTING_DURATION, REWARD=REWARD, PENALTY=PENALTY,
+        FINAL_ROUND_MARGIN=FINAL_ROUND_MARGIN, CHECKPOINT_EVERY=CHECKPOINT_EVERY,
+        SNAPSHOT_RETENTION=SNAPSHOT_RETENTION, STORAGE=STORAGE,
+        ROOMS_DIR=ROOMS_DIR, ROOM_IDLE_SECONDS=ROOM_IDLE_SECONDS, PUBLIC_URL=PUBLIC_URL,
+        RATE_LIMITS=RATE_LIMITS, MAX_CONCURRENT_REQUESTS=MAX_CONCURRENT_REQUESTS, PROXY_HOPS=PROXY_HOPS,
+    )
+    app.config.update(overrides)
+    cfg = app.config
+    rules = Rules(cfg['MAX_ROUNDS'], cfg['REWARD'], cfg['PENALTY'], cfg['FINAL_ROUND_MARGIN'])
+    config = GameConfig(cfg['START_BALANCE'], cfg['MAX_PLAYERS'], cfg['VOTING_DURATION'], rules,
+                        cfg['CHECKPOINT_EVERY'], cfg['SNAPSHOT_RETENTION'], cfg['STORAGE'])
+    registry = RoomRegistry(cfg['ROOMS_DIR'], config, idle_seconds=cfg['ROOM_IDLE_SECONDS'])
+    app.extensions['eden'] = registry
+    metrics.OPEN_POLLERS.set_function(registry.subscriber_count, kind='sse')
+    metrics.ACTIVE_ROOMS.set_function(lambda: len(registry.active_rooms()))
+    assets = AssetCache(STATIC_DIR)
+    app.extensions['eden_assets'] = assets
+    app.extensions['eden_compressor'] = ResponseCompressor()
+    app.jinja_env.globals['asset_url'] = assets.url
+    app.extensions['eden_limiter'] = RateLimiter() if cfg['RATE_LIMITS'] else None
+    app.extensions['eden_admission'] = Admission(cfg['MAX_CONCURRENT_REQUESTS'])
+    if cfg['PROXY_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=cfg['PROXY_HOPS'])
+    app.register_blueprint(bp)
+    return app
+
+
+def get_registry():
+    return current_app.extensions['eden']
+
+
+@bp.before_app_request
+def start_registry():
+    # 第一个请求时：恢复各房间未到期的投票截止时间、注册退出时落盘、读入并压缩静态资源（只执行一次）
+    get_registry().start()
+    current_app.extensions['eden_assets'].load()
+
+
+def route_name():
+    rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+    if rule.startswith('/room/<room_id>'):
+        rule = rule[len('/room/<room_id>'):]  # 默认房间和其他房间合并统计
+    return rule
+
+
+# ===== 准入控制 + 限流（见 ratelimit.py）=====
+ROUTE_BUDGETS = {
+    '/join': 'join',
+    '/mobile': 'mobile',
+    '/api/vote': 'vote',
+    '/api/votes/batch': 'vote',
+    '/api/timer': 'poll',
+    '/api/vote-status': 'poll',
+    '/api/player-status/<int:player_id>': 'poll',
+    '/mobile/check_status': 'poll',
+    '/api/player/<int:player_id>/state': 'poll',
 }
-players = {}
-DATA_FILE = 'game_data.json'
-SNAPSHOT_FILE = 'snapshots.json'
-snapshots = {}
-
-def load_data():
-    global game_state, players
-    # 默认状态
-    default_game_state = {
-        'current_round': 1,
-        'round_status': 'waiting',
-        'game_ended': False,
-        'voting_start_time': None,
-        'won_by_all': False  # 新增字段，用于标记全体胜利
-    }
-    
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-            
-            # 安全提取 game_state
-            loaded_game_state = raw_data.get('game_state', {})
-            loaded_players = raw_data.get('players', {})
-
-            # 合并默认值 + 加载值
-            merged_game_state = {**default_game_state, **loaded_game_state}
-
-            # ✅ 关键：清洗 voting_start_time
-            vst = merged_game_state.get('voting_start_time')
-            if vst is not None:
-                try:
-                    merged_game_state['voting_start_time'] = float(vst)
-                except (ValueError, TypeError):
-                    merged_game_state['voting_start_time'] = None
-
-            # ✅ 清洗 players 数据（防止 ID 不是 int）
-            cleaned_players = {}
-            for k, v in loaded_players.items():
-                try:
-                    pid = int(k)
-                    # 确保玩家结构完整
-                    cleaned_players[pid] = {
-                        'id': pid,
-                        'balance': int(v.get('balance', START_BALANCE)),
-                        'votes': list(v.get('votes', []))
-                    }
-                except (ValueError, TypeError, AttributeError):
-                    continue  # 跳过损坏的玩家数据
-
-            game_state.update(merged_game_state)
-            players.clear()
-            players.update(cleaned_players)
-
-        except Exception as e:
-            print(f"⚠️ 警告：加载 {DATA_FILE} 失败，使用默认状态。错误：{e}")
-            game_state.update(default_game_state)
-            players.clear()
-            save_data()  # 重建干净文件
-    else:
-        # 文件不存在，初始化
-        game_state.update(default_game_state)
-        players.clear()
-
-def save_data():
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump({
-            'game_state': game_state,
-            'players': players
-        }, f, ensure_ascii=False, indent=2)
-
-def load_snapshots():
-    global snapshots
-    if os.path.exists(SNAPSHOT_FILE):
-        with open(SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
-            snapshots = json.load(f)
-
-def save_snapshot(round_num):
-    snapshots[str(round_num)] = {
-        'players': copy.deepcopy(players),
-        'game_state': copy.deepcopy(game_state)
-    }
-    with open(SNAPSHOT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(snapshots, f, ensure_ascii=False, indent=2)
-
-load_data()
-load_snapshots()
-
-def auto_end_voting():
-    while True:
-        time.sleep(5)
-        with app.app_context():
-            if (game_state['round_status'] == 'voting' and game_state['voting_start_time'] is not None):
-                elapsed = time.time() - game_state['voting_start_time']
-                if elapsed >= VOTING_DURATION:
-                    try:
-                        end_round_logic()
-                        save_data()
-                    except Exception as e:
-                        print("💥 结算崩溃！错误：", repr(e))
-                        import traceback
-                        traceback.print_exc()
-                        # 防止线程退出
-                        game_state['round_status'] = 'waiting'
-                        game_state['voting_start_time'] = None
-threading.Thread(target=auto_end_voting, daemon=True).start()
-
-def end_round_logic():
-    current_round = game_state['current_round']
-    
-    # Step 1: 扣除未投票玩家 PENALTY（-2000）
-    for pid, p in players.items():
-        if len(p['votes']) < current_round:
-            p['balance'] = max(0, p['balance'] - PENALTY)
-
-    # Step 2: 收集本轮已投票玩家（用于计票）
-    voted_players = [p for p in players.values() if len(p['votes']) >= current_round]
-    total_voted = len(voted_players)
-    
-    # 初始化计票
-    votes = {'red': 0, 'gold': 0, 'silver': 0}
-    for p in voted_players:
-        apple = p['votes'][current_round - 1]
-        if apple in votes:
-            votes[apple] += 1
-    
-    red, gold, silver = votes['red'], votes['gold'], votes['silver']
-    game_won_by_all = False
-
-    # ====== 全体胜利条件（兼容旧规则 + 新增规则）======
-    game_won_by_all = False
-    if total_voted > 0:
-        # 原有规则：仅1人投票且投红 → 全体胜利
-        if total_voted == 1 and red == 1:
-            game_won_by_all = True
-        # 新增规则1：前7轮所有人投红
-        elif current_round < MAX_ROUNDS and red == total_voted:
-            game_won_by_all = True
-        # 新增规则2：第8轮红 >= 本轮有效玩家数 - 10
-        elif current_round == MAX_ROUNDS:
-            total_eligible = game_state.get('current_round_eligible', total_voted)
-            if red >= total_eligible - 10:
-                game_won_by_all = True
-
-    if game_won_by_all:
-        # ✅ 全体胜利：余额保持不变（不加奖励，不扣惩罚）
-        game_state['game_ended'] = True
-        game_state['round_status'] = 'ended'
-        game_state['won_by_all'] = True
-        save_snapshot(current_round)
-        return
-
-    # ====== 常规结算逻辑（与原逻辑一致，仅惩罚值改为 PENALTY）======
-    if total_voted == 0:
-        # 无人投票：已在 Step 1 扣款，无需额外操作
-        pass
-
-    elif total_voted == 1:
-        # 此时 red != 1（否则已触发全体胜利），所以是金或银
-        for p in players.values():
-            p['balance'] = max(0, p['balance'] - PENALTY)
+# 不计入并发上限（有额度的仍然限流）：长连接推送 / 长轮询、内存中的静态资源等；/admin 既不限流也不计入
+ADMISSION_EXEMPT = {'/api/stream', '/api/player/<int:player_id>/state', '/metrics', '/rules', '/static/<path:filename>', '/qrcode', '/qrcode_img'}
 
+def reject(route, status, reason, message, wait):
+    metrics.REJECTED_REQUESTS.inc(route=route, reason=reason)
+    if route.startswith('/api/') or route == '/mobile/check_status':
+        resp = jsonify({'success': False, 'message': message})
     else:
-        # 多人投票
-        if red == 0:
-            if gold < silver:
-                for p in voted_players:
-                    if p['votes'][current_round - 1] == 'gold':
-                        p['balance'] += REWARD
-                    else:
-                        p['balance'] = max(0, p['balance'] - PENALTY)
-            elif silver < gold:
-                for p in voted_players:
-                    if p['votes'][current_round - 1] == 'silver':
-                        p['balance'] += REWARD
-                    else:
-                        p['balance'] = max(0, p['balance'] - PENALTY)
-            else:
-                # 金 == 银（含全金、全银）
-                for p in players.values():
-                    p['balance'] = max(0, p['balance'] - PENALTY)
-        else:
-                # 有人投红（red > 0）
-                if current_round == MAX_ROUNDS:
-                   # ===== 第8轮：两阶段胜负判定 =====
-                    # 阶段1: 红能否胜？必须 red > 0 且严格小于所有有票的非红
-                    red_can_win = False
-                    if red > 0:
-                        active_non_red = []
-                        if gold > 0:
-                            active_non_red.append(gold)
-                        if silver > 0:
-                            active_non_red.append(silver)
-                        # 只有当存在非红投票时，才判断红是否更少
-                        if active_non_red and all(red < x for x in active_non_red):
-                            red_can_win = True
-
-                    if red_can_win:
-                        # --- 红胜 ---
-                        for p in players.values():
-                            if len(p['votes']) >= current_round:
-                                vote = p['votes'][current_round - 1]
-                                if vote == 'red':
-                                    p['balance'] += REWARD
-                                else:
-                                    p['balance'] = max(0, p['balance'] - PENALTY)
-                    else:
-                        # --- 红失败（或 red == 0），处理非红 ---
-                        if red == 0:
-                            # 情况A: 无人投红 → 金、银需至少两个活跃才能决胜
-                            non_red_active = []
-                            if gold > 0:
-                                non_red_active.append('gold')
-                            if silver > 0:
-                                non_red_active.append('silver')
-                            
-                            if len(non_red_active) < 2:
-                                # 如 (0,0,5)、(0,5,0) → 全体惩罚
-                                for p in players.values():
-                                    if len(p['votes']) >= current_round:
-                                        p['balance'] = max(0, p['balance'] - PENALTY)
-                            else:
-                                # 金、银都有票
-                                if gold < silver:
-                                    winner = 'gold'
-                                elif silver < gold:
-                                    winner = 'silver'
-                                else:
-                                    winner = None  # 平局
-                                
-                                if winner:
-                                    for p in players.values():
-                                        if len(p['votes']) >= current_round:
-                                            vote = p['votes'][current_round - 1]
-                                            if vote == winner:
-                                                p['balance'] += REWARD
-                                            else:
-                                                p['balance'] = max(0, p['balance'] - PENALTY)
-                                else:
-                                    for p in players.values():
-                                        if len(p['votes']) >= current_round:
-                                            p['balance'] = max(0, p['balance'] - PENALTY)
-                        else:
-                            # 情况B: red > 0 但红失败 → 非红单色也可胜
-                            if gold == 0 and silver == 0:
-                                # 理论上不会发生（因 red > 0 且 total > 0）
-                                for p in players.values():
-                                    if len(p['votes']) >= current_round:
-                                        p['balance'] = max(0, p['balance'] - PENALTY)
-                            elif gold == 0:
-                                # 只有银有票 → 银胜
-                                winner = 'silver'
-                                for p in players.values():
-                                    if len(p['votes']) >= current_round:
-                                        vote = p['votes'][current_round - 1]
-                                        if vote == winner:
-                                            p['balance'] += REWARD
-                                        else:
-                                            p['balance'] = max(0, p['balance'] - PENALTY)
-                            elif silver == 0:
-                                # 只有金有票 → 金胜
-                                winner = 'gold'
-                                for p in players.values():
-                                    if len(p['votes']) >= current_round:
-                                        vote = p['votes'][current_round - 1]
-                                        if vote == winner:
-                                            p['balance'] += REWARD
-                                        else:
-                                            p['balance'] = max(0, p['balance'] - PENALTY)
-                            else:
-                                # 金、银都有票 → 比多少
-                                if gold < silver:
-                                    winner = 'gold'
-                                elif silver < gold:
-                                    winner = 'silver'
-                                else:
-                                    winner = None
-                                
-                                if winner:
-                                    for p in players.values():
-                                        if len(p['votes']) >= current_round:
-                                            vote = p['votes'][current_round - 1]
-                                            if vote == winner:
-                                                p['balance'] += REWARD
-                                            else:
-                                                p['balance'] = max(0, p['balance'] - PENALTY)
-                                else:
-                                    for p in players.values():
-                                        if len(p['votes']) >= current_round:
-                                            p['balance'] = max(0, p['balance'] - PENALTY)
-
-                else:
-                   # ===== 非第8轮：红若严格小于所有【有票】的非红颜色，则红胜；否则非红全体胜 =====
-                    active_non_red = []
-                    if gold > 0:
-                        active_non_red.append(gold)
-                    if silver > 0:
-                        active_non_red.append(silver)
-                    
-                    # 判断红是否严格小于每一个活跃非红颜色
-                    if active_non_red and all(red < x for x in active_non_red):
-                        # 红胜
-                        for p in voted_players:
-                            vote = p['votes'][current_round - 1]
-                            if vote == 'red':
-                                p['balance'] += REWARD
-                            else:
-                                p['balance'] = max(0, p['balance'] - PENALTY)
-                    else:
-                        # 非红全体胜（包括：无非红活跃、或红不严格最少）
-                        for p in voted_players:
-                            if p['votes'][current_round - 1] == 'red':
-                                p['balance'] = max(0, p['balance'] - PENALTY)
-                            else:
-                                p['balance'] += REWARD
-
-    # ===== 游戏结束判断 =====
-    if current_round >= MAX_ROUNDS:
-        game_state['game_ended'] = True
-        game_state['round_status'] = 'ended'
+        resp = make_response(message)
+    resp.status_code = status
+    resp.headers['Retry-After'] = retry_after(wait)
+    resp.cache_control.no_store = True
+    return resp
+
+@bp.before_app_request
+def admit_request():
+    route = route_name()
+    if route.startswith('/admin'):
+        return None
+    budget = ROUTE_BUDGETS.get(route)
+    limiter = current_app.extensions['eden_limiter']
+    if budget and limiter is not None:
+        room_id = (request.view_args or {}).get('room_id', DEFAULT_ROOM)
+        player = request.cookies.get(cookie_name(room_id))
+        wait = limiter.check(budget, f'{room_id}:{player}' if player else None, request.remote_addr)
+        if wait:
+            return reject(route, 429, 'rate_limit', '⏳ 操作太频繁，请稍后再试', wait)
+    if route in ADMISSION_EXEMPT:
+        return None  # 长轮询等仍按上面的额度限流，只是不占并发名额
+    if not current_app.extensions['eden_admission'].enter():
+        return reject(route, 503, 'overload', '⏳ 服务器繁忙，请稍后再试', 1)
+    g.admitted = True
+    return None
+
+@bp.teardown_app_request
+def release_request(exc):
+    if g.pop('admitted', False):
+        current_app.extensions['eden_admission'].leave()
+
+
+# ===== 请求耗时（按路由）=====
+
+@bp.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def record_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route=route_name(), method=request.method)
+    return response
+
+
+# ===== 按需剖析（/admin/profile 打开窗口时才生效）=====
+@bp.before_app_request
+def start_profile():
+    if profiling.PROFILER.until and request.endpoint != 'eden.admin_profile' and profiling.PROFILER.wants(route_name()):
+        g.profile = profiling.PROFILER.begin(route_name())
+
+@bp.after_app_request
+def stop_profile(response):
+    profiling.PROFILER.end(g.pop('profile', None))
+    return response
+
+@bp.teardown_app_request
+def discard_profile(exc):
+    profiling.PROFILER.end(g.pop('profile', None))  # 出错没走到 after_request 时
+
+
+# ===== 响应压缩（gzip / br）=====
+# after_app_request 按注册的相反顺序执行：先压缩，再记录耗时（耗时包含压缩）
+@bp.after_app_request
+def compress_response(response):
+    return current_app.extensions['eden_compressor'](response, request)
+
+
+class RoomNotFound(Exception):
+    pass
+
+@bp.app_errorhandler(RoomNotFound)
+def room_not_found(e):
+    return "❌ 房间不存在", 404
+
+@bp.app_errorhandler(CommandTimeout)
+def command_timeout(e):
+    # 写线程太忙：没开始执行的命令已取消，可以重试；已经开始的结果未知，先刷新确认再操作
+    if e.started:
+        message = '⚠️ 操作超时，结果未知，请刷新后确认'
+    else:
+        message = '⏳ 服务器繁忙，操作未执行，请重试'
+    resp = jsonify({'success': False, 'message': message})
+    resp.status_code = 503
+    if not e.started:
+        resp.headers['Retry-After'] = '1'
+    return resp
+
+@bp.app_errorhandler(StorageError)
+def storage_failed(e):
+    # 这次修改没能落盘，不能回复成功；房间随后从磁盘重新加载撤销它（Room.recover），可以直接重试
+    return jsonify({'success': False, 'message': '⚠️ 保存失败，请重试'}), 503
+
+def get_room(room_id, create=False):
+    room = get_registry().get(room_id, create=create)
+    if room is None:
+        raise RoomNotFound(room_id)
+    return room
+
+def room_route(rule, **options):
+    # 同一视图注册两次：原路径对应默认房间，/room/<room_id>/... 对应其他房间
+    def decorator(f):
+        bp.add_url_rule(rule, view_func=f, defaults={'room_id': DEFAULT_ROOM}, **options)
+        bp.add_url_rule('/room/<room_id>' + rule, view_func=f, **options)
+        return f
+    return decorator
+
+# ===== 按状态版本缓存的轮询响应 =====
+def conditional(room, key, render, extra=None, mimetype='application/json'):
+    # ETag = 房间加载标识 + 状态版本（+ extra()：剩余秒数等随时间变化的部分，渲染时传给 render）。
+    # 客户端带着相同的 ETag 来时直接 304；否则同一 ETag 只渲染一次，之后直接返回缓存的内容。
+    # 先取版本再读状态：修改在版本号加一之前完成，缓存的内容不会比它的版本旧
+    version = room.version
+    value = extra() if extra else None
+    tag = room.state_tag(version, value)
+    if request.if_none_match.contains_weak(tag):  # 压缩后的响应带的是弱 ETag
+        resp = Response(status=304)
     else:
-        game_state['current_round'] += 1
-        game_state['round_status'] = 'waiting'
-        game_state['voting_start_time'] = None
+        resp = Response(room.cached(key, tag, lambda: render(value)), mimetype=mimetype)
+    resp.set_etag(tag)
+    resp.cache_control.no_cache = True  # 浏览器每次都带 If-None-Match 回来确认
+    return resp
 
-    # 保存快照
-    save_snapshot(current_round)
+def conditional_json(room, key, build, extra=None):
+    return conditional(room, key, lambda value: current_app.json.dumps(build(value)), extra)
 
 # ===== 核心修复：扫码加入（支持老玩家随时返回）=====
-@app.route('/join')
-def join():
-    with join_lock:
-        existing_id = request.cookies.get('eden_player_id')
-        if existing_id and existing_id.isdigit():
-            pid = int(existing_id)
-            if pid in players:
-                if not game_state['game_ended']:
-                    return f'<script>window.location.href="/mobile?playerId={pid}";</script>'
-                else:
-                    return "🏁 游戏已结束！", 403
+@room_route('/join')
+def join(room_id):
+    room = get_room(room_id)
+    existing_id = request.cookies.get(room.cookie_name)
+    if existing_id and existing_id.isdigit():
+        pid = int(existing_id)
+        if pid in room.players:
+            if not room.game_state['game_ended']:
+                return f'<script>window.location.href="{room.url_prefix}/mobile?playerId={pid}";</script>'
+            else:
+                return "🏁 游戏已结束！", 403
 
-        if game_state['game_ended']:
-            return "❌ 游戏已结束", 403
-        if not (game_state['current_round'] == 1 and game_state['round_status'] == 'waiting'):
-            return "❌ 游戏已开始，无法加入新玩家", 403
-        if len(players) >= MAX_PLAYERS:
-            return "❌ 玩家人数已达上限", 403
-
-        used_ids = set(players.keys())
-        available_ids = [i for i in range(1, MAX_PLAYERS + 1) if i not in used_ids]
-        if not available_ids:
-            return "❌ 无可用ID", 500
-
-        pid = secrets.choice(available_ids)
-        players[pid] = {
-            'id': pid,
-            'balance': START_BALANCE,
-            'votes': []
-        }
-        save_data()
+    pid, error, status = room.call(room.join)
+    if error:
+        return error, status
 
-        resp = make_response(f'<script>window.location.href="/mobile?playerId={pid}";</script>')
-        resp.set_cookie('eden_player_id', str(pid), max_age=86400)
-        return resp
+    resp = make_response(f'<script>window.location.href="{room.url_prefix}/mobile?playerId={pid}";</script>')
+    resp.set_cookie(room.cookie_name, str(pid), max_age=86400)
+    return resp
 
 # ===== 其他路由（完全保留）=====
-@app.route('/')
+@bp.route('/')
 def index():
     return "伊甸园游戏系统"
 
-@app.route('/mobile')
-def mobile():
-    player_id = request.args.get('playerId', type=int)
-    if player_id is None or player_id <= 0:
+@room_route('/mobile')
+def mobile(room_id):
+    room = get_room(room_id)
+    player_id = valid_player_id(request.args.get('playerId', type=int))
+    if player_id is None:
         return "❌ 请提供有效的 playerId，例如：/mobile?playerId=1", 400
 
-    if player_id not in players and not (game_state['current_round'] == 1 and game_state['round_status'] == 'waiting'):
-        return "❌ 游戏已开始，无法加入新玩家", 403
+    if player_id not in room.players:
+        error, status = room.call(room.register, player_id)
+        if error:
+            return error, status
 
-    if player_id not in players:
-        if len(players) >= MAX_PLAYERS:
-            return "❌ 玩家人数已达上限", 403
-        players[player_id] = {
-            'id': player_id,
-            'balance': START_BALANCE,
-            'votes': []
-        }
-        save_data()
-
-    player = players[player_id]
-    current_round = game_state['current_round']
-    voted = len(player['votes']) >= current_round
+    # 与 /api/player/<id>/state 相同的状态；页面打开后的变化由长轮询推过来，不用再刷新整页
+    state = room.player_state(player_id)
     return render_template('mobile.html',
+                           base=room.url_prefix,
                            playerId=player_id,
-                           balance=player['balance'],
-                           voted=voted,
-                           current_round=current_round,
-                           game_ended=game_state['game_ended'],
-                           round_status=game_state['round_status'])
-
-@app.route('/display')
-def display():
-    top20 = sorted(players.values(), key=lambda x: x['balance'], reverse=True)[:20]
-    round_results = None
-    
-     # ✅ 如果因全体胜利结束，直接显示
-    if game_state.get('won_by_all', False):
-        # 收集最后一轮的投票数据（用于显示苹果数量）
+                           state=state)
+
+@room_route('/display')
+def display(room_id):
+    room = get_room(room_id, create=True)
+    game_state = room.game_state
+
+    def render(countdown):
+        # ===== 新增：服务端倒计时（用于 display.html 直接渲染）=====
+        in_voting = (game_state['round_status'] == 'voting')
+        round_results = None
         current_round = game_state['current_round']
-        votes = {'red': 0, 'gold': 0, 'silver': 0}
-        for p in players.values():
-            if len(p['votes']) >= current_round:
-                apple = p['votes'][current_round - 1]
-                if apple in votes:
-                    votes[apple] += 1
-        
-        round_results = {
-            'votes': votes,
-            'message': "🎉 全体胜利！"
-        }
-    elif game_state['current_round'] > 1 and (game_state['round_status'] == 'waiting' or game_state['game_ended']):
-        prev_round = game_state['current_round'] - 1
-        votes = {'red': 0, 'gold': 0, 'silver': 0}
-        for p in players.values():
-            if len(p['votes']) >= prev_round:
-                apple = p['votes'][prev_round - 1]
-                if apple in votes:
-                    votes[apple] += 1
-        
-        red, gold, silver = votes['red'], votes['gold'], votes['silver']
-        total = red + gold + silver
-        
-        # 获取上一轮是否是第8轮（用于判断规则）
-        is_final_round = (prev_round == MAX_ROUNDS)
-
-        if total == 0:
-            msg = "无人投票"
-        elif total == 1:
-            if red == 1:
-                msg = "唯一玩家投红：全体胜利！"
-            else:
-                msg = f"唯一玩家投金/银：全员-{PENALTY}"
-        elif red == 0:
-            # 无人投红
-            non_red_count = (1 if gold > 0 else 0) + (1 if silver > 0 else 0)
-            if non_red_count < 2:
-                # 只有一种非红（只有金 或 只有银）
-                msg = f"仅一种非红苹果：全员-{PENALTY}"
-            else:
-                # 金和银都有
-                if gold < silver:
-                    msg = f"金少胜出：金+{REWARD}，银-{PENALTY}"
-                elif silver < gold:
-                    msg = f"银少胜出：银+{REWARD}，金-{PENALTY}"
-                else:
-                    msg = f"金银票数相等：全员-{PENALTY}"
+        # ✅ 如果因全体胜利或打满8轮结束，显示最后一轮；否则等待中显示上一轮
+        if game_state['game_ended']:
+            round_results = room.round_result(current_round)
+        elif current_round > 1 and game_state['round_status'] == 'waiting':
+            round_results = room.round_result(current_round - 1)
+        return render_template('display.html',
+                               base=room.url_prefix,
+                               current_round=current_round,
+                               round_status=game_state['round_status'],
+                               game_ended=game_state['game_ended'],
+                               won_by_all=game_state.get('won_by_all', False),
+                               top15=room.leaderboard.top(20),
+                               round_results=round_results,
+                               countdown=countdown,
+                               in_voting=in_voting)
+    return conditional(room, 'display', render, extra=room.remaining_seconds, mimetype='text/html')
+
+@room_route('/admin')
+def admin(room_id):
+    room = get_room(room_id, create=True)
+    game_state = room.game_state
+
+    def render(remaining_time):
+        not_voted_count = 0
+        if game_state['round_status'] == 'voting':
+            not_voted_count = room.tally.not_voted
+        return render_template('admin.html',
+                               base=room.url_prefix,
+                               room_id=room.room_id,
+                               current_round=game_state['current_round'],
+                               round_status=game_state['round_status'],
+                               game_ended=game_state['game_ended'],
+                               total_players=len(room.players),
+                               max_players=room.config.max_players,
+                               not_voted_count=not_voted_count,
+                               remaining_time=remaining_time,
+                               top15=room.leaderboard.top(15))
+    return conditional(room, 'admin', render, extra=room.remaining_seconds, mimetype='text/html')
+
+@bp.route('/admin/metrics_panel')
+def admin_metrics_panel():
+    # 运行指标随每个请求变化，不进 /admin 的缓存，由页面单独加载
+    return render_template('metrics_panel.html', metrics=metrics.summary())
+
+@bp.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    # POST ?seconds=60&fraction=0.1&routes=/display,/api/timer&interval_ms=5 打开剖析窗口，?stop=1 提前关闭；
+    # GET 查看状态，?format=collapsed 下载折叠调用栈，?format=pstats 下载 pstats 文件
+    if request.method == 'POST':
+        if request.args.get('stop') in ('1', 'true'):
+            profiling.PROFILER.stop()
         else:
-            # 有人投红
-            if not is_final_round:
-                # 非第8轮：红若严格小于所有活跃非红 → 红胜；否则非红全体胜
-                active_non_red = []
-                if gold > 0: active_non_red.append(gold)
-                if silver > 0: active_non_red.append(silver)
-                
-                if active_non_red and all(red < x for x in active_non_red):
-                    msg = f"红苹果最少：红+{REWARD}，非红-{PENALTY}"
-                else:
-                    msg = f"红未最少：非红全体+{REWARD}，红-{PENALTY}"
-            else:
-                # 第8轮：需精确判断
-                active_non_red = []
-                if gold > 0: active_non_red.append(('gold', gold))
-                if silver > 0: active_non_red.append(('silver', silver))
-                
-                # 判断红能否胜
-                red_can_win = False
-                if active_non_red and all(red < count for _, count in active_non_red):
-                    red_can_win = True
-
-                if red_can_win:
-                    msg = f"第8轮红胜：红+{REWARD}，非红-{PENALTY}"
-                else:
-                    # 红失败，处理非红
-                    if len(active_non_red) == 0:
-                        # 不可能（因 red > 0 且 total > 0）
-                        msg = f"异常：仅有红苹果？全员-{PENALTY}"
-                    elif len(active_non_red) == 1:
-                        # 只有一种非红 → 该颜色胜
-                        winner_color, _ = active_non_red[0]
-                        color_name = "金" if winner_color == 'gold' else "银"
-                        msg = f"第8轮{color_name}胜：{color_name}+{REWARD}，其他-{PENALTY}"
-                    else:
-                        # 两种非红都存在
-                        gold_count = gold
-                        silver_count = silver
-                        if gold_count < silver_count:
-                            msg = f"第8轮金胜：金+{REWARD}，银/红-{PENALTY}"
-                        elif silver_count < gold_count:
-                            msg = f"第8轮银胜：银+{REWARD}，金/红-{PENALTY}"
-                        else:
-                            msg = f"第8轮金银平局：全员-{PENALTY}"
-        
-        round_results = {
-            'votes': votes,
-            'message': msg
-        }
+            routes = [r for r in request.args.get('routes', '').split(',') if r]
+            profiling.PROFILER.start(seconds=request.args.get('seconds', profiling.DEFAULT_SECONDS, type=int),
+                           fraction=request.args.get('fraction', profiling.DEFAULT_FRACTION, type=float),
+                           routes=routes or None,
+                           interval=request.args.get('interval_ms', profiling.DEFAULT_INTERVAL * 1000, type=float) / 1000)
+        return jsonify(profiling.PROFILER.status())
+    fmt = request.args.get('format')
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    if fmt == 'collapsed':
+        return Response(profiling.PROFILER.collapsed(), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename="eden-{stamp}.collapsed.txt"'})
+    if fmt == 'pstats':
+        data = profiling.PROFILER.pstats_bytes()
+        if data is None:
+            return jsonify({'success': False, 'message': '还没有剖析数据'}), 404
+        return Response(data, mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename="eden-{stamp}.pstats"'})
+    return jsonify(profiling.PROFILER.status())
+
+@room_route('/admin/status_json')
+def admin_status_json(room_id):
+    room = get_room(room_id)
+    game_state = room.game_state
 
-    # ===== 新增：服务端倒计时（用于 display.html 直接渲染）=====
-    countdown = None
-    in_voting = (game_state['round_status'] == 'voting')
-    if in_voting and game_state.get('voting_start_time') is not None:
-        remaining = int(game_state['voting_start_time'] + VOTING_DURATION - time.time())
-        countdown = max(0, remaining) 
-
-    return render_template('display.html',
-                           current_round=game_state['current_round'],
-                           round_status=game_state['round_status'],
-                           game_ended=game_state['game_ended'],
-                           won_by_all=game_state.get('won_by_all', False), 
-                           top15=top20,
-                           round_results=round_results,
-                           countdown=countdown,      
-                           in_voting=in_voting)      
-
-@app.route('/admin')
-def admin():
-    total_players = len(players)
-    not_voted_count = 0
-    if game_state['round_status'] == 'voting':
-        current_round = game_state['current_round']
-        not_voted_count = sum(1 for p in players.values() if len(p['votes']) < current_round)
-    top15 = sorted(players.values(), key=lambda x: x['balance'], reverse=True)[:15]
-    remaining_time = None
-    if game_state['round_status'] == 'voting' and game_state['voting_start_time']:
-        elapsed = time.time() - game_state['voting_start_time']
-        remaining_time = max(0, VOTING_DURATION - int(elapsed))
-    return render_template('admin.html',
-                           current_round=game_state['current_round'],
-                           round_status=game_state['round_status'],
-                           game_ended=game_state['game_ended'],
-                           total_players=len(players),
-                           max_players=MAX_PLAYERS,
-                           not_voted_count=not_voted_count,
-                           remaining_time=remaining_time,
-                           top15=top15)
-
-@app.route('/admin/status_json')
-def admin_status_json():
-    remaining_time = None
-    if game_state['round_status'] == 'voting' and game_state['voting_start_time']:
-        elapsed = time.time() - game_state['voting_start_time']
-        remaining_time = max(0, VOTING_DURATION - int(elapsed))
-    
-    current_round = game_state['current_round']
-    
     # ✅ 关键修复：只统计 balance > 0 的玩家
-    eligible_players = [p for p in players.values() if p['balance'] > 0]
-    total_players = len(eligible_players)
-    not_voted_count = sum(1 for p in eligible_players if len(p['votes']) < current_round)
-
-    return jsonify({
+    return conditional_json(room, 'status_json', lambda remaining_time: {
         'current_round': game_state['current_round'],
         'round_status': game_state['round_status'],
         'game_ended': game_state['game_ended'],
-        'total_players': total_players,
-        'not_voted_count': not_voted_count,
+        'total_players': room.tally.eligible,
+        'not_voted_count': room.tally.eligible - room.tally.voted_eligible,
         'remaining_time': remaining_time
-    })
-
-@app.route('/admin/start_round', methods=['POST'])
-def start_round():
-    if game_state['game_ended']:
-        return jsonify({'success': False, 'message': '游戏已结束'})
-    if game_state['round_status'] != 'waiting':
-        return jsonify({'success': False, 'message': '当前不在等待状态'})
-    
-    # ✅ 记录本轮开始时的有效玩家数（balance > 0）
-    current_eligible_count = len([p for p in players.values() if p['balance'] > 0])
-    game_state['current_round_eligible'] = current_eligible_count
-
-    game_state['round_status'] = 'voting'
-    game_state['voting_start_time'] = time.time()
-    save_data()
-    return jsonify({'success': True})
-
-@app.route('/admin/end_round', methods=['POST'])
-def end_round():
-    if game_state['round_status'] != 'voting':
-        return jsonify({'success': False, 'message': '当前不在投票中'})
-    end_round_logic()
-    save_data()
-    return jsonify({'success': True})
-
-@app.route('/admin/reset_current_round', methods=['POST'])
-def reset_current_round():
-    if game_state['game_ended']:
-        return jsonify({'success': False, 'message': '游戏已结束，无法重置本轮'})
-    current_round = game_state['current_round']
-    for p in players.values():
-        if len(p['votes']) >= current_round:
-            p['votes'] = p['votes'][:current_round - 1]
-    game_state['round_status'] = 'waiting'
-    game_state['voting_start_time'] = None
-    save_data()
-    return jsonify({'success': True, 'message': f'第 {current_round} 轮已重置'})
-
-@app.route('/admin/rollback_to_previous', methods=['POST'])
-def rollback_to_previous():
-    current_round = game_state['current_round']
-    if current_round <= 1:
-        return jsonify({'success': False, 'message': '已是第1轮，无法回退'})
-    prev_round = current_round - 1
-    if str(prev_round) not in snapshots:
-        return jsonify({'success': False, 'message': f'未找到第 {prev_round} 轮的快照'})
-    snap = snapshots[str(prev_round)]
-    players.clear()
-    players.update(snap['players'])
-    game_state.update(snap['game_state'])
-    save_data()
-    return jsonify({'success': True, 'message': f'已回退到第 {prev_round} 轮结束时的状态'})
-
-@app.route('/admin/reset_all', methods=['POST'])
-def reset_all():
-    global players, game_state, snapshots
-    players.clear()
-    game_state = {
-        'current_round': 1,
-        'round_status': 'waiting',
-        'game_ended': False,
-        'voting_start_time': None,
-        'won_by_all': False
-    }
-    snapshots.clear()
-    if os.path.exists(DATA_FILE):
-        os.remove(DATA_FILE)
-    if os.path.exists(SNAPSHOT_FILE):
-        os.remove(SNAPSHOT_FILE)
-    return jsonify({'success': True, 'message': '所有数据已重置！'})
-
-@app.route('/api/vote', methods=['POST'])
-def vote():
+    }, extra=room.remaining_seconds)
+
+@room_route('/admin/start_round', methods=['POST'])
+def start_round(room_id):
+    room = get_room(room_id)
+    return jsonify(room.call(room.start_round))
+
+@room_route('/admin/end_round', methods=['POST'])
+def end_round(room_id):
+    room = get_room(room_id)
+    return jsonify(room.call(room.end_round))
+
+@room_route('/admin/reset_current_round', methods=['POST'])
+def reset_current_round(room_id):
+    room = get_room(room_id)
+    return jsonify(room.call(room.reset_current_round))
+
+@room_route('/admin/rollback_to_previous', methods=['POST'])
+def rollback_to_previous(room_id):
+    room = get_room(room_id)
+    return jsonify(room.call(room.rollback_to_previous))
+
+@room_route('/admin/reset_all', methods=['POST'])
+def reset_all(room_id):
+    room = get_room(room_id)
+    return jsonify(room.call(room.reset_all))
+
+def archive_filters():
+    # /admin/archive 和 /admin/export?game=all 共用的筛选参数，只查索引
+    def flag(name):
+        value = request.args.get(name)
+        return None if value in (None, '') else value in ('1', 'true')
+    return {'since': request.args.get('since') or None, 'until': request.args.get('until') or None,
+            'won_by_all': flag('won_by_all'),
+            'min_players': request.args.get('min_players', type=int),
+            'limit': request.args.get('limit', type=int)}
+
+@room_route('/admin/archive')
+def admin_archive(room_id):
+    # 已归档对局列表：?since=&until=（YYYY-MM-DD）&won_by_all=1&min_players=&limit=
+    room = get_room(room_id)
+    return jsonify({'games': room.archive.list(**archive_filters())})
+
+@room_route('/admin/archive/<game_id>')
+def admin_archive_game(room_id, game_id):
+    room = get_room(room_id)
+    record = room.archive.load(game_id)  # 只解压这一局
+    if record is None:
+        return jsonify({'success': False, 'message': '没有这一局'}), 404
+    return jsonify({'game': room.archive.get(game_id), 'game_state': record['game_state']})
+
+@room_route('/admin/export')
+def admin_export(room_id):
+    # 逐行导出每轮的投票和余额：?format=ndjson|csv，?gzip=1 压缩；
+    # ?game=<game_id> 导出某一局（当前或已归档），?game=all 导出符合筛选条件的已归档对局 + 当前这一局。
+    # 流式生成、一局一局地读，内存占用与局数 / 轮数无关
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({'success': False, 'message': 'format 只支持 ndjson / csv'}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+    room = get_room(room_id)
+    game = request.args.get('game')
+    if game == 'all':
+        entries = list(reversed(room.archive.list(**archive_filters())))  # 按时间先后
+        sources = itertools.chain(room.archive.export_sources(entries), [room.call(room.export_source)])
+        name = 'all'
+    elif game and game != room.game_state.get('game_id'):
+        if room.archive.get(game) is None:
+            return jsonify({'success': False, 'message': '没有这一局'}), 404
+        sources = room.archive.export_sources([{'game_id': game}])
+        name = game
+    else:
+        source = room.call(room.export_source)
+        sources, name = [source], source.game_id
+    filename = f"eden-{room_id}-{name}.{fmt}" + ('.gz' if compress else '')
+    return Response(export.stream(sources, fmt, compress),
+                    mimetype='application/gzip' if compress else export.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store'})
+
+class BadVoteKey(Exception):
+    pass
+
+@bp.app_errorhandler(BadVoteKey)
+def bad_vote_key(e):
+    return jsonify({'success': False, 'message': '无效的 idempotencyKey'}), 400
+
+def vote_key(value):
+    # 客户端为每次投票生成的幂等键：网络重试时带同一个键，服务端直接返回成功、不再写盘
+    if value is None or value == '':
+        return None
+    if not isinstance(value, (str, int)) or isinstance(value, bool) or len(str(value)) > 128:
+        raise BadVoteKey(value)
+    return str(value)
+
+def valid_player_id(value):
+    # 玩家 ID 必须是 1..MAX_PLAYER_ID 的整数；否则返回 None（投票时按“玩家不存在”处理）
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 < value <= MAX_PLAYER_ID:
+        return None
+    return value
+
+@room_route('/api/vote', methods=['POST'])
+def vote(room_id):
+    room = get_room(room_id)
     data = request.get_json()
-    player_id = data.get('playerId')
-    apple = data.get('apple')
-    if player_id not in players:
-        return jsonify({'success': False, 'message': '玩家不存在'})
-    if apple not in ['red', 'gold', 'silver']:
-        return jsonify({'success': False, 'message': '无效选择'})
-    if game_state['round_status'] != 'voting':
-        return jsonify({'success': False, 'message': '不在投票阶段'})
-    if game_state['game_ended']:
-        return jsonify({'success': False, 'message': '游戏已结束'})
-    player = players[player_id]
-    current_round = game_state['current_round']
-
-    # ✅ 新增：余额 <= 0 不能投票
-    if player['balance'] <= 0:
-        return jsonify({'success': False, 'message': '你的余额已耗尽，无法继续投票'})
-
-    if len(player['votes']) >= current_round:
-        return jsonify({'success': False, 'message': '你已投票'})
-    player['votes'].append(apple)
-    save_data()
-
-      # === 修复：仅当所有【余额 > 0】的玩家都已投票时，才提前结算 ===
-    current_round = game_state['current_round']
-    eligible_players = [p for p in players.values() if p['balance'] > 0]
-    voted_eligible = [p for p in eligible_players if len(p['votes']) >= current_round]
-
-    if len(eligible_players) > 0 and len(voted_eligible) == len(eligible_players):
-        print(f">>> 所有 {len(eligible_players)} 名可投票玩家已提交，提前结算！")
-        try:
-            end_round_logic()
-            save_data()
-        except Exception as e:
-            print("💥 提前结算失败：", repr(e))
-            import traceback
-            traceback.print_exc()
-
-    return jsonify({'success': True})
+    key = vote_key(data.get('idempotencyKey') or request.headers.get('Idempotency-Key'))
+    return jsonify(room.call(room.vote, valid_player_id(data.get('playerId')), data.get('apple'), key))
+
+@room_route('/api/votes/batch', methods=['POST'])
+def vote_batch(room_id):
+    # 代投终端：{"votes": [{"playerId": 1, "apple": "red", "idempotencyKey": "..."}, ...]}
+    # 整批在一条命令里校验并生效、只写一条日志；每条单独返回结果
+    room = get_room(room_id)
+    data = request.get_json(silent=True)
+    items = data.get('votes') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': '请提供 votes 列表'}), 400
+    if len(items) > MAX_BATCH_VOTES:
+        return jsonify({'success': False, 'message': f'一次最多提交 {MAX_BATCH_VOTES} 票'}), 413
+    entries = []
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({'success': False, 'message': 'votes 中每一项都必须是对象'}), 400
+        player_id = valid_player_id(item.get('playerId'))
+        entries.append((player_id, item.get('apple'), vote_key(item.get('idempotencyKey'))))
+    results = room.call(room.vote_batch, entries)
+    return jsonify({
+        'success': True,
+        'accepted': sum(1 for r in results if r['success']),
+        'results': results
+    })
 
 # ✅ 修复版 /api/timer（类型安全）
-@app.route('/api/timer')
-def get_timer():
-    if game_state['round_status'] != 'voting':
-        return jsonify({'inVoting': False})
-    
+@room_route('/api/timer')
+def get_timer(room_id):
+    room = get_room(room_id)
+    game_state = room.game_state
     start_time = game_state.get('voting_start_time')
-    if start_time is None:
-        return jsonify({'inVoting': False})
-    
     # ✅ 确保是数字类型
-    if not isinstance(start_time, (int, float)):
-        start_time = time.time()
-        game_state['voting_start_time'] = start_time
-        save_data()
-    
-    elapsed = time.time() - start_time
-    remaining = max(0, VOTING_DURATION - int(elapsed))
-    return jsonify({
-        'inVoting': True,
-        'remaining': remaining
-    })
-
-
-@app.route('/api/vote-status')
-def vote_status():
-    if game_state['round_status'] != 'voting':
-        return jsonify({
-            'in_voting': False,
-            'total_players': 0,
-            'voted_players': 0
-        })
-
-    current_round = game_state['current_round']
-    # ✅ 仅统计 balance > 0 的玩家
-    eligible_players = [p for p in players.values() if p['balance'] > 0]
-    voted_eligible = sum(1 for p in eligible_players if len(p['votes']) >= current_round)
-
-    return jsonify({
-        'in_voting': True,
-        'total_players': len(eligible_players),
-        'voted_players': voted_eligible
-    })
-
-@app.route('/api/player-status/<int:player_id>')
-def player_status(player_id):
-    if player_id not in players:
+    if (game_state['round_status'] == 'voting' and start_time is not None
+            and not isinstance(start_time, (int, float))):
+        room.call(room.fix_voting_start_time)
+
+    def build(remaining):
+        if remaining is None:
+            return {'inVoting': False}
+        return {
+            'inVoting': True,
+            'remaining': remaining
+        }
+    return conditional_json(room, 'timer', build, extra=room.remaining_seconds)
+
+
+@room_route('/api/vote-status')
+def vote_status(room_id):
+    room = get_room(room_id)
+
+    def build(_):
+        if room.game_state['round_status'] != 'voting':
+            return {
+                'in_voting': False,
+                'total_players': 0,
+                'voted_players': 0
+            }
+        # ✅ 仅统计 balance > 0 的玩家
+        return {
+            'in_voting': True,
+            'total_players': room.tally.eligible,
+            'voted_players': room.tally.voted_eligible
+        }
+    return conditional_json(room, 'vote-status', build)
+
+@room_route('/api/stream')
+def stream(room_id):
+    # SSE：大屏和管理页订阅状态变化，取代定时轮询
+    room = get_room(room_id)
+    sub = room.broadcaster.subscribe()
+    return Response(room.broadcaster.stream(sub), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@room_route('/api/player-status/<int:player_id>')
+def player_status(room_id, player_id):
+    room = get_room(room_id)
+    if player_id not in room.players:
         return jsonify({'error': 'Player not found'}), 404
-    return jsonify({
-        'current_round': game_state['current_round'],
-        'game_ended': game_state['game_ended']
+    return conditional_json(room, ('player-status', player_id), lambda _: {
+        'current_round': room.game_state['current_round'],
+        'game_ended': room.game_state['game_ended']
     })
 
-@app.route('/mobile/check_status')
-def mobile_check_status():
+@room_route('/api/player/<int:player_id>/state')
+def player_state(room_id, player_id):
+    # 手机的全部状态：轮次、投票状态、余额、剩余时间、上一轮结果、排名。
+    # 带 since_version（上次拿到的 version）时挂起，直到轮次 / 状态变化或超时（?timeout=，秒）再返回
+    room = get_room(room_id)
+    if player_id not in room.players:
+        return jsonify({'success': False, 'message': '玩家不存在'}), 404
+    since = request.args.get('since_version')
+    if since is not None and since == room.phase_tag():
+        timeout = min(max(request.args.get('timeout', LONGPOLL_TIMEOUT, type=float), 0), LONGPOLL_MAX_TIMEOUT)
+        metrics.OPEN_POLLERS.inc(kind='longpoll')
+        try:
+            room.wait_for_change(since, timeout)
+        finally:
+            metrics.OPEN_POLLERS.dec(kind='longpoll')
+    resp = jsonify(room.player_state(player_id))
+    resp.cache_control.no_store = True
+    return resp
+
+@room_route('/mobile/check_status')
+def mobile_check_status(room_id):
+    room = get_room(room_id)
     player_id = request.args.get('playerId', type=int)
-    if player_id not in players:
+    if player_id not in room.players:
         return jsonify({'success': False, 'message': '玩家不存在'}), 404
-    return jsonify({
+    return conditional_json(room, ('check_status', player_id), lambda _: {
         'success': True,
-        'current_round': game_state['current_round'],
-        'game_ended': game_state['game_ended']
+        'current_round': room.game_state['current_round'],
+        'game_ended': room.game_state['game_ended']
     })
 
-@app.route('/rules')
+# ===== 扫码加入的二维码 =====
+def join_url(room):
+    base = current_app.config['PUBLIC_URL'] or request.host_url
+    return base.rstrip('/') + room.url_prefix + '/join'
+
+@lru_cache(maxsize=64)
+def render_qrcode(url, size, fmt):
+    # 同一地址 + 尺寸只编码一次；返回 (内容, MIME 类型, ETag)
+    modules = qr.encode(url)
+    if fmt == 'svg':
+        body, mimetype = qr.to_svg(modules).encode('utf-8'), 'image/svg+xml'
+    else:
+        scale = max(1, size // (len(modules) + 8))
+        body, mimetype = qr.to_png(modules, scale=scale), 'image/png'
+    return body, mimetype, hashlib.sha1(body).hexdigest()[:20]
+
+@room_route('/qrcode')
+def qrcode_page(room_id):
+    room = get_room(room_id)
+    return render_template('qrcode.html', base=room.url_prefix, join_url=join_url(room))
+
+@room_route('/qrcode_img')
+def qrcode_img(room_id):
+    room = get_room(room_id)
+    fmt = request.args.get('format', 'png')
+    if fmt not in ('png', 'svg'):
+        return "❌ format 只能是 png 或 svg", 400
+    size = min(max(request.args.get('size', QRCODE_SIZE, type=int), 64), 2048)
+    body, mimetype, etag = render_qrcode(join_url(room), size if fmt == 'png' else 0, fmt)
+    resp = Response(body, mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = QRCODE_MAX_AGE
+    return resp.make_conditional(request)
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    # Prometheus 文本格式
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/rules')
 def rules():
-    return render_template('rules.html')
+    # 规则页与状态无关：渲染、压缩各一次，之后从内存返回
+    page = current_app.extensions['eden_assets'].page('rules.html', lambda: render_template('rules.html'))
+    return asset_response(Response, page, request, PAGE_MAX_AGE)
+
+@bp.route('/static/<path:filename>')
+def static_asset(filename):
+    asset = current_app.extensions['eden_assets'].get(filename)
+    if asset is None:
+        return "❌ 文件不存在", 404
+    # 模板里的链接带内容哈希（?v=），可以长期缓存
+    max_age = ASSET_MAX_AGE if request.args.get('v') else PAGE_MAX_AGE
+    return asset_response(Response, asset, request, max_age)
+
+# 供 `flask --app app run` / gunicorn app:app 使用；创建本身不读盘、不起线程
+app = create_app()
 
 # ===== 启动配置 =====
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    app.extensions['eden'].start()  # 不等第一个请求，立即恢复投票倒计时
+    app.run(host='0.0.0.0', port=port, debug=False)
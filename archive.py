@@ -0,0 +1,159 @@
+# ===== 已结束对局的压缩归档 =====
+# 重置全部数据时不再直接删除存档，而是把这一局封存进房间目录下的 archive/：
+#   - games.gz：每局一段独立的 gzip（多段 gzip 首尾相接），内容是这一局的完整数据
+#   - index.jsonl：每局一行摘要（日期、人数、轮数、是否全体胜利、最终余额统计）+ 在 games.gz 中的位置
+# 列表 / 筛选只读索引，不解压任何一局；某一局的数据在需要时按位置读出来单独解压。
+# 先写数据段再写索引行：中途崩溃只会在 games.gz 末尾留下一段没人引用的数据，不影响已有的局。
+import gzip
+import json
+import os
+import threading
+import time
+
+import metrics
+from export import ExportSource
+from players import PlayerStore
+from snapshots import decode_base, decode_delta
+
+SEGMENTS_FILE = 'games.gz'
+INDEX_FILE = 'index.jsonl'
+
+
+def balance_stats(balances):
+    balances = sorted(balances)
+    if not balances:
+        return None
+    n = len(balances)
+    mid = n // 2
+    return {
+        'min': balances[0],
+        'max': balances[-1],
+        'mean': round(sum(balances) / n, 2),
+        'median': balances[mid] if n % 2 else (balances[mid - 1] + balances[mid]) / 2,
+        'total': sum(balances),
+        'positive': sum(1 for b in balances if b > 0),
+    }
+
+
+def summarize(game_state, players):
+    now = time.time()
+    return {
+        'game_id': game_state.get('game_id'),
+        'archived_at': now,
+        'date': time.strftime('%Y-%m-%d %H:%M', time.localtime(now)),
+        'players': len(players),
+        'rounds_played': len(game_state.get('round_results', {})),
+        'game_ended': bool(game_state.get('game_ended')),
+        'won_by_all': bool(game_state.get('won_by_all')),
+        'balances': balance_stats(balance for _, balance in players.balance_items()),
+    }
+
+
+class GameArchive:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.segments_file = os.path.join(archive_dir, SEGMENTS_FILE)
+        self.index_file = os.path.join(archive_dir, INDEX_FILE)
+        self._index = None  # 第一次列表 / 归档时才读索引
+        self._lock = threading.Lock()
+
+    # ---------- 索引 ----------
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        entries = []
+        size = os.path.getsize(self.segments_file) if os.path.exists(self.segments_file) else 0
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # 写了一半的尾行
+                    if entry['offset'] + entry['length'] <= size:
+                        entries.append(entry)
+        self._index = entries
+        return entries
+
+    def list(self, since=None, until=None, won_by_all=None, min_players=None, limit=None):
+        # 按归档时间倒序；since / until 是 'YYYY-MM-DD'，按日期比较（含当天）
+        with self._lock:
+            entries = list(self._load_index())
+        result = []
+        for entry in reversed(entries):
+            day = entry['date'][:10]
+            if since and day < since:
+                continue
+            if until and day > until:
+                continue
+            if won_by_all is not None and entry['won_by_all'] != won_by_all:
+                continue
+            if min_players is not None and entry['players'] < min_players:
+                continue
+            result.append(entry)
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    def get(self, game_id):
+        with self._lock:
+            for entry in self._load_index():
+                if entry['game_id'] == game_id:
+                    return entry
+        return None
+
+    # ---------- 写入 ----------
+    def add(self, game_state, players, snapshot_entries):
+        # 在房间写线程中调用（reset_all）：封存当前这一局，返回索引行
+        record = {'game_id': game_state.get('game_id'), 'game_state': game_state,
+                  'players': players.dump(), 'snapshots': snapshot_entries}
+        data = gzip.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'), compresslevel=6, mtime=0)
+        with self._lock:
+            index = self._load_index()
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(self.segments_file, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = {**summarize(game_state, players), 'offset': offset, 'length': len(data)}
+            line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+            with open(self.index_file, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            index.append(entry)
+        metrics.BYTES_WRITTEN.inc(len(data) + len(line), target='archive')
+        return entry
+
+    # ---------- 读取 ----------
+    def load(self, game_id):
+        # 只读出并解压这一局的数据段
+        entry = self.get(game_id)
+        if entry is None:
+            return None
+        with open(self.segments_file, 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['length'])
+        return json.loads(gzip.decompress(data))
+
+    def export_source(self, game_id):
+        record = self.load(game_id)
+        if record is None:
+            return None
+        base, deltas = None, []
+        for entry in record['snapshots']:
+            if entry.get('base'):
+                base, deltas = decode_base(entry), []
+            else:
+                deltas.append(decode_delta(entry))
+        game_state = record['game_state']
+        return ExportSource(record['game_id'], PlayerStore.from_json(record['players']), base, deltas,
+                            game_state.get('round_results', {}))
+
+    def export_sources(self, entries):
+        # 惰性：导出到哪一局才读哪一局，内存里同时只有一局
+        for entry in entries:
+            source = self.export_source(entry['game_id'])
+            if source is not None:
+                yield source
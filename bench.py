@@ -0,0 +1,407 @@
+# ===== 端到端压测：完整跑一局 8 轮游戏 =====
+# 模拟现场：N 人几秒内扫码 /join 并打开 /mobile，每轮几乎同时提交 /api/vote
+# （最后一票在请求里触发提前结算），几块屏幕一直轮询 /api/vote-status、/admin/status_json、/api/timer。
+# 两种驱动：
+#   client  Flask test client，进程内调用，只测应用本身
+#   http    werkzeug 多线程本地 HTTP 服务 + 线程池客户端，包含 WSGI / 网络开销
+# 报告每个路由的 p50/p95/p99 延迟、结算耗时、写入 game_data.json / 日志 / 快照（或 SQLite WAL）的字节数，
+# 结果保存到 bench_results/，加 --compare 与上一次同参数（驱动、存储后端、人数）的结果对比。
+#
+#   python bench.py --players 70 200 1000 --driver http --compare
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(ROOT, 'bench_results')
+PID_RE = re.compile(rb'playerId=(\d+)')
+
+
+# ---------- 驱动 ----------
+class ClientDriver:
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            # 不保存 Cookie：每次 /join 都是一部新手机
+            client = self._local.client = self.app.test_client(use_cookies=False)
+        resp = client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_data()
+
+    def close(self):
+        pass
+
+
+class HttpDriver:
+    name = 'http'
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)  # 不逐条打印访问日志
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, name='bench-http', daemon=True).start()
+
+    def request(self, method, path, body=None):
+        data = None
+        headers = {}
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def close(self):
+        self.server.shutdown()
+
+
+DRIVERS = {'client': ClientDriver, 'http': HttpDriver}
+
+
+# ---------- 计量 ----------
+class Recorder:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latency = defaultdict(list)   # 路由 -> [毫秒]
+        self.errors = defaultdict(int)     # 路由 -> 5xx / 异常次数
+        self.settlements = []              # 每次结算耗时（毫秒）
+        self.bytes = defaultdict(int)      # 文件 -> 写入字节数
+
+    def timed(self, driver, route, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = driver.request(method, path, body)
+        except Exception:
+            self.errors[route] += 1
+            raise
+        self.latency[route].append((time.perf_counter() - start) * 1000)
+        if status >= 500:
+            self.errors[route] += 1
+        return status, data
+
+
+def instrument(recorder):
+    # 包装结算和写盘函数，统计结算耗时和实际写入的字节数（只在压测进程里生效，只调用一次）
+    import journal
+    import rooms
+    import storage
+
+    settle_round = rooms.Room.settle_round
+
+    def timed_settle_round(self):
+        start = time.perf_counter()
+        try:
+            return settle_round(self)
+        finally:
+            recorder.settlements.append((time.perf_counter() - start) * 1000)
+    rooms.Room.settle_round = timed_settle_round
+
+    write = journal.Journal._write
+
+    def counted_write(self, f, lines, waiting):
+        recorder.bytes[os.path.basename(self.journal_file)] += sum(len(line.encode()) for line in lines)
+        return write(self, f, lines, waiting)
+    journal.Journal._write = counted_write
+
+    write_checkpoint = journal.Journal._write_checkpoint
+
+    def counted_write_checkpoint(self, payload):
+        recorder.bytes[os.path.basename(self.checkpoint_file)] += len(payload.encode())
+        return write_checkpoint(self, payload)
+    journal.Journal._write_checkpoint = counted_write_checkpoint
+
+    append_snapshot = storage.JsonStorage.append_snapshot
+    replace_snapshots = storage.JsonStorage.replace_snapshots
+
+    def counted_append_snapshot(self, entry):
+        if not os.path.exists(self.snapshot_file):
+            return append_snapshot(self, entry)  # 第一次写时整体重写，已由 replace_snapshots 计入
+        before = os.path.getsize(self.snapshot_file)
+        append_snapshot(self, entry)
+        recorder.bytes[os.path.basename(self.snapshot_file)] += os.path.getsize(self.snapshot_file) - before
+    storage.JsonStorage.append_snapshot = counted_append_snapshot
+
+    def counted_replace_snapshots(self, entries):
+        replace_snapshots(self, entries)
+        recorder.bytes[os.path.basename(self.snapshot_file)] += os.path.getsize(self.snapshot_file)
+    storage.JsonStorage.replace_snapshots = counted_replace_snapshots
+
+    commit = storage.SqliteStorage._commit
+
+    def counted_commit(self, statements):
+        # SQLite：按 WAL 文件的增长计（检查点后 WAL 从头写）
+        wal = self.path + '-wal'
+        before = os.path.getsize(wal) if os.path.exists(wal) else 0
+        error = commit(self, statements)  # 失败时是 StorageError，要原样交回写线程
+        after = os.path.getsize(wal) if os.path.exists(wal) else 0
+        recorder.bytes[os.path.basename(wal)] += after - before if after >= before else after
+        return error
+    storage.SqliteStorage._commit = counted_commit
+
+
+def percentile(sorted_values, p):
+    # 最近秩法
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+        'mean': statistics.fmean(values) if values else None,
+    }
+
+
+# ---------- 一局游戏 ----------
+class Game:
+    def __init__(self, driver, recorder, room_id, players, args):
+        self.driver = driver
+        self.recorder = recorder
+        self.base = f'/room/{room_id}'
+        self.players = players
+        self.args = args
+        self.pool = ThreadPoolExecutor(max_workers=args.concurrency)
+        self.ids = []
+        self.stop = threading.Event()
+
+    def call(self, route, method='GET', path=None, body=None):
+        return self.recorder.timed(self.driver, route, method, self.base + (path or route), body)
+
+    def fan_out(self, fn, items):
+        return list(self.pool.map(fn, items))
+
+    def poll_loop(self):
+        # 大屏 / 管理页：按固定间隔轮询
+        routes = ('/api/vote-status', '/admin/status_json', '/api/timer')
+        while not self.stop.wait(self.args.poll_interval):
+            for route in routes:
+                self.call(route)
+
+    def join(self, _):
+        status, body = self.call('/join')
+        match = PID_RE.search(body)
+        if status != 200 or not match:
+            return None
+        pid = int(match.group(1))
+        self.call('/mobile', path=f'/mobile?playerId={pid}')
+        return pid
+
+    def vote(self, pid):
+        if random.random() < self.args.abstain:
+            return
+        apple = random.choices(('red', 'gold', 'silver'), weights=self.args.weights)[0]
+        self.call('/api/vote', 'POST', body={'playerId': pid, 'apple': apple})
+
+    def reload_mobile(self, pid):
+        self.call('/mobile', path=f'/mobile?playerId={pid}')
+
+    def status(self):
+        _, body = self.call('/admin/status_json')
+        return json.loads(body)
+
+    def run(self):
+        self.call('/admin')  # 创建房间
+        self.ids = [pid for pid in self.fan_out(self.join, range(self.players)) if pid]
+        pollers = [threading.Thread(target=self.poll_loop, daemon=True)
+                   for i in range(self.args.screens)]
+        for t in pollers:
+            t.start()
+        rounds = 0
+        try:
+            while not self.status()['game_ended']:
+                self.call('/admin/start_round', 'POST')
+                self.fan_out(self.vote, self.ids)
+                if self.status()['round_status'] == 'voting':
+                    self.call('/admin/end_round', 'POST')  # 有人没投：管理员手动结算
+                rounds += 1
+                self.call('/display')
+                self.call('/admin')
+                self.fan_out(self.reload_mobile, self.ids)
+        finally:
+            self.stop.set()
+            for t in pollers:
+                t.join()
+            self.pool.shutdown()
+        return len(self.ids), rounds
+
+
+# ---------- 结果 ----------
+def run_bench(args):
+    results_dir = os.path.abspath(args.results_dir)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='eden-bench-')
+    os.makedirs(data_dir, exist_ok=True)
+    os.chdir(data_dir)  # 游戏数据写到单独目录，不碰正式的 game_data.json
+    sys.path.insert(0, ROOT)
+    import app as eden
+
+    # 允许超过 MAX_PLAYERS：压测用单独的 app 实例和放大后的配置
+    # 所有模拟玩家来自同一个 IP：关掉限流，只测应用本身
+    overrides = {'MAX_PLAYERS': max(max(args.players), eden.MAX_PLAYERS), 'RATE_LIMITS': False}
+    if args.storage:
+        overrides['STORAGE'] = args.storage
+    app = eden.create_app(**overrides)
+    registry = app.extensions['eden']
+    config = registry.config
+
+    recorder = Recorder()
+    instrument(recorder)
+    runs = []
+    for players in args.players:
+        for game_no in range(args.games):
+            registry.flush_all()
+            recorder.reset()
+            driver = DRIVERS[args.driver](app)
+            room_id = f'bench-{players}-{game_no}-{int(time.time())}'
+            started = time.perf_counter()
+            try:
+                joined, rounds = Game(driver, recorder, room_id, players, args).run()
+            finally:
+                driver.close()
+            elapsed = time.perf_counter() - started
+            registry.flush_all()
+            runs.append({
+                'players': players,
+                'game': game_no,
+                'joined': joined,
+                'rounds': rounds,
+                'seconds': elapsed,
+                'requests': sum(len(v) for v in recorder.latency.values()),
+                'routes': {route: summarize(v) for route, v in sorted(recorder.latency.items())},
+                'errors': dict(recorder.errors),
+                'settlement_ms': summarize(recorder.settlements),
+                'bytes_written': dict(recorder.bytes),
+            })
+            print_run(runs[-1])
+
+    result = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'driver': args.driver,
+        'storage': config.storage,
+        'players': args.players,
+        'games': args.games,
+        'screens': args.screens,
+        'concurrency': args.concurrency,
+        'abstain': args.abstain,
+        'python': sys.version.split()[0],
+        'runs': runs,
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.driver}-"
+                                     f"{'_'.join(map(str, args.players))}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f'\n结果已保存：{path}')
+
+    if args.compare:
+        baseline = args.compare if isinstance(args.compare, str) else previous_result(results_dir, result, path)
+        if baseline:
+            compare(result, baseline)
+        else:
+            print('没有可对比的历史结果')
+
+
+def fmt(ms):
+    return '     -' if ms is None else f'{ms:6.1f}'
+
+
+def print_run(run):
+    print(f"\n== {run['players']} 人（加入 {run['joined']}），{run['rounds']} 轮，"
+          f"{run['requests']} 个请求，{run['seconds']:.2f}s ==")
+    print(f"{'route':24} {'count':>6} {'p50':>6} {'p95':>6} {'p99':>6} {'max':>6}  (ms)")
+    for route, s in run['routes'].items():
+        print(f"{route:24} {s['count']:6d} {fmt(s['p50'])} {fmt(s['p95'])} {fmt(s['p99'])} {fmt(s['max'])}")
+    s = run['settlement_ms']
+    print(f"{'settlement':24} {s['count']:6d} {fmt(s['p50'])} {fmt(s['p95'])} {fmt(s['p99'])} {fmt(s['max'])}")
+    for name, n in sorted(run['bytes_written'].items()):
+        print(f'写入 {name}: {n} 字节')
+    if run['errors']:
+        print('错误：', run['errors'])
+
+
+def previous_result(results_dir, result, current_path):
+    # 同驱动、同人数的最近一次结果
+    for name in sorted(os.listdir(results_dir), reverse=True):
+        path = os.path.join(results_dir, name)
+        if path == current_path or not name.endswith('.json'):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        if (old.get('driver'), old.get('storage', 'json'), old.get('players')) == \
+                (result['driver'], result['storage'], result['players']):
+            return path
+    return None
+
+
+def compare(result, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f'\n== 与 {baseline_path} 对比（p95，ms）==')
+    old_runs = {(r['players'], r['game']): r for r in baseline['runs']}
+    for run in result['runs']:
+        old = old_runs.get((run['players'], run['game']))
+        if old is None:
+            continue
+        print(f"-- {run['players']} 人 --")
+        rows = [(route, s['p95'], old['routes'].get(route, {}).get('p95')) for route, s in run['routes'].items()]
+        rows.append(('settlement', run['settlement_ms']['p95'], old['settlement_ms']['p95']))
+        for route, new, prev in rows:
+            change = f'{(new - prev) / prev * 100:+6.1f}%' if new is not None and prev else ''
+            print(f'{route:24} {fmt(prev)} -> {fmt(new)} {change}')
+        for name in sorted(set(run['bytes_written']) | set(old['bytes_written'])):
+            print(f"写入 {name}: {old['bytes_written'].get(name, 0)} -> {run['bytes_written'].get(name, 0)} 字节")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='伊甸园游戏端到端压测')
+    parser.add_argument('--players', type=int, nargs='+', default=[70], help='每局人数，可给多个')
+    parser.add_argument('--games', type=int, default=1, help='每种人数跑几局')
+    parser.add_argument('--driver', choices=sorted(DRIVERS), default='client')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default=None, help='存储后端（默认同 EDEN_STORAGE）')
+    parser.add_argument('--concurrency', type=int, default=32, help='并发请求线程数')
+    parser.add_argument('--screens', type=int, default=3, help='轮询的大屏 / 管理页数量')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='每块屏幕的轮询间隔（秒）')
+    parser.add_argument('--abstain', type=float, default=0.0, help='每轮不投票的玩家比例')
+    parser.add_argument('--weights', type=float, nargs=3, default=[1, 1, 1], metavar=('RED', 'GOLD', 'SILVER'))
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--data-dir', default=None, help='游戏数据目录（默认临时目录）')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--compare', nargs='?', const=True, default=False,
+                        help='与指定结果文件对比；不给文件时与上一次同参数的结果对比')
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    run_bench(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# ===== Server-Sent Events 推送 =====
+# 每次状态变化只广播一次（带递增版本号），所有大屏 / 管理页通过 /api/stream 订阅，
+# 不再每 2 秒轮询。新订阅者先收到每类事件的最新一条，断线重连后也能立即追上。
+import json
+import queue
+import threading
+
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_BUFFER = 256
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.closed = False
+
+
+class Broadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._latest = {}   # 事件名 -> (版本号, 最近一条消息)
+        self.version = 0
+
+    def publish(self, event, data):
+        with self._lock:
+            self.version += 1
+            message = format_event(self.version, event, data)
+            self._latest[event] = (self.version, message)
+            for sub in list(self._subscribers):
+                try:
+                    sub.queue.put_nowait(message)
+                except queue.Full:
+                    # 消费太慢的连接直接断开，浏览器会自动重连并收到最新状态
+                    sub.closed = True
+                    self._subscribers.discard(sub)
+            return self.version
+
+    def subscribe(self):
+        sub = Subscriber()
+        with self._lock:
+            for _, message in sorted(self._latest.values()):
+                sub.queue.put_nowait(message)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def stream(self, sub):
+        try:
+            while not sub.closed:
+                try:
+                    message = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': ping\n\n'  # 心跳，顺便发现已断开的连接
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(sub)
+
+
+def format_event(version, event, data):
+    payload = json.dumps({'version': version, **data}, ensure_ascii=False)
+    return f'id: {version}\nevent: {event}\ndata: {payload}\n\n'
@@ -0,0 +1,114 @@
+# ===== 单写线程命令循环 =====
+# 房间内所有会修改状态的操作（加入、投票、开始/结算、回退、定时结算……）都作为命令
+# 投递到同一个写线程，按顺序执行，结果通过 Future 交还给等待的请求。
+# 结算不会重复执行，也不会和投票交错；只读的请求直接读状态，不需要任何锁。
+# 命令里追加的日志由存储的写线程按批落盘（group commit）：命令通过 after() 登记这些写入，
+# 结果要等它们 fsync 之后才交给请求，写线程不用等磁盘，请求拿到成功时数据已经落盘。
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import metrics
+
+COMMAND_TIMEOUT = 10      # 请求等待命令结果的最长时间（秒）
+LOOP_IDLE_SECONDS = 30    # 写线程空闲这么久就退出，下次投递时再启动
+
+
+class CommandTimeout(Exception):
+    # 等命令结果超时。started=False：命令还没开始执行，已经取消，客户端可以放心重试；
+    # started=True：命令已经在执行（或在等写盘），结果未知，不能简单重试
+    def __init__(self, started):
+        super().__init__('命令已开始执行，结果未知' if started else '命令排队超时，已取消')
+        self.started = started
+
+
+class CommandLoop:
+    def __init__(self, name):
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._writes = None  # 当前命令登记的、还没落盘的写入（只在写线程中访问）
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            self._queue.put((fn, args, kwargs, future, time.perf_counter()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'commands-{self.name}', daemon=True)
+                self._thread.start()
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        # 已经在写线程里（命令内部再调用命令）时直接执行，避免自己等自己
+        if threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(COMMAND_TIMEOUT)
+        except FutureTimeout:
+            if future.cancel():  # 还在排队：取消后写线程会跳过它
+                raise CommandTimeout(started=False)
+            if future.done():    # 超时和取消之间刚好完成
+                return future.result()
+            raise CommandTimeout(started=True)
+
+    def after(self, write):
+        # 当前命令的结果等 write（存储返回的 Future）落盘后再交出；不在命令里（加载时）不用等
+        if self._writes is not None and threading.current_thread() is self._thread:
+            self._writes.append(write)
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            try:
+                fn, args, kwargs, future, queued_at = self._queue.get(timeout=LOOP_IDLE_SECONDS)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            # 排队时间取代了原来的 join_lock 等待时间：请求等的是前面的命令执行完
+            command = getattr(fn, '__name__', 'command')
+            started = time.perf_counter()
+            metrics.COMMAND_WAIT_SECONDS.observe(started - queued_at, command=command)
+            self._writes = []
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                complete_after(future, result, self._writes)
+            finally:
+                self._writes = None
+            metrics.COMMAND_SECONDS.observe(time.perf_counter() - started, command=command)
+
+
+def complete_after(future, result, writes):
+    # 登记的写入全部落盘后交出结果（在存储的写线程里回调）；任何一个失败就把它的异常交给请求
+    if not writes:
+        future.set_result(result)
+        return
+    remaining = [len(writes)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [w.exception() for w in writes if w.exception() is not None]
+        if errors:
+            future.set_exception(errors[0])
+        else:
+            future.set_result(result)
+
+    for write in writes:
+        write.add_done_callback(done)
@@ -0,0 +1,167 @@
+# ===== 响应压缩 + 内存中的静态资源 =====
+# 场馆 Wi-Fi 带宽有限，开局时几十台手机同时打开 /mobile 和 /rules：
+#   - HTML / JSON / CSS / JS 响应按 Accept-Encoding 用 gzip（装了 brotli 时优先 br）压缩；
+#     带 ETag 的响应（按状态版本缓存的轮询接口、二维码 SVG）压缩结果也缓存，同一版本只压缩一次
+#   - static/ 下的 CSS / JS 和规则页在第一次请求时读入内存、按最高压缩级别各压一份，
+#     之后直接返回；资源 URL 带内容哈希（?v=），可以长期缓存
+# brotli 是可选依赖：pip install brotli
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # 没装 brotli 时只用 gzip
+    brotli = None
+
+COMPRESSIBLE = {'text/html', 'application/json', 'text/css', 'application/javascript',
+                'text/javascript', 'image/svg+xml', 'text/plain'}
+MIN_SIZE = 512             # 太小的响应压缩不划算
+DYNAMIC_LEVELS = {'br': 4, 'gzip': 6}     # 动态响应：速度优先
+STATIC_LEVELS = {'br': 11, 'gzip': 9}     # 静态资源只压一次：体积优先
+COMPRESSED_CACHE_SIZE = 1024
+ASSET_MAX_AGE = 31536000   # URL 带内容哈希，内容变了 URL 就变
+PAGE_MAX_AGE = 3600        # 规则页 URL 固定，靠 ETag 重新验证
+
+
+def encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+
+def choose_encoding(accept_encodings):
+    # accept_encodings：werkzeug 的 request.accept_encodings；按服务端偏好取第一个客户端接受的
+    for encoding in encodings():
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress(data, encoding, levels=DYNAMIC_LEVELS):
+    if encoding == 'br':
+        return brotli.compress(data, quality=levels['br'])
+    return gzip.compress(data, compresslevel=levels['gzip'], mtime=0)
+
+
+class ResponseCompressor:
+    def __init__(self, cache_size=COMPRESSED_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()   # (路径, ETag, 编码) -> 压缩后的内容
+        self._lock = threading.Lock()
+
+    def __call__(self, response, request):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+
+        etag, _ = response.get_etag()
+        key = (request.full_path, etag, encoding) if etag else None
+        body = self._get(key)
+        if body is None:
+            body = compress(data, encoding)
+            self._put(key, body)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # 压缩后的内容字节不同，ETag 改为弱校验（If-None-Match 按弱比较，304 不受影响）
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+            return body
+
+    def _put(self, key, body):
+        if key is None:
+            return
+        with self._lock:
+            self._cache[key] = body
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+class Asset:
+    __slots__ = ('body', 'variants', 'etag', 'mimetype')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:16]
+        # 每种编码各压一份；压缩后反而更大就不用
+        self.variants = {}
+        for encoding in encodings():
+            compressed = compress(body, encoding, STATIC_LEVELS)
+            if len(compressed) < len(body):
+                self.variants[encoding] = compressed
+
+
+class AssetCache:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._assets = {}   # static/ 下的相对路径 -> Asset
+        self._pages = {}    # 模板名 -> Asset
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        # 读入 static/ 下的全部文件并预先压缩（第一个请求时调用一次）
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for root, _, files in os.walk(self.static_dir):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                    with open(path, 'rb') as f:
+                        body = f.read()
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    self._assets[name] = Asset(body, mimetype)
+            self._loaded = True
+
+    def get(self, name):
+        self.load()
+        return self._assets.get(name)
+
+    def url(self, name):
+        asset = self.get(name)
+        version = asset.etag if asset else '0'
+        return f'/static/{name}?v={version}'
+
+    def page(self, name, render, mimetype='text/html'):
+        # 不依赖状态的整页（规则页）：第一次请求时渲染并压缩，之后直接用
+        asset = self._pages.get(name)
+        if asset is None:
+            body = render()
+            asset = Asset(body.encode('utf-8') if isinstance(body, str) else body, mimetype)
+            with self._lock:
+                asset = self._pages.setdefault(name, asset)
+        return asset
+
+
+def asset_response(response_class, asset, request, max_age):
+    encoding = choose_encoding(request.accept_encodings)
+    body = asset.variants.get(encoding, asset.body) if encoding else asset.body
+    resp = response_class(body, mimetype=asset.mimetype)
+    if body is not asset.body:
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    resp.set_etag(asset.etag, weak=bool(asset.variants))
+    resp.cache_control.public = True
+    resp.cache_control.max_age = max_age
+    return resp.make_conditional(request)
@@ -0,0 +1,102 @@
+# ===== 导出每轮投票和余额 =====
+# 一行 = 某局某轮某位玩家：game, round, player, apple, balance_before, balance_after, outcome。
+# 行由生成器逐轮产生，直接交给 Flask 的流式响应：内存只与一轮的玩家数有关，
+# 和导出多少轮、多少局无关。数据来自快照（base + 每轮增量）：
+#   - 增量里的轮次：余额 before / after 精确
+#   - 已合并进 base 的旧轮次（超出快照保留轮数）：只有投票和结果，余额留空
+import csv
+import io
+import json
+import zlib
+
+FIELDS = ('game', 'round', 'player', 'apple', 'balance_before', 'balance_after', 'outcome')
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+CHUNK_SIZE = 64 * 1024  # 攒够这么多字节再交给响应，避免每行一次 write
+
+
+class ExportSource:
+    # 某一局可导出的数据；由房间写线程拷贝出来，导出过程中游戏继续进行也不受影响
+    __slots__ = ('game_id', 'players', 'base', 'deltas', 'round_results')
+
+    def __init__(self, game_id, players, base, deltas, round_results):
+        self.game_id = game_id
+        self.players = players              # PlayerStore：所有轮次的投票
+        self.base = base                    # {'round', 'players': PlayerStore, ...} 或 None
+        self.deltas = deltas                # [{'round', 'balances', 'votes', 'game_state'}]，按轮次
+        self.round_results = round_results  # {'轮次': {'votes', 'message'}}
+
+
+def outcome_message(round_results, rnd):
+    return (round_results.get(str(rnd)) or {}).get('message')
+
+
+def rows(source):
+    game_id, players = source.game_id, source.players
+    pids = sorted(players)
+    base_round = source.base['round'] if source.base else 0
+    for rnd in range(1, base_round + 1):
+        outcome = outcome_message(source.round_results, rnd)
+        for pid in pids:
+            yield {'game': game_id, 'round': rnd, 'player': pid, 'apple': players.vote(pid, rnd),
+                   'balance_before': None, 'balance_after': None, 'outcome': outcome}
+    if source.base is None:
+        return
+    balances = dict(source.base['players'].balance_items())
+    for delta in source.deltas:
+        rnd = delta['round']
+        outcome = (outcome_message(delta['game_state'].get('round_results', {}), rnd)
+                   or outcome_message(source.round_results, rnd))
+        changed, votes = delta['balances'], delta['votes']
+        for pid in pids:
+            before = balances.get(pid)
+            after = changed[pid][1] if pid in changed else before
+            balances[pid] = after
+            yield {'game': game_id, 'round': rnd, 'player': pid, 'apple': votes.get(pid),
+                   'balance_before': before, 'balance_after': after, 'outcome': outcome}
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(['' if row[f] is None else row[f] for f in FIELDS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def encode(lines, compress=False):
+    # 文本行 -> 约 CHUNK_SIZE 大小的字节块；compress 时输出 gzip 流
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            chunk = gz.compress(chunk) if gz else chunk
+            if chunk:
+                yield chunk
+    chunk = b''.join(pending)
+    if gz:
+        chunk = gz.compress(chunk) + gz.flush()
+    if chunk:
+        yield chunk
+
+
+def stream(sources, fmt='ndjson', compress=False):
+    # sources：ExportSource 的可迭代对象（可以是惰性的，一局一局地加载）
+    def all_rows():
+        for source in sources:
+            yield from rows(source)
+    lines = csv_lines(all_rows()) if fmt == 'csv' else ndjson_lines(all_rows())
+    return encode(lines, compress)
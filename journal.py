@@ -0,0 +1,234 @@
+# ===== 追加写事件日志 + 检查点 =====
+# 每个改变状态的操作（加入、投票、开始/结算本轮、回退……）只追加一行 JSON 到日志文件，
+# 由后台写线程批量写入、每批只 fsync 一次（group commit）；append() 返回的 Future 在所在的批次
+# fsync 之后才完成，写入失败时带 StorageError，请求据此决定是否回复成功。
+# 一批写入失败后，之后排队的事件都不再落盘、直接失败，直到 recover()：磁盘上始终是完整的一段前缀，
+# 房间从磁盘重新加载即可撤销所有没落盘的修改。
+# 日志累计到一定条数或每轮结算后，把完整状态压缩成检查点（原子替换），并清空日志。
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+WRITER_IDLE_SECONDS = 30  # 写线程空闲这么久就退出，下次写入时再启动
+
+
+class StorageError(Exception):
+    pass
+
+
+class Journal:
+    def __init__(self, journal_file, checkpoint_file, compact_every=500, batch_max=1000):
+        self.journal_file = journal_file
+        self.checkpoint_file = checkpoint_file
+        self.compact_every = compact_every
+        self.batch_max = batch_max
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._seq = 0                 # 最后分配的事件序号
+        self._since_checkpoint = 0    # 上次检查点之后的事件数
+        self._failed = None           # 写入失败后的 StorageError；recover() / reset() 之前不再写盘
+        self._thread = None
+
+    # ---------- 启动恢复 ----------
+    def load(self):
+        """返回 (检查点状态 或 None, 检查点之后的事件列表)。"""
+        state = None
+        base_seq = 0
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            base_seq = int(state.get('seq', 0))
+
+        events = []
+        last_seq = base_seq
+        if os.path.exists(self.journal_file):
+            good = 0  # 最后一个完整事件行之后的偏移
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('没有换行')
+                        event = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时写了一半的尾行，丢弃
+                    good += len(line)
+                    seq = event.get('seq', 0)
+                    if seq > base_seq:
+                        events.append(event)
+                        last_seq = max(last_seq, seq)
+            if good < os.path.getsize(self.journal_file):
+                # 截掉半行：否则下一条事件会接在它后面，之后的事件在下次加载时全部丢失
+                print(f"⚠️ 警告：{self.journal_file} 末尾有不完整的行，已截断到 {good} 字节")
+                os.truncate(self.journal_file, good)
+
+        with self._lock:
+            self._seq = last_seq
+            self._since_checkpoint = len(events)
+        return state, events
+
+    # ---------- 写入 ----------
+    def append(self, event):
+        # 返回 Future：这条事件所在的批次 fsync 后完成
+        written = Future()
+        with self._lock:
+            self._seq += 1
+            event['seq'] = self._seq
+            self._since_checkpoint += 1
+            # 在调用方线程序列化：事件里可能引用仍会被修改的状态
+            self._queue.put(('event', json.dumps(event, ensure_ascii=False) + '\n', written))
+        self._ensure_writer()
+        return written
+
+    def needs_checkpoint(self):
+        return self._since_checkpoint >= self.compact_every
+
+    def checkpoint(self, state):
+        # 在调用方线程序列化，保证与当前序号一致；写盘交给后台线程
+        with self._lock:
+            payload = json.dumps({**state, 'seq': self._seq}, ensure_ascii=False)
+            self._since_checkpoint = 0
+            self._queue.put(('checkpoint', payload))
+        self._ensure_writer()
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        self._ensure_writer()
+        return done.wait(timeout)
+
+    def recover(self):
+        # 等之前排队的写入都处理完（写入失败之后的都已丢弃），恢复写盘；之后由调用方重新 load()
+        done = threading.Event()
+        self._queue.put(('recover', done))
+        self._ensure_writer()
+        done.wait()
+
+    def reset(self):
+        # 清空日志和检查点（/admin/reset_all）
+        done = threading.Event()
+        with self._lock:
+            self._seq = 0
+            self._since_checkpoint = 0
+            self._queue.put(('reset', done))
+        self._ensure_writer()
+        done.wait()
+
+    # ---------- 后台写线程 ----------
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        f = open(self.journal_file, 'a', encoding='utf-8')
+        while True:
+            try:
+                batch = [self._queue.get(timeout=WRITER_IDLE_SECONDS)]
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        # 空闲房间不占用线程
+                        self._thread = None
+                        f.close()
+                        return
+                continue
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines, waiting = [], []
+            for item in batch:
+                kind = item[0]
+                if kind == 'event':
+                    if self._failed is not None:
+                        item[2].set_exception(self._failed)
+                    else:
+                        lines.append(item[1])
+                        waiting.append(item[2])
+                    continue
+                # 检查点 / flush / reset 之前，先把已排队的事件落盘
+                f = self._write(f, lines, waiting)
+                lines, waiting = [], []
+                try:
+                    if kind == 'checkpoint' and self._failed is not None:
+                        # 检查点里有没落盘的修改，不能写；日志不截断，磁盘上仍是失败之前的状态
+                        print(f"⚠️ 之前的写入失败，跳过检查点 {self.checkpoint_file}")
+                    elif kind == 'checkpoint':
+                        self._write_checkpoint(item[1])
+                        f.close()
+                        f = open(self.journal_file, 'w', encoding='utf-8')  # 截断：所有事件已包含在检查点内
+                    elif kind in ('recover', 'reset'):
+                        self._failed = None
+                    if kind == 'reset':
+                        f.close()
+                        for path in (self.journal_file, self.checkpoint_file):
+                            if os.path.exists(path):
+                                os.remove(path)
+                        f = open(self.journal_file, 'a', encoding='utf-8')
+                except Exception as e:
+                    print(f"💥 写入 {self.checkpoint_file} 失败：", repr(e))
+                if kind in ('flush', 'recover', 'reset'):
+                    item[1].set()
+            f = self._write(f, lines, waiting)
+
+    def _write(self, f, lines, waiting):
+        # 返回之后继续写的文件对象（失败时换成重新打开的）
+        if not lines:
+            return f
+        start = None
+        try:
+            start = f.tell()
+            started = time.perf_counter()
+            data = ''.join(lines)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())  # 整批只 fsync 一次
+            metrics.FSYNC_SECONDS.observe(time.perf_counter() - started, target='journal')
+            metrics.BYTES_WRITTEN.inc(len(data.encode('utf-8')), target='journal')
+        except Exception as e:
+            # 不重试：截掉这一批写了一部分的内容，交给等待的请求报错，之后的写入在 recover() 前都丢弃
+            print(f"💥 写入 {self.journal_file} 失败：", repr(e))
+            metrics.STORAGE_ERRORS.inc(target='journal', result='failed')
+            error = self._failed = StorageError(f'写入 {self.journal_file} 失败：{e!r}')
+            if start is not None:
+                f = self._discard_from(f, start)
+            for written in waiting:
+                written.set_exception(error)
+            return f
+        for written in waiting:
+            written.set_result(None)
+        return f
+
+    def _discard_from(self, f, offset):
+        # 文件对象的缓冲区里可能还留着没写出去的数据，关掉重开，不让它以后再被写出
+        try:
+            f.close()
+        except Exception:
+            pass
+        try:
+            os.truncate(self.journal_file, offset)
+            return open(self.journal_file, 'a', encoding='utf-8')
+        except OSError as e:
+            print(f"💥 截断 {self.journal_file} 失败：", repr(e))
+            return f  # 已关闭：之后的写入都会失败，下次 load() 时再截断半行
+
+    def _write_checkpoint(self, payload):
+        started = time.perf_counter()
+        tmp = self.checkpoint_file + '.tmp'
+        with open(tmp, 'wb') as f:
+            data = payload.encode('utf-8')
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_file)
+        metrics.FSYNC_SECONDS.observe(time.perf_counter() - started, target='checkpoint')
+        metrics.BYTES_WRITTEN.inc(len(data), target='checkpoint')
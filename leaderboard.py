@@ -0,0 +1,59 @@
+# ===== 排行榜索引 =====
+# 按 (-余额, 玩家ID) 保持有序，结算时一次性应用余额变化的玩家；回退时按快照重建。
+# top(k) 为 O(k)，rank(pid) 用二分查找为 O(log n)。
+import bisect
+
+SMALL_UPDATE = 32  # 一次结算变化的玩家不超过这么多时逐个更新，否则整表重排
+
+
+class Leaderboard:
+    def __init__(self):
+        self._keys = []      # 有序的 (-balance, pid)
+        self._balance = {}   # pid -> balance
+
+    def rebuild(self, players):
+        self._balance = dict(players.balance_items())
+        self._keys = sorted((-balance, pid) for pid, balance in self._balance.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, pid, balance):
+        self._balance[pid] = balance
+        bisect.insort(self._keys, (-balance, pid))
+
+    def apply(self, changed):
+        # 一次结算的余额变化 {pid: (旧余额, 新余额)}，整次结算只重排一遍：
+        #   - 变化很少：逐个二分删除 / 插入
+        #   - 超过一半玩家（通常是几乎所有人）：按新余额整表重新排序
+        #   - 其余：过滤掉变化的旧键，追加排好序的新键再排序；两段有序，Timsort 一次归并，O(n + k log k)
+        moved = {pid: new for pid, (old, new) in changed.items() if old != new}
+        if not moved:
+            return
+        keys, balance = self._keys, self._balance
+        if len(moved) <= SMALL_UPDATE:
+            for pid, new in moved.items():
+                i = bisect.bisect_left(keys, (-balance[pid], pid))
+                if i < len(keys) and keys[i] == (-balance[pid], pid):
+                    del keys[i]
+                bisect.insort(keys, (-new, pid))
+            balance.update(moved)
+        elif len(moved) * 2 > len(keys):
+            balance.update(moved)
+            self._keys = sorted((-b, pid) for pid, b in balance.items())
+        else:
+            keys = [key for key in keys if key[1] not in moved]
+            keys.extend(sorted((-new, pid) for pid, new in moved.items()))
+            keys.sort()
+            self._keys = keys
+            balance.update(moved)
+
+    def top(self, k):
+        return [{'id': pid, 'balance': -neg} for neg, pid in self._keys[:k]]
+
+    def rank(self, pid):
+        # 并列同余额的玩家名次相同（1 + 余额严格更高的人数）
+        balance = self._balance.get(pid)
+        if balance is None:
+            return None
+        return bisect.bisect_left(self._keys, (-balance,)) + 1
@@ -0,0 +1,270 @@
+# ===== 运行指标 =====
+# 进程内的计数器 / 仪表 / 直方图，/metrics 按 Prometheus 文本格式导出，/admin 页面显示摘要。
+# 直方图的桶边界固定，observe 只做一次二分查找和几次加法（持有一个很小的锁），
+# 请求路径上的开销在微秒级；标签组合第一次出现时才创建。
+# 进程重启后从零开始，和 Prometheus 的计数器语义一致。
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # 标签值元组 -> 值
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self.values().items()):
+            lines.append(f'{self.name}{format_labels(self.labelnames, key)} {format_number(value)}')
+        return lines
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._functions = {}  # 标签值元组 -> 导出时才调用的函数
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        # 值在导出时现算（例如当前的 SSE 连接数），平时没有任何开销
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    def values(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return values
+
+    def value(self, **labels):
+        return self.values().get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)  # 第一个 >= value 的桶（le 语义）
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [各桶计数（最后一个是 +Inf）, 总和, 最大值]
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0.0]
+            series[0][index] += 1
+            series[1] += value
+            if value > series[2]:
+                series[2] = value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def values(self):
+        with self._lock:
+            return {key: (list(counts), total, peak) for key, (counts, total, peak) in self._values.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        bounds = self.buckets + (float('inf'),)
+        for key, (counts, total, peak) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [('le', format_number(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {format_number(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+    def stats(self, **labels):
+        # 摘要：count / mean / p50 / p95 / max；只给部分标签时合并其余标签的所有序列
+        counts = [0] * (len(self.buckets) + 1)
+        total = peak = 0.0
+        for key, (series, series_total, series_peak) in self.values().items():
+            if any(key[self.labelnames.index(name)] != str(value) for name, value in labels.items()):
+                continue
+            counts = [a + b for a, b in zip(counts, series)]
+            total += series_total
+            peak = max(peak, series_peak)
+        count = sum(counts)
+        if not count:
+            return None
+        return {
+            'count': count,
+            'mean': total / count,
+            'p50': self._quantile(counts, count, 0.5, peak),
+            'p95': self._quantile(counts, count, 0.95, peak),
+            'max': peak,
+        }
+
+    def _quantile(self, counts, count, q, peak):
+        # 在目标桶内线性插值；落在 +Inf 桶时用观测到的最大值
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets, counts):
+            if n and cumulative + n >= rank:
+                return min(lower + (bound - lower) * (rank - cumulative) / n, peak)
+            cumulative += n
+            lower = bound
+        return peak
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'eden_request_duration_seconds', '按路由统计的请求处理时间（秒）', ('route', 'method'))
+SAVE_SECONDS = REGISTRY.histogram(
+    'eden_save_duration_seconds', 'save_data / save_snapshot 在写线程中的用时（秒）', ('op',))
+BYTES_WRITTEN = REGISTRY.counter(
+    'eden_bytes_written_total', '写入存储的字节数', ('target',))
+STORAGE_ERRORS = REGISTRY.counter(
+    'eden_storage_errors_total', '写入存储失败的批次数（result=retried 已重试，failed 已报告给请求）', ('target', 'result'))
+FSYNC_SECONDS = REGISTRY.histogram(
+    'eden_fsync_duration_seconds', '后台写线程一批写入 + fsync 的用时（秒）', ('target',))
+COMMAND_WAIT_SECONDS = REGISTRY.histogram(
+    'eden_command_wait_seconds', '命令在房间写线程队列里等待的时间（秒）', ('command',))
+COMMAND_SECONDS = REGISTRY.histogram(
+    'eden_command_duration_seconds', '命令在房间写线程中的执行时间（秒）', ('command',))
+SETTLEMENT_SECONDS = REGISTRY.histogram(
+    'eden_settlement_duration_seconds', '每轮结算用时（秒）', ('round',))
+ROUND_CLOSE_LATENESS = REGISTRY.histogram(
+    'eden_round_close_lateness_seconds', '到期自动结算实际执行时间晚于截止时间多少（秒）')
+OPEN_POLLERS = REGISTRY.gauge(
+    'eden_open_pollers', '当前保持打开的推送 / 长轮询连接数', ('kind',))
+REJECTED_REQUESTS = REGISTRY.counter(
+    'eden_rejected_requests_total', '被限流（429）或超过并发上限（503）拒绝的请求数', ('route', 'reason'))
+ACTIVE_ROOMS = REGISTRY.gauge(
+    'eden_active_rooms', '当前已加载到内存的房间数')
+
+
+def render():
+    return REGISTRY.render()
+
+
+def summary():
+    # /admin 页面上的摘要（毫秒）
+    def ms(stats):
+        if stats is None:
+            return None
+        return {**stats, **{k: stats[k] * 1000 for k in ('mean', 'p50', 'p95', 'max')}}
+
+    routes = []
+    for route, method in sorted(REQUEST_SECONDS.values()):
+        stats = ms(REQUEST_SECONDS.stats(route=route, method=method))
+        routes.append({'route': route, 'method': method, **stats})
+    routes.sort(key=lambda row: -row['count'])
+    timings = [
+        ('save_data', ms(SAVE_SECONDS.stats(op='save_data'))),
+        ('save_snapshot', ms(SAVE_SECONDS.stats(op='save_snapshot'))),
+        ('结算', ms(SETTLEMENT_SECONDS.stats())),
+        ('自动结算延迟', ms(ROUND_CLOSE_LATENESS.stats())),
+        ('命令排队', ms(COMMAND_WAIT_SECONDS.stats())),
+    ]
+    return {
+        'routes': routes,
+        'timings': [(name, stats) for name, stats in timings if stats],
+        'bytes_written': {key[0]: value for key, value in sorted(BYTES_WRITTEN.values().items())},
+        'open_pollers': sum(OPEN_POLLERS.values().values()),
+    }
@@ -0,0 +1,184 @@
+# ===== 列式玩家存储 =====
+# 不再为每位玩家保存 {'id', 'balance', 'votes': ['red', ...]}：
+#   - ids / balances：array('q')，按加入顺序排列，slot 是玩家在列中的下标
+#   - rounds[r - 1]：第 r 轮的投票列，bytearray，每位玩家一个字节（0 未投，1 红，2 金，3 银）
+#     当前轮那一列同时就是“本轮是否已投票”的位图
+# 计票是整列 bytearray.count，结算按投票代码查表整列更新余额。
+# 持久化为 {'ids': [...], 'balances': [...], 'votes': ['rg-s…', …]}，每轮一个字符串；
+# 旧格式 {pid: {'balance', 'votes': [...]}} 仍可加载。
+import array
+import secrets
+
+APPLES = (None, 'red', 'gold', 'silver')  # 投票代码 -> 颜色
+MAX_PLAYER_ID = 2 ** 63 - 1  # ids 是 array('q')：更大的 ID 存不下
+CODES = {apple: code for code, apple in enumerate(APPLES)}
+LETTERS = b'-rgs'
+_ENCODE = bytes.maketrans(bytes(range(len(LETTERS))), LETTERS)
+_DECODE = bytes.maketrans(LETTERS, bytes(range(len(LETTERS))))
+
+
+class PlayerStore:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids = array.array('q')
+        self.balances = array.array('q')
+        self.rounds = []   # rounds[r - 1]：第 r 轮的投票列
+        self.slots = {}    # pid -> slot
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, pid):
+        return pid in self.slots
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    # ---------- 单个玩家 ----------
+    def add(self, pid, balance):
+        self.slots[pid] = len(self.ids)
+        self.ids.append(pid)
+        self.balances.append(balance)
+        for col in self.rounds:
+            col.append(0)
+
+    def balance(self, pid):
+        return self.balances[self.slots[pid]]
+
+    def set_balance(self, pid, balance):
+        self.balances[self.slots[pid]] = balance
+
+    def vote(self, pid, rnd):
+        if rnd > len(self.rounds):
+            return None
+        return APPLES[self.rounds[rnd - 1][self.slots[pid]]]
+
+    def has_voted(self, pid, rnd):
+        return rnd <= len(self.rounds) and self.rounds[rnd - 1][self.slots[pid]] != 0
+
+    def set_vote(self, pid, rnd, apple):
+        while len(self.rounds) < rnd:
+            self.rounds.append(bytearray(len(self.ids)))
+        self.rounds[rnd - 1][self.slots[pid]] = CODES[apple]
+
+    def votes(self, pid):
+        slot = self.slots[pid]
+        votes = [APPLES[col[slot]] for col in self.rounds]
+        while votes and votes[-1] is None:
+            votes.pop()
+        return votes
+
+    def balance_items(self):
+        return zip(self.ids, self.balances)
+
+    # ---------- 整列操作 ----------
+    def column(self, rnd):
+        if rnd > len(self.rounds):
+            return bytes(len(self.ids))
+        return self.rounds[rnd - 1]
+
+    def counts(self, rnd):
+        col = self.column(rnd)
+        return {apple: col.count(code) for code, apple in enumerate(APPLES) if apple}
+
+    def voted_count(self, rnd):
+        col = self.column(rnd)
+        return len(col) - col.count(0)
+
+    def round_votes(self, rnd):
+        # {pid: 颜色}，只含本轮已投票的玩家
+        ids = self.ids
+        return {ids[slot]: APPLES[code] for slot, code in enumerate(self.column(rnd)) if code}
+
+    def apply_deltas(self, rnd, deltas):
+        # deltas[code]：该投票代码的余额变化；余额最低为 0。返回 {pid: (old, new)}
+        old = self.balances
+        new = array.array('q', [b + d if b + d > 0 else 0
+                                for b, d in zip(old, map(deltas.__getitem__, self.column(rnd)))])
+        self.balances = new
+        ids = self.ids
+        return {ids[slot]: (o, n) for slot, (o, n) in enumerate(zip(old, new)) if o != n}
+
+    def truncate(self, rounds):
+        # 只保留前 rounds 轮的投票
+        del self.rounds[rounds:]
+
+    # ---------- 复制 / 持久化 ----------
+    def copy(self):
+        other = PlayerStore()
+        other.replace(self)
+        return other
+
+    def replace(self, other):
+        self.ids = array.array('q', other.ids)
+        self.balances = array.array('q', other.balances)
+        self.rounds = [bytearray(col) for col in other.rounds]
+        self.slots = dict(other.slots)
+
+    def dump(self):
+        return {
+            'ids': self.ids.tolist(),
+            'balances': self.balances.tolist(),
+            'votes': [bytes(col).translate(_ENCODE).decode('ascii') for col in self.rounds]
+        }
+
+    def load(self, data, start_balance):
+        self.clear()
+        if 'ids' in data:
+            self.ids = array.array('q', data['ids'])
+            self.balances = array.array('q', data['balances'])
+            self.rounds = [bytearray(col.encode('ascii').translate(_DECODE)) for col in data['votes']]
+            self.slots = {pid: slot for slot, pid in enumerate(self.ids)}
+            return self
+        # 旧格式：{pid: {'id', 'balance', 'votes': ['red', ...]}}
+        for k, v in data.items():
+            try:
+                pid = int(k)
+                balance = int(v.get('balance', start_balance))
+                votes = list(v.get('votes', []))
+            except (ValueError, TypeError, AttributeError):
+                continue  # 跳过损坏的玩家数据
+            self.add(pid, balance)
+            for rnd, apple in enumerate(votes, start=1):
+                if apple in CODES:
+                    self.set_vote(pid, rnd, apple)
+        return self
+
+    @classmethod
+    def from_json(cls, data, start_balance=0):
+        return cls().load(data, start_balance)
+
+
+class IdPool:
+    # 可用玩家 ID 池：列表 + 下标字典。随机取出、指定取出都是 O(1)（与末尾交换后删除），
+    # 只有加载 / 回退 / 重置时按上限整体重建一次
+    def __init__(self):
+        self.ids = []
+        self.index = {}   # pid -> 在 ids 中的下标
+
+    def __len__(self):
+        return len(self.ids)
+
+    def reset(self, max_id, used):
+        self.ids = [pid for pid in range(1, max_id + 1) if pid not in used]
+        self.index = {pid: i for i, pid in enumerate(self.ids)}
+
+    def pop_random(self):
+        i = secrets.randbelow(len(self.ids))
+        pid = self.ids[i]
+        del self.index[pid]
+        self._remove_at(i)
+        return pid
+
+    def discard(self, pid):
+        i = self.index.pop(pid, None)
+        if i is not None:
+            self._remove_at(i)
+
+    def _remove_at(self, i):
+        last = self.ids.pop()
+        if i < len(self.ids):
+            self.ids[i] = last
+            self.index[last] = i
@@ -0,0 +1,182 @@
+# ===== 按需性能剖析 =====
+# 现场 /display 或结算变慢时，不用重启就能看到时间花在哪里：
+#   - 管理员打开剖析窗口（POST /admin/profile），在这段时间内按比例抽取各路由的请求，
+#     以及每一次 end_round_logic / save_data / save_snapshot，用 cProfile 剖析
+#   - 同时有一个采样线程每隔几毫秒用 sys._current_frames() 记录这些线程的调用栈
+#   - 结果在内存里累加：pstats（按函数汇总）和折叠调用栈（火焰图格式），从 /admin/profile 下载
+# 关闭时请求钩子和装饰器只多一次属性判断；窗口到期后自动关闭、采样线程退出。
+# Python 3.12 起 cProfile 同一时刻只能有一个在运行，其余被抽中的请求只有采样栈。
+import cProfile
+import functools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_SECONDS = 60
+MAX_SECONDS = 600
+DEFAULT_FRACTION = 0.1
+DEFAULT_INTERVAL = 0.005   # 采样间隔（秒）
+MAX_STACK_DEPTH = 64
+
+
+def frame_name(code):
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+class Section:
+    # 一次被剖析的请求 / 调用
+    __slots__ = ('label', 'profile')
+
+    def __init__(self, label, profile):
+        self.label = label
+        self.profile = profile
+
+
+class Profiler:
+    def __init__(self):
+        self.until = 0.0            # 窗口结束时间（monotonic）；0 表示关闭
+        self.fraction = DEFAULT_FRACTION
+        self.routes = None          # 只剖析这些路由；None 表示全部
+        self.interval = DEFAULT_INTERVAL
+        self.started_at = None
+        self.requests = Counter()   # 标签 -> 剖析次数
+        self.stacks = Counter()     # 折叠调用栈 -> 采样次数
+        self._stats = None          # 累加的 pstats.Stats
+        self._sections = {}         # 线程 ID -> 正在进行的 Section
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    # ---------- 开关 ----------
+    def start(self, seconds=DEFAULT_SECONDS, fraction=DEFAULT_FRACTION, routes=None, interval=DEFAULT_INTERVAL):
+        # 开始一个新窗口，清空上一次的结果
+        with self._lock:
+            self.fraction = min(max(fraction, 0.0), 1.0)
+            self.routes = set(routes) if routes else None
+            self.interval = max(interval, 0.001)
+            self.requests.clear()
+            self.stacks.clear()
+            self._stats = None
+            self.started_at = time.time()
+            self.until = time.monotonic() + min(max(seconds, 1), MAX_SECONDS)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+                self._sampler.start()
+
+    def stop(self):
+        self.until = 0.0
+
+    @property
+    def active(self):
+        if not self.until:
+            return False
+        if time.monotonic() >= self.until:
+            self.until = 0.0
+            return False
+        return True
+
+    def status(self):
+        with self._lock:
+            profiled, samples = dict(self.requests), sum(self.stacks.values())
+        return {
+            'active': self.active,
+            'remaining_seconds': max(0, round(self.until - time.monotonic())) if self.until else 0,
+            'fraction': self.fraction,
+            'routes': sorted(self.routes) if self.routes else None,
+            'started_at': self.started_at,
+            'profiled': profiled,
+            'samples': samples,
+        }
+
+    # ---------- 剖析 ----------
+    def wants(self, route):
+        # 请求钩子调用：窗口打开、路由匹配且抽中时返回 True
+        return self.active and (self.routes is None or route in self.routes) and random.random() < self.fraction
+
+    def begin(self, label):
+        # 同一线程已经在剖析中（例如结算里调用 save_data）时不再嵌套，外层的剖析已经包含了它
+        ident = threading.get_ident()
+        if ident in self._sections:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # 另一个线程的 cProfile 正在运行（Python 3.12+），只保留采样栈
+            profile = None
+        section = self._sections[ident] = Section(label, profile)
+        return section
+
+    def end(self, section):
+        if section is None:
+            return
+        self._sections.pop(threading.get_ident(), None)
+        if section.profile is not None:
+            section.profile.disable()
+        with self._lock:
+            self.requests[section.label] += 1
+            if section.profile is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(section.profile)
+                else:
+                    self._stats.add(section.profile)
+
+    def _sample_loop(self):
+        while self.active:
+            time.sleep(self.interval)
+            sections = dict(self._sections)
+            if not sections:
+                continue
+            frames = sys._current_frames()
+            collapsed = []
+            for ident, section in sections.items():
+                frame = frames.get(ident)
+                names = []
+                while frame is not None and len(names) < MAX_STACK_DEPTH:
+                    names.append(frame_name(frame.f_code))
+                    frame = frame.f_back
+                names.append(section.label)
+                collapsed.append(';'.join(reversed(names)))
+            with self._lock:
+                self.stacks.update(collapsed)
+        with self._lock:
+            self._sampler = None
+            if self.active:  # 退出的同时又开了新窗口
+                self._sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+                self._sampler.start()
+
+    # ---------- 导出 ----------
+    def collapsed(self):
+        # 折叠调用栈：每行 "栈帧;栈帧;... 次数"，flamegraph.pl / speedscope 可以直接打开
+        with self._lock:
+            items = sorted(self.stacks.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def pstats_bytes(self):
+        # 与 pstats.Stats.dump_stats 写出的文件相同，可用 pstats / snakeviz 打开
+        with self._lock:
+            if self._stats is None:
+                return None
+            return marshal.dumps(self._stats.stats)
+
+
+PROFILER = Profiler()
+
+
+def profiled(fn):
+    # 窗口打开时每次调用都剖析（不按比例抽样）；关闭时只多一次属性判断
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.until or not PROFILER.active:
+            return fn(*args, **kwargs)
+        section = PROFILER.begin(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            PROFILER.end(section)
+    return wrapper
@@ -0,0 +1,363 @@
+# ===== 纯 Python 二维码生成 =====
+# 只实现 /qrcode_img 需要的部分：字节模式、版本 1–40、纠错等级 L/M/Q/H、
+# Reed-Solomon 纠错码、8 种掩码按罚分自动选择；输出 PNG（zlib 压缩的灰度图）或 SVG。
+# 不依赖 qrcode / Pillow。生成一次只要几毫秒，结果再由 app.py 按 URL + 尺寸缓存。
+import struct
+import zlib
+
+# 纠错等级 -> 格式信息中的两位
+ECL_BITS = {'L': 1, 'M': 0, 'Q': 3, 'H': 2}
+
+# 每块纠错码字数、块数，下标为版本号（0 号占位）
+ECC_CODEWORDS_PER_BLOCK = {
+    'L': (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+          28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'M': (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+          26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    'Q': (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+          28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'H': (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+          30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+}
+NUM_ERROR_CORRECTION_BLOCKS = {
+    'L': (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+          8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    'M': (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+          17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    'Q': (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+          23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    'H': (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+          25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+}
+
+MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+# GF(256)，本原多项式 x^8 + x^4 + x^3 + x^2 + 1
+EXP = [0] * 512
+LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11D
+for _i in range(255, 512):
+    EXP[_i] = EXP[_i - 255]
+
+
+class DataTooLong(ValueError):
+    pass
+
+
+def gf_mul(x, y):
+    if x == 0 or y == 0:
+        return 0
+    return EXP[LOG[x] + LOG[y]]
+
+
+def rs_divisor(degree):
+    # 生成多项式 (x - a^0)(x - a^1)…(x - a^(degree-1)) 的系数（最高次项省略）
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = gf_mul(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = gf_mul(root, 2)
+    return result
+
+
+def rs_remainder(data, divisor):
+    result = [0] * len(divisor)
+    for b in data:
+        factor = b ^ result.pop(0)
+        result.append(0)
+        if factor:
+            for i, coef in enumerate(divisor):
+                result[i] ^= gf_mul(coef, factor)
+    return result
+
+
+def raw_data_modules(version):
+    # 去掉功能图形后可放数据的模块数
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def data_codewords(version, ecl):
+    return (raw_data_modules(version) // 8
+            - ECC_CODEWORDS_PER_BLOCK[ecl][version] * NUM_ERROR_CORRECTION_BLOCKS[ecl][version])
+
+
+def alignment_positions(version):
+    if version == 1:
+        return []
+    num_align = version // 7 + 2
+    size = version * 4 + 17
+    step = (version * 8 + num_align * 3 + 5) // (num_align * 4 - 4) * 2
+    return [6] + sorted(size - 7 - i * step for i in range(num_align - 1))
+
+
+def choose_version(length, ecl):
+    for version in range(1, 41):
+        count_bits = 8 if version <= 9 else 16
+        if 4 + count_bits + length * 8 <= data_codewords(version, ecl) * 8:
+            return version
+    raise DataTooLong(f'数据太长（{length} 字节），超出二维码容量')
+
+
+def encode_data(data, version, ecl):
+    # 字节模式：模式指示 0100 + 长度 + 数据，补终止符和填充字节
+    bits = []
+
+    def append(value, length):
+        bits.extend((value >> i) & 1 for i in reversed(range(length)))
+
+    append(0b0100, 4)
+    append(len(data), 8 if version <= 9 else 16)
+    for b in data:
+        append(b, 8)
+    capacity = data_codewords(version, ecl) * 8
+    append(0, min(4, capacity - len(bits)))
+    append(0, -len(bits) % 8)
+    codewords = [int(''.join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(codewords) < capacity // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+    return codewords
+
+
+def add_ecc_and_interleave(data, version, ecl):
+    num_blocks = NUM_ERROR_CORRECTION_BLOCKS[ecl][version]
+    ecc_len = ECC_CODEWORDS_PER_BLOCK[ecl][version]
+    raw_codewords = raw_data_modules(version) // 8
+    num_short = num_blocks - raw_codewords % num_blocks
+    short_len = raw_codewords // num_blocks
+
+    divisor = rs_divisor(ecc_len)
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        size = short_len - ecc_len + (0 if i < num_short else 1)
+        block = data[k:k + size]
+        k += size
+        ecc = rs_remainder(block, divisor)
+        if i < num_short:
+            block = block + [0]  # 短块补一个占位，交织时跳过
+        blocks.append(block + ecc)
+
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            if i != short_len - ecc_len or j >= num_short:
+                result.append(block[i])
+    return result
+
+
+class QrMatrix:
+    def __init__(self, version):
+        self.version = version
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.function[y][x] = True
+
+    # ---------- 功能图形 ----------
+    def draw_function_patterns(self, ecl):
+        size = self.size
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+        for x, y in ((3, 3), (size - 4, 3), (3, size - 4)):
+            self.draw_finder(x, y)
+        positions = alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, x in enumerate(positions):
+            for j, y in enumerate(positions):
+                if (i, j) not in ((0, 0), (0, last), (last, 0)):
+                    self.draw_alignment(x, y)
+        self.draw_format_bits(ecl, 0)  # 先占位，选定掩码后再画
+        self.draw_version()
+
+    def draw_finder(self, x, y):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                xx, yy = x + dx, y + dy
+                if 0 <= xx < self.size and 0 <= yy < self.size:
+                    self.set_function(xx, yy, max(abs(dx), abs(dy)) not in (2, 4))
+
+    def draw_alignment(self, x, y):
+        for dy in range(-2, 3):
+            for dx in range(-2, 3):
+                self.set_function(x + dx, y + dy, max(abs(dx), abs(dy)) != 1)
+
+    def draw_format_bits(self, ecl, mask):
+        data = ECL_BITS[ecl] << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+        bit = lambda i: ((bits >> i) & 1) == 1
+        size = self.size
+        for i in range(6):
+            self.set_function(8, i, bit(i))
+        self.set_function(8, 7, bit(6))
+        self.set_function(8, 8, bit(7))
+        self.set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, bit(i))
+        for i in range(8):
+            self.set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, bit(i))
+        self.set_function(8, size - 8, True)  # 固定的深色模块
+
+    def draw_version(self):
+        if self.version < 7:
+            return
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+        for i in range(18):
+            dark = ((bits >> i) & 1) == 1
+            a, b = self.size - 11 + i % 3, i // 3
+            self.set_function(a, b, dark)
+            self.set_function(b, a, dark)
+
+    # ---------- 数据 ----------
+    def draw_codewords(self, codewords):
+        size = self.size
+        total = len(codewords) * 8
+        i = 0
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5  # 跳过竖直定时线
+            upward = ((right + 1) & 2) == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not self.function[y][x] and i < total:
+                        self.modules[y][x] = ((codewords[i >> 3] >> (7 - (i & 7))) & 1) == 1
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask):
+        test = MASKS[mask]
+        for y in range(self.size):
+            row, function = self.modules[y], self.function[y]
+            for x in range(self.size):
+                if not function[x] and test(x, y):
+                    row[x] = not row[x]
+
+    def penalty(self):
+        size = self.size
+        modules = self.modules
+        score = 0
+        columns = [[modules[y][x] for y in range(size)] for x in range(size)]
+        finder_like = ([True, False, True, True, True, False, True, False, False, False, False],
+                       [False, False, False, False, True, False, True, True, True, False, True])
+        for line in modules + columns:
+            # 规则 1：连续 5 个以上同色
+            run = 1
+            for a, b in zip(line, line[1:]):
+                if a == b:
+                    run += 1
+                else:
+                    if run >= 5:
+                        score += run - 2
+                    run = 1
+            if run >= 5:
+                score += run - 2
+            # 规则 3：类似定位图形的 1:1:3:1:1 序列
+            for i in range(size - 10):
+                if line[i:i + 11] in finder_like:
+                    score += 40
+        # 规则 2：2×2 同色块
+        for y in range(size - 1):
+            for x in range(size - 1):
+                c = modules[y][x]
+                if c == modules[y][x + 1] == modules[y + 1][x] == modules[y + 1][x + 1]:
+                    score += 3
+        # 规则 4：深色比例偏离 50%
+        dark = sum(map(sum, modules))
+        total = size * size
+        score += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+        return score
+
+
+def encode(data, ecl='M'):
+    """把文本 / 字节编码成二维码，返回 size×size 的布尔矩阵（True 为深色）。"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    version = choose_version(len(data), ecl)
+    codewords = add_ecc_and_interleave(encode_data(data, version, ecl), version, ecl)
+
+    qr = QrMatrix(version)
+    qr.draw_function_patterns(ecl)
+    qr.draw_codewords(codewords)
+    best = None
+    for mask in range(len(MASKS)):
+        qr.apply_mask(mask)
+        qr.draw_format_bits(ecl, mask)
+        score = qr.penalty()
+        if best is None or score < best[0]:
+            best = (score, mask)
+        qr.apply_mask(mask)  # 异或两次即还原
+    qr.apply_mask(best[1])
+    qr.draw_format_bits(ecl, best[1])
+    return qr.modules
+
+
+# ===== 输出 =====
+def to_png(modules, scale=8, border=4):
+    # 8 位灰度 PNG；每行 filter 字节 0，同一行重复 scale 次，zlib 压缩后很小
+    size = (len(modules) + border * 2) * scale
+    quiet = b'\xff' * (border * scale)
+    blank = b'\x00' + b'\xff' * size
+    rows = [blank] * (border * scale)
+    for line in modules:
+        row = b'\x00' + quiet + b''.join(b'\x00' * scale if dark else b'\xff' * scale
+                                         for dark in line) + quiet
+        rows.extend([row] * scale)
+    rows.extend([blank] * (border * scale))
+
+    def chunk(kind, body):
+        return (struct.pack('>I', len(body)) + kind + body
+                + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b''.join(rows), 9))
+            + chunk(b'IEND', b''))
+
+
+def to_svg(modules, border=4):
+    # 每个深色模块一段 1×1 的路径，由浏览器按 viewBox 缩放
+    size = len(modules) + border * 2
+    path = ''.join(f'M{x + border},{y + border}h1v1h-1z'
+                   for y, line in enumerate(modules) for x, dark in enumerate(line) if dark)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+            f'shape-rendering="crispEdges"><rect width="100%" height="100%" fill="#fff"/>'
+            f'<path d="{path}" fill="#000"/></svg>')
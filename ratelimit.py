@@ -0,0 +1,82 @@
+# ===== 准入控制 + 按客户端限流 =====
+# 整个游戏跑在一个 Flask 进程里：一台手机连点确认、反复刷新 /mobile，或者开局时的扫码风暴，
+# 都会拖慢所有人的请求，甚至让结算和写盘排不上队。
+#   - 令牌桶：按玩家 Cookie 和客户端 IP 各一个桶，/join、/mobile、投票、轮询各有独立的额度；
+#     超出时立即返回 429 + Retry-After，不渲染模板、不进写线程
+#   - 现场手机大多在同一个 NAT 后面，IP 的额度给得很宽，主要靠 Cookie 的额度约束单台手机
+#   - 并发上限：同时在处理的请求超过上限时直接 503，给结算和持久化留出线程
+# 管理、推送（SSE）、静态资源不限流也不计入并发。
+import math
+import threading
+import time
+from collections import namedtuple, OrderedDict
+
+# rate：每秒补充的令牌数；burst：桶容量（允许的突发）
+Budget = namedtuple('Budget', 'rate burst ip_rate ip_burst')
+
+BUDGETS = {
+    'join': Budget(rate=0.5, burst=3, ip_rate=50, ip_burst=300),
+    'mobile': Budget(rate=0.5, burst=5, ip_rate=50, ip_burst=300),
+    'vote': Budget(rate=1, burst=5, ip_rate=100, ip_burst=500),      # /api/vote 和 /api/votes/batch
+    'poll': Budget(rate=4, burst=20, ip_rate=400, ip_burst=2000),    # 各轮询接口
+}
+MAX_BUCKETS = 100000  # 最多记住多少个桶，最久没用的先丢（丢掉等于桶被加满）
+
+
+class RateLimiter:
+    def __init__(self, budgets=BUDGETS, max_buckets=MAX_BUCKETS):
+        self.budgets = budgets
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # (额度名, 'player' | 'ip', 键) -> [令牌数, 上次更新时间]
+        self._lock = threading.Lock()
+
+    def _take(self, key, rate, burst, now, consume):
+        # 返回还要等多少秒才有一个令牌（0 表示有）；consume 时扣掉一个
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / rate
+        if consume:
+            bucket[0] -= 1
+        return 0
+
+    def check(self, name, player, ip):
+        # 玩家桶和 IP 桶都有令牌才放行（两个都扣）；否则返回需要等待的秒数
+        budget = self.budgets[name]
+        now = time.monotonic()
+        with self._lock:
+            wait = self._take((name, 'ip', ip), budget.ip_rate, budget.ip_burst, now, consume=False)
+            if player is not None:
+                wait = max(wait, self._take((name, 'player', player), budget.rate, budget.burst, now,
+                                            consume=False))
+            if wait:
+                return wait
+            self._take((name, 'ip', ip), budget.ip_rate, budget.ip_burst, now, consume=True)
+            if player is not None:
+                self._take((name, 'player', player), budget.rate, budget.burst, now, consume=True)
+        return 0
+
+
+class Admission:
+    # 同时处理的请求数上限；满了不排队，直接拒绝
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit else None
+
+    def enter(self):
+        return self._slots is None or self._slots.acquire(blocking=False)
+
+    def leave(self):
+        if self._slots is not None:
+            self._slots.release()
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
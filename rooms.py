@@ -0,0 +1,843 @@
+# ===== 房间：一个进程同时运行多局伊甸园游戏 =====
+# 每个房间有自己的状态、写线程、持久化文件、计票 / 排行榜索引和推送通道。
+# 修改状态的方法只在房间的写线程中执行（room.call），读状态的请求直接读取。
+# 房间在第一次访问时才从磁盘加载，长时间空闲后写检查点并卸载，
+# 所以内存和 CPU 只与活跃房间数有关。
+import atexit
+import json
+import math
+import os
+import re
+import secrets
+import threading
+import time
+import traceback
+from collections import namedtuple, OrderedDict
+
+import metrics
+import profiling
+from archive import GameArchive
+from broadcast import Broadcaster
+from commands import CommandLoop
+from export import ExportSource
+from leaderboard import Leaderboard
+from players import PlayerStore, IdPool, APPLES
+from scheduler import DeadlineScheduler
+from settlement import settle, balance_delta
+from snapshots import SnapshotLog
+from storage import open_storage
+from tally import RoundTally, COLORS
+
+GameConfig = namedtuple('GameConfig', 'start_balance max_players voting_duration rules checkpoint_every '
+                                       'snapshot_retention storage')
+
+DEFAULT_ROOM = 'default'
+ROOM_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+ARCHIVE_DIR = 'archive'  # 已结束对局的压缩归档，在房间目录下
+DEADLINES_FILE = 'deadlines.json'  # 各房间未到期的投票截止时间，重启后据此恢复
+EVICT_INTERVAL = 60
+LOAD_WARN_SECONDS = 1.0  # 房间加载（检查点 + 日志重放）超过这个时间就打印警告
+IDEMPOTENCY_KEYS = 50000  # 每个房间记住最近多少个投票幂等键
+MAX_BATCH_VOTES = 1000    # /api/votes/batch 单次最多多少票
+PLAYER_OPS = ('join', 'vote', 'votes')  # 只影响单个玩家的操作：不唤醒手机的长轮询
+
+
+def default_game_state():
+    return {
+        'current_round': 1,
+        'round_status': 'waiting',  # 'waiting', 'voting', 'ended'
+        'game_ended': False,
+        'voting_start_time': None,
+        'won_by_all': False  # 新增字段，用于标记全体胜利
+    }
+
+
+def cookie_name(room_id):
+    # 玩家 ID 所在的 Cookie；限流在加载房间之前就要用到
+    return 'eden_player_id' if room_id == DEFAULT_ROOM else f'eden_player_id_{room_id}'
+
+
+def new_game_id():
+    # 每局一个 ID（导出 / 归档时区分不同场次）：开始时间 + 随机后缀
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + secrets.token_hex(2)
+
+
+def clean_game_state(loaded_game_state):
+    # 合并默认值 + 加载值
+    merged_game_state = {**default_game_state(), **loaded_game_state}
+
+    # ✅ 关键：清洗 voting_start_time
+    vst = merged_game_state.get('voting_start_time')
+    if vst is not None:
+        try:
+            merged_game_state['voting_start_time'] = float(vst)
+        except (ValueError, TypeError):
+            merged_game_state['voting_start_time'] = None
+    return merged_game_state
+
+
+class Room:
+    def __init__(self, room_id, data_dir, config, registry=None):
+        self.room_id = room_id
+        self.data_dir = data_dir
+        self.config = config
+        self.registry = registry
+        self.commands = CommandLoop(room_id)  # 本房间的单写线程
+        self.game_state = default_game_state()
+        self.players = PlayerStore()  # 列式存储：余额数组 + 每轮一列投票代码
+        # 存储后端：默认 JSON 日志 + 检查点，可选 SQLite（见 storage.py）
+        self.storage = open_storage(config.storage, data_dir, config.start_balance, config.checkpoint_every)
+        self.snapshots = SnapshotLog(self.storage, config.snapshot_retention)
+        self.archive = GameArchive(os.path.join(data_dir, ARCHIVE_DIR))  # 重置时封存上一局
+        self.tally = RoundTally(self.players)  # 计票索引，随投票/余额/轮次增量更新
+        self.leaderboard = Leaderboard()  # 按余额有序的排行榜索引
+        self.free_ids = IdPool()  # 还没被占用的玩家 ID，扫码加入时 O(1) 随机取一个
+        self.broadcaster = Broadcaster()  # /api/stream 推送
+        # (玩家ID, 幂等键) -> 轮次：重试时直接返回成功，不再写盘。
+        # 随检查点 / SQLite 的投票行保存，JSON 后端重放日志时一并恢复，重启后重试仍是重复请求
+        self.vote_keys = OrderedDict()
+        # 状态版本：每次修改状态后加一；和本次加载的随机标识一起组成轮询接口的 ETag
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self.responses = {}  # 渲染结果缓存：key -> (ETag, 内容)，版本变了自然失效
+        # 阶段号：轮次 / 状态 / 余额变化（开始、结算、重置、回退）时加一，唤醒等在 changed 上的手机长轮询；
+        # 别人加入 / 投票不算，否则每一票都会把所有手机叫醒一遍
+        self.phase = 0
+        self.changed = threading.Condition()
+        self.recovering = False  # 写入失败后已排了恢复命令
+        self.evicting = False    # 正在卸载：get() 要等卸载完成后重新加载
+        self.last_active = time.time()
+
+    def call(self, fn, *args, **kwargs):
+        # 在写线程中执行一条命令并等待结果
+        return self.commands.call(fn, *args, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        # 投递命令，不等待结果（定时结算等后台任务）
+        return self.commands.submit(fn, *args, **kwargs)
+
+    # ---------- 路径 / Cookie ----------
+    @property
+    def url_prefix(self):
+        return '' if self.room_id == DEFAULT_ROOM else f'/room/{self.room_id}'
+
+    @property
+    def cookie_name(self):
+        return cookie_name(self.room_id)
+
+    # ---------- 持久化 ----------
+    def load(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        loaded = self.load_data()  # 快照等到第一次结算 / 回退时再读
+        if 'game_id' not in self.game_state:
+            self.game_state['game_id'] = new_game_id()
+            if loaded:
+                self.save_data()  # 旧存档补上 game_id
+        self.rebuild_indexes()
+        self.publish_all()
+        self.sync_deadline()  # 重启后恢复进行中的投票倒计时
+
+    def load_data(self):
+        # 检查点 + 重放其后的日志事件（SQLite 后端直接读表，没有要重放的事件）；
+        # 损坏的文件由存储后端移到一边，这里拿到的是空状态
+        state, events = self.storage.load()
+        state = state or {}
+        self.game_state.update(clean_game_state(state.get('game_state', {})))
+        self.players.load(state.get('players', {}), self.config.start_balance)
+        for pid, key, rnd in state.get('vote_keys', []):
+            self.remember_vote_key(pid, key, rnd)
+
+        for event in events:
+            try:
+                self.apply_event(event)
+            except Exception as e:
+                print(f"⚠️ 警告：重放日志事件 #{event.get('seq')} 失败：{e}")
+        if events:
+            self.save_data()  # 重放完成后压缩成新的检查点
+        return bool(state or events)
+
+    def apply_event(self, event):
+        op = event['op']
+        players, game_state = self.players, self.game_state
+        if op == 'join':
+            players.add(int(event['pid']), self.config.start_balance)
+        elif op == 'vote':
+            players.set_vote(int(event['pid']), event['round'], event['apple'])
+            self.remember_vote_key(int(event['pid']), event.get('key'), event['round'])
+        elif op == 'votes':
+            for pid, apple, key in event['votes']:
+                players.set_vote(int(pid), event['round'], apple)
+                self.remember_vote_key(int(pid), key, event['round'])
+        elif op == 'round_start':
+            game_state['current_round_eligible'] = event['eligible']
+            game_state['round_status'] = 'voting'
+            game_state['voting_start_time'] = event['voting_start_time']
+        elif op == 'round_reset':
+            self.reset_round_votes(event['round'])
+        elif op == 'round_end':
+            for pid, balance in event['balances'].items():
+                players.set_balance(int(pid), balance)
+            game_state.update(clean_game_state(event['game_state']))
+        elif op in ('rollback', 'game_state'):
+            if 'players' in event:
+                players.load(event['players'], self.config.start_balance)
+            if op == 'rollback':
+                self.forget_vote_keys(event['round'] + 1)
+            game_state.update(clean_game_state(event['game_state']))
+
+    def record(self, op, **fields):
+        # 每个改变状态的操作只追加一条日志；累计足够多时压缩成检查点
+        self.touch(phase=op not in PLAYER_OPS)
+        self.persist({'op': op, **fields})
+        if self.storage.needs_checkpoint():
+            self.save_data()
+
+    def persist(self, event):
+        # 追加到存储；当前命令的结果等这次写入落盘后才交给请求（见 CommandLoop.after）
+        written = self.storage.append(event, self.game_state)
+        written.add_done_callback(self.on_written)  # 先于请求的回调：恢复命令排在重试之前
+        self.commands.after(written)
+
+    def on_written(self, written):
+        # 在存储的写线程里回调：写入失败后内存里有没落盘的修改，排一条命令从磁盘恢复
+        if written.exception() is not None and not self.recovering:
+            self.recovering = True
+            self.submit(self.recover)
+
+    def recover(self):
+        # 写入失败之后排队的写入都被存储丢弃，这期间的命令都已收到“保存失败”；
+        # 从磁盘重新加载，把它们在内存里的修改一起撤销，重试时不会得到“你已投票”或多出一个玩家
+        self.storage.recover()
+        self.recovering = False
+        print(f"⚠️ 房间 {self.room_id} 写入失败，从磁盘重新加载")
+        game_id = self.game_state.get('game_id')
+        self.players.clear()
+        self.vote_keys.clear()
+        self.game_state.clear()
+        self.game_state.update(default_game_state())
+        self.load_data()
+        self.game_state.setdefault('game_id', game_id)
+        self.snapshots.loaded = False  # 快照下次用到时重新读
+        self.rebuild_indexes()
+        self.responses.clear()
+        self.touch()
+        self.sync_deadline()
+        self.publish_all()
+
+    @profiling.profiled
+    def save_data(self):
+        # 写完整检查点（后台原子替换 game_data.json，并清空已包含的日志）
+        with metrics.SAVE_SECONDS.time(op='save_data'):
+            self.storage.checkpoint({
+                'game_state': self.game_state,
+                'players': self.players.dump(),
+                'vote_keys': [[pid, key, rnd] for (pid, key), rnd in self.vote_keys.items()]
+            })
+
+    @profiling.profiled
+    def save_snapshot(self, round_num, changed, round_votes, before_state):
+        # 只记录本轮的余额变化和投票；第一次结算时才保存一份完整的基准状态
+        def base():
+            players = self.players.copy()
+            players.truncate(round_num - 1)
+            for pid, (old, new) in changed.items():
+                players.set_balance(pid, old)
+            return {'round': round_num - 1, 'players': players, 'game_state': before_state}
+        with metrics.SAVE_SECONDS.time(op='save_snapshot'):
+            self.snapshots.record(round_num, changed, round_votes, self.game_state, base)
+
+    def rebuild_indexes(self):
+        # 回退 / 重置 / 启动时按玩家数据精确重建计票和排行榜
+        self.tally.rebuild(self.game_state['current_round'])
+        self.leaderboard.rebuild(self.players)
+        self.free_ids.reset(self.config.max_players, self.players.slots)
+
+    # ---------- 状态版本 / 响应缓存 ----------
+    def touch(self, phase=True):
+        self.version += 1
+        if phase:
+            with self.changed:
+                self.phase += 1
+                self.changed.notify_all()
+
+    def phase_tag(self):
+        # 返回给手机的 since_version；带上加载标识，进程重启 / 房间重新加载后不会和旧值相同
+        return f'{self.epoch}-{self.phase}'
+
+    def wait_for_change(self, since, timeout):
+        # 长轮询：阶段变化或超时后返回（不在写线程中调用）
+        with self.changed:
+            return self.changed.wait_for(lambda: self.phase_tag() != since, timeout)
+
+    def state_tag(self, version, extra=None):
+        tag = f'{self.epoch}-{version}'
+        return tag if extra is None else f'{tag}-{extra}'
+
+    def cached(self, key, tag, render):
+        # 同一 ETag 只渲染一次；并发的请求最多重复渲染一次，不需要锁
+        entry = self.responses.get(key)
+        if entry is not None and entry[0] == tag:
+            return entry[1]
+        body = render()
+        self.responses[key] = (tag, body)
+        return body
+
+    # ---------- 实时推送（/api/stream）----------
+    def remaining_seconds(self):
+        game_state = self.game_state
+        if game_state['round_status'] == 'voting' and game_state['voting_start_time']:
+            elapsed = time.time() - game_state['voting_start_time']
+            return max(0, self.config.voting_duration - int(elapsed))
+        return None
+
+    def publish_round(self):
+        self.broadcaster.publish('round', {
+            'current_round': self.game_state['current_round'],
+            'round_status': self.game_state['round_status'],
+            'game_ended': self.game_state['game_ended'],
+            'won_by_all': self.game_state.get('won_by_all', False),
+            'total_players': len(self.players),
+            'remaining': self.remaining_seconds()
+        })
+
+    def publish_votes(self):
+        in_voting = self.game_state['round_status'] == 'voting'
+        self.broadcaster.publish('votes', {
+            'in_voting': in_voting,
+            'total_players': self.tally.eligible if in_voting else 0,
+            'voted_players': self.tally.voted_eligible if in_voting else 0
+        })
+
+    def publish_leaderboard(self):
+        self.broadcaster.publish('leaderboard', {
+            'top': self.leaderboard.top(20),
+            'total_players': len(self.players)
+        })
+
+    def publish_all(self):
+        self.publish_round()
+        self.publish_votes()
+        self.publish_leaderboard()
+
+    # ---------- 结算 ----------
+    def settle_round(self):
+        # 结算 + 记录余额变化；每轮结算后压缩一次检查点
+        settled = self.game_state['current_round']
+        started = time.perf_counter()
+        changed = self.end_round_logic()
+        for pid, (old, new) in changed.items():
+            self.tally.on_balance(pid, old, new)
+        self.leaderboard.apply(changed)
+        self.tally.advance_round(self.game_state['current_round'])
+        balances = {pid: new for pid, (old, new) in changed.items()}
+        self.touch()
+        self.persist({'op': 'round_end', 'round': settled, 'balances': balances,
+                      'game_state': dict(self.game_state)})
+        self.save_data()
+        metrics.SETTLEMENT_SECONDS.observe(time.perf_counter() - started, round=settled)
+        self.publish_all()
+        self.sync_deadline()
+
+    def round_outcome(self, current_round):
+        votes = self.tally.round_counts(current_round)
+        eligible = self.game_state.get('current_round_eligible', sum(votes.values()))
+        return votes, settle(self.config.rules, current_round,
+                             votes['red'], votes['gold'], votes['silver'], eligible)
+
+    @profiling.profiled
+    def end_round_logic(self):
+        rules = self.config.rules
+        game_state = self.game_state
+        current_round = game_state['current_round']
+        votes, outcome = self.round_outcome(current_round)
+
+        # 本轮开始前的状态，作为快照基准（只在第一次结算时用到）
+        before_state = {**game_state, 'round_status': 'waiting', 'voting_start_time': None}
+
+        # 按本轮投票列整列更新余额（未投票玩家 -PENALTY，其余按结算结果）
+        deltas = [balance_delta(rules, outcome, apple) for apple in APPLES]
+        changed = self.players.apply_deltas(current_round, deltas)
+        round_votes = self.players.round_votes(current_round)
+
+        # 保存本轮结果，供 /display 直接展示
+        game_state.setdefault('round_results', {})[str(current_round)] = {
+            'votes': votes,
+            'message': outcome.message
+        }
+
+        if outcome.won_by_all:
+            # ✅ 全体胜利：已投票玩家余额保持不变
+            game_state['game_ended'] = True
+            game_state['round_status'] = 'ended'
+            game_state['won_by_all'] = True
+        # ===== 游戏结束判断 =====
+        elif current_round >= rules.max_rounds:
+            game_state['game_ended'] = True
+            game_state['round_status'] = 'ended'
+        else:
+            game_state['current_round'] += 1
+            game_state['round_status'] = 'waiting'
+            game_state['voting_start_time'] = None
+
+        # 保存快照
+        self.save_snapshot(current_round, changed, round_votes, before_state)
+        return changed
+
+    def player_state(self, pid):
+        # 手机需要的全部状态（/api/player/<id>/state）；先取阶段号再读状态，内容不会比它旧
+        version = self.phase_tag()
+        game_state = self.game_state
+        current_round = game_state['current_round']
+        last_round = current_round if game_state['game_ended'] else current_round - 1
+        last_outcome = None
+        if last_round >= 1:
+            last_outcome = {'round': last_round, **self.round_result(last_round)}
+        balance = self.players.balance(pid)
+        return {
+            'version': version,
+            'current_round': current_round,
+            'round_status': game_state['round_status'],
+            'game_ended': game_state['game_ended'],
+            'won_by_all': game_state.get('won_by_all', False),
+            'voted': self.players.has_voted(pid, current_round),
+            'balance': balance,
+            'bankrupt': balance <= 0,
+            'remaining_time': self.remaining_seconds(),
+            'last_outcome': last_outcome,
+            'rank': self.leaderboard.rank(pid),
+            'total_players': len(self.players),
+        }
+
+    def round_result(self, rnd):
+        # 结算时已保存本轮结果；旧存档没有时按计数现算（结果有缓存）
+        stored = self.game_state.get('round_results', {}).get(str(rnd))
+        if stored:
+            return stored
+        votes, outcome = self.round_outcome(rnd)
+        return {'votes': votes, 'message': outcome.message}
+
+    # ---------- 投票截止调度 ----------
+    def sync_deadline(self):
+        # 每次改变轮次状态后调用：投票中则在 voting_start_time + VOTING_DURATION 精确结算，否则取消
+        scheduler = self.registry.scheduler if self.registry else None
+        if scheduler is None:
+            return
+        game_state = self.game_state
+        start = game_state['voting_start_time']
+        if game_state['round_status'] == 'voting' and start is not None:
+            deadline = start + self.config.voting_duration
+            scheduler.schedule((self.room_id, 'end'), deadline,
+                               lambda fired_at: self.submit(self.end_round_at_deadline, start, fired_at))
+            self.schedule_tick()
+        else:
+            deadline = None
+            scheduler.cancel((self.room_id, 'end'))
+            scheduler.cancel((self.room_id, 'tick'))
+        self.registry.set_pending_deadline(self.room_id, deadline)
+
+    def schedule_tick(self):
+        # 倒计时推送对齐到整秒，投票结束前每秒一次
+        start = self.game_state['voting_start_time']
+        next_at = start + math.floor(time.time() - start) + 1
+        if next_at < start + self.config.voting_duration:
+            self.registry.scheduler.schedule((self.room_id, 'tick'), next_at, self.on_tick)
+
+    def on_tick(self, fired_at):
+        if self.game_state['round_status'] != 'voting' or self.game_state['voting_start_time'] is None:
+            return
+        if self.broadcaster.subscriber_count:
+            self.broadcaster.publish('tick', {'remaining': self.remaining_seconds()})
+        self.schedule_tick()
+
+    def end_round_at_deadline(self, voting_start_time, deadline=None):
+        # 只结算排期时的那一轮：期间被重置 / 回退 / 提前结算过就什么都不做
+        game_state = self.game_state
+        if game_state['round_status'] != 'voting' or game_state['voting_start_time'] != voting_start_time:
+            return
+        if deadline is not None:
+            # 从截止时间到真正开始结算（调度线程 + 命令排队）晚了多久
+            metrics.ROUND_CLOSE_LATENESS.observe(max(0.0, time.time() - deadline))
+        try:
+            self.settle_round()
+        except Exception as e:
+            print(f"💥 房间 {self.room_id} 结算崩溃！错误：", repr(e))
+            traceback.print_exc()
+            # 防止本轮卡住
+            game_state['round_status'] = 'waiting'
+            game_state['voting_start_time'] = None
+            self.touch()  # 阶段变了：让 ETag 失效、唤醒长轮询
+            self.sync_deadline()
+
+    # ---------- 玩家操作（在写线程中执行）----------
+    def can_join(self):
+        return self.game_state['current_round'] == 1 and self.game_state['round_status'] == 'waiting'
+
+    def add_player(self, pid):
+        start_balance = self.config.start_balance
+        self.free_ids.discard(pid)
+        self.players.add(pid, start_balance)
+        self.tally.add_player(pid, start_balance)
+        self.leaderboard.add(pid, start_balance)
+        self.record('join', pid=pid)
+        self.publish_leaderboard()
+
+    def join(self):
+        # 返回 (玩家ID, 错误信息, HTTP 状态码)
+        if self.game_state['game_ended']:
+            return None, "❌ 游戏已结束", 403
+        if not self.can_join():
+            return None, "❌ 游戏已开始，无法加入新玩家", 403
+        max_players = self.config.max_players
+        if len(self.players) >= max_players:
+            return None, "❌ 玩家人数已达上限", 403
+
+        if not self.free_ids:
+            return None, "❌ 无可用ID", 500
+
+        # 只改内存并追加一条日志（后台写线程批量落盘），扫码高峰时每次加入都很短
+        pid = self.free_ids.pop_random()
+        self.add_player(pid)
+        return pid, None, 200
+
+    def register(self, player_id):
+        # /mobile?playerId=N 直接进入：第1轮开始前可用指定 ID 加入
+        if player_id in self.players:
+            return None, None
+        if not self.can_join():
+            return "❌ 游戏已开始，无法加入新玩家", 403
+        if len(self.players) >= self.config.max_players:
+            return "❌ 玩家人数已达上限", 403
+        self.add_player(player_id)
+        return None, None
+
+    def check_vote(self, player_id, apple):
+        # 返回错误信息；None 表示可以投票
+        players, game_state = self.players, self.game_state
+        if player_id not in players:
+            return '玩家不存在'
+        if apple not in COLORS:
+            return '无效选择'
+        if game_state['round_status'] != 'voting':
+            return '不在投票阶段'
+        if game_state['game_ended']:
+            return '游戏已结束'
+        # ✅ 新增：余额 <= 0 不能投票
+        if players.balance(player_id) <= 0:
+            return '你的余额已耗尽，无法继续投票'
+        if players.has_voted(player_id, game_state['current_round']):
+            return '你已投票'
+        return None
+
+    def cast_votes(self, entries):
+        # entries：[(玩家ID, 颜色, 幂等键 或 None)]，一次校验、一起生效。
+        # 返回 (每条的结果, 实际生效的 [(玩家ID, 颜色, 幂等键)])
+        current_round = self.game_state['current_round']
+        results, applied = [], []
+        for player_id, apple, key in entries:
+            if key is not None and (player_id, key) in self.vote_keys:
+                results.append({'success': True, 'duplicate': True})  # 重试：已经生效过
+                continue
+            error = self.check_vote(player_id, apple)
+            if error:
+                results.append({'success': False, 'message': error})
+                continue
+            self.players.set_vote(player_id, current_round, apple)
+            self.tally.on_vote(player_id, apple, self.players.balance(player_id))
+            self.remember_vote_key(player_id, key, current_round)
+            applied.append((player_id, apple, key))
+            results.append({'success': True})
+        return results, applied
+
+    def after_votes(self):
+        self.publish_votes()
+        # === 修复：仅当所有【余额 > 0】的玩家都已投票时，才提前结算 ===
+        tally = self.tally
+        if tally.eligible > 0 and tally.voted_eligible == tally.eligible:
+            print(f">>> 房间 {self.room_id}：所有 {tally.eligible} 名可投票玩家已提交，提前结算！")
+            try:
+                self.settle_round()
+            except Exception as e:
+                print("💥 提前结算失败：", repr(e))
+                traceback.print_exc()
+
+    def vote(self, player_id, apple, key=None):
+        (result,), applied = self.cast_votes([(player_id, apple, key)])
+        if applied:
+            fields = {'key': key} if key is not None else {}
+            self.record('vote', pid=player_id, round=self.game_state['current_round'], apple=apple, **fields)
+            self.after_votes()
+        return result
+
+    def vote_batch(self, entries):
+        # 代投终端一次提交多名玩家的票：同一条命令里校验和生效（不会和结算交错），只写一条日志
+        results, applied = self.cast_votes(entries)
+        if applied:
+            self.record('votes', round=self.game_state['current_round'], votes=applied)
+            self.after_votes()
+        return results
+
+    def remember_vote_key(self, player_id, key, rnd):
+        if key is None:
+            return
+        self.vote_keys[(player_id, key)] = rnd
+        if len(self.vote_keys) > IDEMPOTENCY_KEYS:
+            self.vote_keys.popitem(last=False)
+
+    def forget_vote_keys(self, from_round):
+        # 重置 / 回退撤销了这些轮的投票，对应的幂等键也作废
+        self.vote_keys = OrderedDict((k, rnd) for k, rnd in self.vote_keys.items() if rnd < from_round)
+
+    # ---------- 管理员操作（在写线程中执行）----------
+    def start_round(self):
+        game_state = self.game_state
+        if game_state['game_ended']:
+            return {'success': False, 'message': '游戏已结束'}
+        if game_state['round_status'] != 'waiting':
+            return {'success': False, 'message': '当前不在等待状态'}
+
+        # ✅ 记录本轮开始时的有效玩家数（balance > 0）
+        current_eligible_count = self.tally.eligible
+        game_state['current_round_eligible'] = current_eligible_count
+
+        game_state['round_status'] = 'voting'
+        game_state['voting_start_time'] = time.time()
+        self.record('round_start', eligible=current_eligible_count,
+                    voting_start_time=game_state['voting_start_time'])
+        self.sync_deadline()
+        self.publish_round()
+        self.publish_votes()
+        return {'success': True}
+
+    def end_round(self):
+        if self.game_state['round_status'] != 'voting':
+            return {'success': False, 'message': '当前不在投票中'}
+        self.settle_round()
+        return {'success': True}
+
+    def reset_current_round(self):
+        if self.game_state['game_ended']:
+            return {'success': False, 'message': '游戏已结束，无法重置本轮'}
+        current_round = self.game_state['current_round']
+        self.reset_round_votes(current_round)
+        self.rebuild_indexes()
+        self.record('round_reset', round=current_round)
+        self.sync_deadline()
+        self.publish_all()
+        return {'success': True, 'message': f'第 {current_round} 轮已重置'}
+
+    def reset_round_votes(self, current_round):
+        self.players.truncate(current_round - 1)
+        self.forget_vote_keys(current_round)
+        self.game_state['round_status'] = 'waiting'
+        self.game_state['voting_start_time'] = None
+
+    def rollback_to_previous(self):
+        current_round = self.game_state['current_round']
+        if current_round <= 1:
+            return {'success': False, 'message': '已是第1轮，无法回退'}
+        prev_round = current_round - 1
+        if not self.snapshots.has_round(prev_round):
+            return {'success': False, 'message': f'未找到第 {prev_round} 轮的快照'}
+        players, game_state = self.snapshots.rebuild(prev_round, self.players)
+        self.snapshots.discard_after(prev_round)
+        self.players.replace(players)
+        self.forget_vote_keys(prev_round + 1)
+        game_id = self.game_state.get('game_id')
+        self.game_state.clear()
+        self.game_state.update(clean_game_state({'game_id': game_id, **game_state}))
+        self.rebuild_indexes()
+        self.record('rollback', round=prev_round, players=self.players.dump(), game_state=self.game_state)
+        self.sync_deadline()
+        self.publish_all()
+        return {'success': True, 'message': f'已回退到第 {prev_round} 轮结束时的状态'}
+
+    def reset_all(self):
+        # 有玩家或已结算过的对局先封存进归档，再清空当前存档；归档失败时不重置，数据还在
+        if len(self.players) or self.game_state.get('round_results'):
+            self.snapshots.ensure_loaded()
+            try:
+                self.archive.add(json.loads(json.dumps(self.game_state)), self.players, self.snapshots.entries())
+            except (OSError, ValueError) as e:
+                traceback.print_exc()
+                return {'success': False, 'message': f'归档失败，未重置：{e}'}
+        self.players.clear()
+        self.vote_keys.clear()
+        self.game_state.clear()
+        self.game_state.update(default_game_state())
+        self.game_state['game_id'] = new_game_id()
+        self.snapshots.reset()
+        self.rebuild_indexes()
+        self.storage.reset()  # 已归档，删除当前存档和快照
+        self.responses.clear()
+        self.touch()
+        self.sync_deadline()
+        self.publish_all()
+        return {'success': True, 'message': '所有数据已重置！'}
+
+    def fix_voting_start_time(self):
+        # ✅ 确保是数字类型
+        start_time = time.time()
+        self.game_state['voting_start_time'] = start_time
+        self.record('game_state', game_state=self.game_state)
+        self.sync_deadline()
+        return start_time
+
+    # ---------- 导出 ----------
+    def export_source(self):
+        # 在写线程中拷贝一份一致的数据，导出在请求线程里慢慢生成；进行中的一轮还没结算，不导出
+        self.snapshots.ensure_loaded()
+        base = self.snapshots.base
+        if base is not None:
+            base = {**base, 'players': base['players'].copy()}
+        return ExportSource(self.game_state.get('game_id'), self.players.copy(), base,
+                            list(self.snapshots.deltas.values()),
+                            dict(self.game_state.get('round_results', {})))
+
+    # ---------- 卸载 ----------
+    def is_idle(self, now, idle_seconds):
+        return (now - self.last_active >= idle_seconds
+                and self.game_state['round_status'] != 'voting'
+                and self.broadcaster.subscriber_count == 0)
+
+    def unload(self):
+        self.save_data()
+        self.storage.flush()
+
+
+class RoomRegistry:
+    def __init__(self, rooms_dir, config, idle_seconds=1800, scheduler=None):
+        self.rooms_dir = rooms_dir
+        self.config = config
+        self.idle_seconds = idle_seconds
+        self.scheduler = scheduler or DeadlineScheduler()
+        self.deadlines_file = os.path.join(rooms_dir, DEADLINES_FILE)
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._pending = None  # room_id -> 投票截止时间（第一次用到时从文件读入）
+        self._pending_lock = threading.Lock()  # 房间加载时（持有 self._lock）也会更新截止时间
+        self._eviction_scheduled = False
+        self._started = False
+
+    def room_dir(self, room_id):
+        # 默认房间沿用原来的文件位置（当前目录），其余房间各占一个子目录
+        if room_id == DEFAULT_ROOM:
+            return '.'
+        return os.path.join(self.rooms_dir, room_id)
+
+    def exists(self, room_id):
+        return (room_id == DEFAULT_ROOM or room_id in self._rooms
+                or os.path.isdir(self.room_dir(room_id)))
+
+    def get(self, room_id, create=False):
+        if not ROOM_ID_RE.match(room_id or ''):
+            return None
+        room = self._rooms.get(room_id)
+        if room is None or room.evicting:
+            with self._lock:
+                room = self._rooms.get(room_id)
+                if room is None:
+                    if not create and not self.exists(room_id):
+                        return None
+                    room = Room(room_id, self.room_dir(room_id), self.config, registry=self)
+                    started = time.perf_counter()
+                    room.load()
+                    elapsed = time.perf_counter() - started
+                    if elapsed > LOAD_WARN_SECONDS:
+                        print(f"⚠️ 房间 {room_id} 加载用时 {elapsed:.2f}s")
+                    self._rooms[room_id] = room
+                    self.schedule_eviction()
+        room.last_active = time.time()
+        return room
+
+    def start(self):
+        # 恢复未到期的投票截止时间、注册退出时落盘；只执行一次（第一个请求或 __main__ 中调用）
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.restore_deadlines()
+        atexit.register(self.flush_all)
+
+    # ---------- 未到期的投票截止时间 ----------
+    def restore_deadlines(self):
+        # 启动时：给还在投票中的房间重新排期（到期时才加载该房间并结算）；已加载的房间自己排过期
+        with self._pending_lock:
+            pending = dict(self._pending_map())
+        for room_id, deadline in pending.items():
+            if room_id in self._rooms:
+                continue
+            self.scheduler.schedule((room_id, 'end'), deadline,
+                                    lambda fired_at, room_id=room_id: self.get(room_id))
+
+    def _pending_map(self):
+        # 第一次用到时从 deadlines.json 读入（调用方持有 _pending_lock）
+        if self._pending is None:
+            self._pending = {}
+            if os.path.exists(self.deadlines_file):
+                try:
+                    with open(self.deadlines_file, 'r', encoding='utf-8') as f:
+                        self._pending.update(json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ 警告：读取 {self.deadlines_file} 失败：{e}")
+        return self._pending
+
+    def set_pending_deadline(self, room_id, deadline):
+        with self._pending_lock:
+            pending = self._pending_map()
+            if pending.get(room_id) == deadline:
+                return
+            if deadline is None:
+                pending.pop(room_id, None)
+            else:
+                pending[room_id] = deadline
+            os.makedirs(self.rooms_dir, exist_ok=True)
+            tmp = self.deadlines_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(pending, f)
+            os.replace(tmp, self.deadlines_file)
+
+    def active_rooms(self):
+        return list(self._rooms.values())
+
+    def subscriber_count(self):
+        # 所有房间当前打开的 /api/stream 连接数
+        return sum(room.broadcaster.subscriber_count for room in self.active_rooms())
+
+    def schedule_eviction(self):
+        if not self._eviction_scheduled:
+            self._eviction_scheduled = True
+            self.scheduler.schedule('evict', time.time() + EVICT_INTERVAL, self.on_evict)
+
+    def on_evict(self, fired_at):
+        self._eviction_scheduled = False
+        self.evict_idle()
+        if self._rooms:
+            self.schedule_eviction()
+
+    def evict_idle(self):
+        now = time.time()
+        for room in self.active_rooms():
+            if room.is_idle(now, self.idle_seconds):
+                room.submit(self.unload_room, room)  # 排在该房间已投递的命令之后执行
+
+    def unload_room(self, room):
+        # 在房间的写线程中：写完检查点并落盘之后才从注册表移除。卸载期间 get() 等在锁上，
+        # 不会在同一份文件上再建一个房间（旧写线程截断日志时会抹掉新实例追加的事件）
+        with self._lock:
+            if not room.is_idle(time.time(), self.idle_seconds):
+                return  # 排队期间又有人访问
+            room.evicting = True
+            try:
+                room.unload()
+            except Exception:
+                room.evicting = False  # 没卸载成功，留在内存里
+                raise
+            if self._rooms.get(room.room_id) is room:
+                del self._rooms[room.room_id]
+
+    def flush_all(self):
+        for room in self.active_rooms():
+            room.storage.flush(5)
@@ -0,0 +1,65 @@
+# ===== 截止时间调度器 =====
+# 所有房间共用一个线程和一个小顶堆：按截止时间精确触发回调（投票结束结算、倒计时推送、
+# 空闲房间卸载），没有到期任务时线程一直睡眠，不再每 5 秒轮询。
+# 同一个 key 重新 schedule 会替换旧任务，cancel 后旧任务在堆里惰性丢弃。
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        self._heap = []          # (deadline, seq, key)
+        self._entries = {}       # key -> (deadline, seq, callback)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, key, deadline, callback):
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = (deadline, seq, callback)
+            heapq.heappush(self._heap, (deadline, seq, key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def deadline(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                callback = None
+                while callback is None:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    if entry is None or entry[1] != seq:
+                        heapq.heappop(self._heap)  # 已取消或已被替换
+                        continue
+                    delay = deadline - time.time()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    del self._entries[key]
+                    callback = entry[2]
+            try:
+                callback(deadline)
+            except Exception as e:
+                print(f"💥 定时任务 {key} 失败：", repr(e))
+                traceback.print_exc()
@@ -0,0 +1,140 @@
+# ===== 结算规则（纯函数）=====
+# (轮次, 红, 金, 银, 本轮有效玩家数) -> Outcome：哪些颜色获奖 / 受罚、是否全员受罚、
+# 是否全体胜利、结果文案。结果按计数元组缓存；余额变化由调用方一次遍历应用。
+# 规则与原先 end_round_logic() / display() 中的 if/else 完全一致：
+#   - 未投票玩家总是 -PENALTY（余额最低为 0）
+#   - penalize_all 时所有玩家（含未投票者）再 -PENALTY
+from collections import namedtuple
+from functools import lru_cache
+
+Rules = namedtuple('Rules', 'max_rounds reward penalty final_round_margin')
+
+# winners / losers：获奖 / 受罚的颜色集合（只作用于本轮已投票玩家）
+Outcome = namedtuple('Outcome', 'won_by_all winners losers penalize_all message')
+
+COLORS = ('red', 'gold', 'silver')
+ALL_COLORS = frozenset(COLORS)
+NONE = frozenset()
+
+
+def settle(rules, current_round, red, gold, silver, eligible):
+    # 有效玩家数只影响最后一轮的全体胜利判定；其余轮次统一成 0 以提高缓存命中
+    if current_round != rules.max_rounds:
+        eligible = 0
+    return _settle(rules, current_round, red, gold, silver, eligible)
+
+
+@lru_cache(maxsize=4096)
+def _settle(rules, current_round, red, gold, silver, eligible):
+    total = red + gold + silver
+    if is_won_by_all(rules, current_round, red, total, eligible):
+        return Outcome(True, NONE, NONE, False, "🎉 全体胜利！")
+
+    winners, losers, penalize_all = NONE, NONE, False
+    if total == 0:
+        pass  # 无人投票：只扣未投票玩家
+    elif total == 1:
+        penalize_all = True  # 唯一玩家投金/银
+    elif red == 0:
+        if gold < silver:
+            winners, losers = frozenset(['gold']), frozenset(['silver', 'red'])
+        elif silver < gold:
+            winners, losers = frozenset(['silver']), frozenset(['gold', 'red'])
+        else:
+            penalize_all = True  # 金 == 银
+    elif red_is_fewest(red, gold, silver):
+        winners, losers = frozenset(['red']), frozenset(['gold', 'silver'])
+    elif current_round != rules.max_rounds:
+        winners, losers = frozenset(['gold', 'silver']), frozenset(['red'])
+    else:
+        # 第8轮红失败：非红单色也可胜，金银都有票则少者胜，平局已投票者全罚
+        if gold == 0 and silver == 0:
+            winner = None
+        elif gold == 0:
+            winner = 'silver'
+        elif silver == 0:
+            winner = 'gold'
+        elif gold < silver:
+            winner = 'gold'
+        elif silver < gold:
+            winner = 'silver'
+        else:
+            winner = None
+        if winner:
+            winners, losers = frozenset([winner]), ALL_COLORS - {winner}
+        else:
+            losers = ALL_COLORS
+
+    return Outcome(False, winners, losers, penalize_all,
+                   result_message(rules, current_round, red, gold, silver))
+
+
+def is_won_by_all(rules, current_round, red, total, eligible):
+    if total == 0:
+        return False
+    # 原有规则：仅1人投票且投红 → 全体胜利
+    if total == 1 and red == 1:
+        return True
+    # 前7轮所有人投红
+    if current_round < rules.max_rounds and red == total:
+        return True
+    # 第8轮红 >= 本轮有效玩家数 - 10
+    if current_round == rules.max_rounds and red >= eligible - rules.final_round_margin:
+        return True
+    return False
+
+
+def red_is_fewest(red, gold, silver):
+    # 红若严格小于所有【有票】的非红颜色，则红胜
+    active_non_red = [n for n in (gold, silver) if n > 0]
+    return bool(active_non_red) and all(red < n for n in active_non_red)
+
+
+def balance_delta(rules, outcome, apple):
+    # apple 为 None 表示本轮未投票。新余额 = max(0, balance + delta)：
+    # 余额总是 >= 0，未投票再全罚时两次 -PENALTY 合并截断结果不变，
+    # 所以一轮的余额变化可以按投票颜色查表，整列计算
+    delta = -rules.penalty if apple is None else 0
+    if outcome.penalize_all:
+        return delta - rules.penalty
+    if apple in outcome.winners:
+        return rules.reward
+    if apple in outcome.losers:
+        return -rules.penalty
+    return delta
+
+
+def result_message(rules, current_round, red, gold, silver):
+    reward, penalty = rules.reward, rules.penalty
+    total = red + gold + silver
+    final = rules.max_rounds
+    if total == 0:
+        return "无人投票"
+    if total == 1:
+        if red == 1:
+            return "唯一玩家投红：全体胜利！"
+        return f"唯一玩家投金/银：全员-{penalty}"
+    if red == 0:
+        if gold == 0 or silver == 0:
+            return f"仅一种非红苹果：全员-{penalty}"
+        if gold < silver:
+            return f"金少胜出：金+{reward}，银-{penalty}"
+        if silver < gold:
+            return f"银少胜出：银+{reward}，金-{penalty}"
+        return f"金银票数相等：全员-{penalty}"
+    if current_round != final:
+        if red_is_fewest(red, gold, silver):
+            return f"红苹果最少：红+{reward}，非红-{penalty}"
+        return f"红未最少：非红全体+{reward}，红-{penalty}"
+    if red_is_fewest(red, gold, silver):
+        return f"第{final}轮红胜：红+{reward}，非红-{penalty}"
+    if gold == 0 and silver == 0:
+        return f"异常：仅有红苹果？全员-{penalty}"
+    if gold == 0 or silver == 0:
+        color_name = "金" if silver == 0 else "银"
+        return f"第{final}轮{color_name}胜：{color_name}+{reward}，其他-{penalty}"
+    if gold < silver:
+        return f"第{final}轮金胜：金+{reward}，银/红-{penalty}"
+    if silver < gold:
+        return f"第{final}轮银胜：银+{reward}，金/红-{penalty}"
+    return f"第{final}轮金银平局：全员-{penalty}"
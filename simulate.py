@@ -0,0 +1,355 @@
+# ===== 离线蒙特卡洛模拟 =====
+# 一次模拟成千上万局：每一轮所有局的投票是一个 (局数, 玩家数) 的投票代码矩阵（0 未投，1 红，2 金，3 银），
+# 计票、余额更新都是整批 NumPy 运算。结算规则不另写一份：每轮把各局的 (轮次, 红, 金, 银, 有效玩家数)
+# 去重后逐个交给 settlement.settle()（有缓存），再用 balance_delta() 得到每种投票代码的余额变化，
+# 所以全体胜利条件、余额不低于 0、未投票扣分都与服务器完全一致。
+# 玩家策略可插拔（@strategy 注册），可以按比例混合；--workers 用进程池并行，--sweep 做参数扫描。
+#
+#   python simulate.py --games 1000000 --strategy uniform
+#   python simulate.py --games 200000 --mix uniform=0.7 red=0.3 --sweep penalty=1000,2000,3000
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 只有模拟器需要，服务器本身不依赖
+    np = None
+
+from players import APPLES
+from settlement import Rules, settle, balance_delta
+
+# 与 app.py 的默认配置一致
+DEFAULT_PLAYERS = 70
+DEFAULT_START_BALANCE = 10000
+DEFAULT_RULES = Rules(max_rounds=8, reward=1000, penalty=2000, final_round_margin=10)
+BATCH_GAMES = 20000  # 每批同时模拟的局数（控制内存：批大小 × 玩家数 × 8 字节）
+
+RED, GOLD, SILVER = 1, 2, 3
+
+# 策略看到的信息：本轮轮次、各局余额、上一轮各局的 (红, 金, 银) 票数（第 1 轮为 None）
+Context = namedtuple('Context', 'round balances last_counts rules')
+
+
+# ---------- 策略 ----------
+STRATEGIES = {}
+
+
+def strategy(name):
+    # 注册策略：fn(rng, ctx, n_players, **params) -> (局数, n_players) 的 uint8 投票代码
+    def decorator(fn):
+        STRATEGIES[name] = fn
+        return fn
+    return decorator
+
+
+def random_codes(rng, shape, p_red, p_gold, p_silver, abstain=0.0):
+    # 以概率 abstain 不投，其余按 红:金:银 的比例投
+    p = np.array([0, p_red, p_gold, p_silver], dtype=float)
+    p *= (1 - abstain) / p.sum()
+    p[0] = abstain
+    return rng.choice(4, size=shape, p=p).astype(np.uint8)
+
+
+@strategy('uniform')
+def uniform(rng, ctx, n, abstain=0.0):
+    return random_codes(rng, (len(ctx.balances), n), 1, 1, 1, float(abstain))
+
+
+@strategy('red')
+def mostly_red(rng, ctx, n, p=0.8, abstain=0.0):
+    # 以概率 p 投红，其余平分金银
+    p = float(p)
+    rest = (1 - p) / 2
+    return random_codes(rng, (len(ctx.balances), n), p, rest, rest, float(abstain))
+
+
+@strategy('abstain')
+def abstain(rng, ctx, n):
+    return np.zeros((len(ctx.balances), n), dtype=np.uint8)
+
+
+@strategy('contrarian')
+def contrarian(rng, ctx, n, p=0.7):
+    # 以概率 p 投上一轮票数最少的颜色（第 1 轮随机），其余随机
+    games = len(ctx.balances)
+    codes = rng.integers(1, 4, size=(games, n), dtype=np.uint8)
+    if ctx.last_counts is None:
+        return codes
+    fewest = (np.argmin(ctx.last_counts, axis=1) + 1).astype(np.uint8)
+    follow = rng.random((games, n)) < float(p)
+    return np.where(follow, fewest[:, None], codes)
+
+
+@strategy('final_red')
+def final_red(rng, ctx, n, p=0.9):
+    # 前几轮随机，最后一轮以概率 p 投红（试探第 8 轮全体胜利条件）
+    games = len(ctx.balances)
+    if ctx.round != ctx.rules.max_rounds:
+        return rng.integers(1, 4, size=(games, n), dtype=np.uint8)
+    rest = (1 - float(p)) / 2
+    return random_codes(rng, (games, n), float(p), rest, rest)
+
+
+def parse_strategy(spec):
+    # 'name' 或 'name:key=value,key=value'
+    name, _, params = spec.partition(':')
+    if name not in STRATEGIES:
+        raise SystemExit(f'未知策略 {name!r}，可选：{", ".join(sorted(STRATEGIES))}')
+    kwargs = dict(item.split('=', 1) for item in params.split(',') if item)
+    return name, kwargs
+
+
+def player_groups(n_players, mix):
+    # mix: [(策略规格, 比例)] -> [(起始列, 结束列, 策略名, 参数)]，按比例划分玩家
+    total = sum(weight for _, weight in mix)
+    groups, start = [], 0
+    for i, (spec, weight) in enumerate(mix):
+        end = n_players if i == len(mix) - 1 else start + round(n_players * weight / total)
+        name, kwargs = parse_strategy(spec)
+        groups.append((start, end, name, kwargs))
+        start = end
+    return groups
+
+
+# ---------- 结算（复用 settlement.py）----------
+def settle_batch(rules, rnd, red, gold, silver, eligible):
+    # 各局 (红, 金, 银, 有效玩家数) 去重后逐个 settle()，返回 (每局的投票代码 -> 余额变化表, 全体胜利, 文案)
+    n = int(max(red.max(), gold.max(), silver.max(), eligible.max())) + 1
+    if rnd != rules.max_rounds:
+        eligible = np.zeros_like(eligible)  # 与 settle() 一致：只有最后一轮用到有效玩家数
+    keys = ((red.astype(np.int64) * n + gold) * n + silver) * n + eligible
+    unique, inverse = np.unique(keys, return_inverse=True)
+    deltas = np.empty((len(unique), len(APPLES)), dtype=np.int64)
+    won = np.empty(len(unique), dtype=bool)
+    messages = []
+    for i, key in enumerate(unique.tolist()):
+        key, e = divmod(key, n)
+        key, s = divmod(key, n)
+        r, g = divmod(key, n)
+        outcome = settle(rules, rnd, r, g, s, e)
+        deltas[i] = [balance_delta(rules, outcome, apple) for apple in APPLES]
+        won[i] = outcome.won_by_all
+        messages.append(outcome.message)
+    return deltas[inverse], won[inverse], inverse, messages
+
+
+# ---------- 模拟 ----------
+def simulate_batch(rng, games, n_players, start_balance, rules, groups):
+    balances = np.full((games, n_players), start_balance, dtype=np.int64)
+    alive = np.ones(games, dtype=bool)         # 尚未结束的局
+    won_by_all = np.zeros(games, dtype=bool)
+    end_round = np.full(games, rules.max_rounds, dtype=np.int64)
+    last_counts = None
+    messages = Counter()
+    rows = np.arange(games)
+
+    for rnd in range(1, rules.max_rounds + 1):
+        idx = rows[alive]
+        if not len(idx):
+            break
+        bal = balances[idx]
+        ctx = Context(rnd, bal, None if last_counts is None else last_counts[idx], rules)
+        codes = np.empty(bal.shape, dtype=np.uint8)
+        for start, end, name, kwargs in groups:
+            codes[:, start:end] = STRATEGIES[name](rng, ctx, end - start, **kwargs)
+        eligible_mask = bal > 0
+        codes[~eligible_mask] = 0               # 余额为 0 不能投票
+        red = (codes == RED).sum(axis=1)
+        gold = (codes == GOLD).sum(axis=1)
+        silver = (codes == SILVER).sum(axis=1)
+        eligible = eligible_mask.sum(axis=1)
+
+        deltas, won, inverse, texts = settle_batch(rules, rnd, red, gold, silver, eligible)
+        for i, count in enumerate(np.bincount(inverse, minlength=len(texts)).tolist()):
+            messages[(rnd, texts[i])] += count
+        change = np.take_along_axis(deltas, codes.astype(np.intp), axis=1)
+        balances[idx] = np.maximum(bal + change, 0)
+
+        if last_counts is None:
+            last_counts = np.zeros((games, 3), dtype=np.int64)
+        last_counts[idx] = np.stack([red, gold, silver], axis=1)
+        won_idx = idx[won]
+        won_by_all[won_idx] = True
+        end_round[won_idx] = rnd
+        alive[won_idx] = False
+
+    return balances, won_by_all, end_round, messages
+
+
+def empty_summary():
+    return {'games': 0, 'won_by_all': 0, 'end_round': Counter(), 'balances': Counter(),
+            'game_mean': Counter(), 'messages': Counter()}
+
+
+def run_chunk(args):
+    # 进程池任务：模拟 games 局，返回可合并的计数
+    games, n_players, start_balance, rules, groups, seed = args
+    rng = np.random.default_rng(seed)
+    summary = empty_summary()
+    while games > 0:
+        batch = min(games, BATCH_GAMES)
+        balances, won, end_round, messages = simulate_batch(rng, batch, n_players, start_balance, rules, groups)
+        summary['games'] += batch
+        summary['won_by_all'] += int(won.sum())
+        summary['end_round'].update(dict(zip(*(a.tolist() for a in np.unique(end_round, return_counts=True)))))
+        summary['balances'].update(dict(zip(*(a.tolist() for a in np.unique(balances, return_counts=True)))))
+        # 每局玩家平均余额，按 REWARD/PENALTY 的最大公约数分桶
+        step = math.gcd(rules.reward, rules.penalty) or 1
+        means = (balances.mean(axis=1) // step * step).astype(np.int64)
+        summary['game_mean'].update(dict(zip(*(a.tolist() for a in np.unique(means, return_counts=True)))))
+        summary['messages'].update(messages)
+        games -= batch
+    return summary
+
+
+def merge(total, part):
+    total['games'] += part['games']
+    total['won_by_all'] += part['won_by_all']
+    for key in ('end_round', 'balances', 'game_mean', 'messages'):
+        total[key].update(part[key])
+    return total
+
+
+def quantile(counter, q):
+    # Counter {值: 次数} 的分位数
+    total = sum(counter.values())
+    target = q * total
+    seen = 0
+    for value in sorted(counter):
+        seen += counter[value]
+        if seen >= target:
+            return value
+    return None
+
+
+def simulate(games, n_players=DEFAULT_PLAYERS, start_balance=DEFAULT_START_BALANCE, rules=DEFAULT_RULES,
+             mix=(('uniform', 1),), workers=1, seed=None):
+    if np is None:
+        raise SystemExit('simulate.py 需要 NumPy：pip install numpy')
+    groups = player_groups(n_players, list(mix))
+    workers = max(1, workers)
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    chunks = [games // workers + (1 if i < games % workers else 0) for i in range(workers)]
+    jobs = [(n, n_players, start_balance, rules, groups, s) for n, s in zip(chunks, seeds) if n]
+    started = time.perf_counter()
+    if workers == 1:
+        parts = [run_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(run_chunk, jobs))
+    summary = empty_summary()
+    for part in parts:
+        merge(summary, part)
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def report(summary, rules, n_players):
+    games = summary['games']
+    players = games * n_players
+    balances = summary['balances']
+    result = {
+        'games': games,
+        'seconds': round(summary['seconds'], 3),
+        'games_per_min': round(games / summary['seconds'] * 60) if summary['seconds'] else None,
+        'won_by_all_rate': summary['won_by_all'] / games,
+        'end_round': {r: n / games for r, n in sorted(summary['end_round'].items())},
+        'player_balance': {
+            'mean': sum(b * n for b, n in balances.items()) / players,
+            'p5': quantile(balances, 0.05),
+            'p50': quantile(balances, 0.5),
+            'p95': quantile(balances, 0.95),
+            'bankrupt_rate': balances.get(0, 0) / players,
+        },
+        'game_mean_balance': {
+            'p5': quantile(summary['game_mean'], 0.05),
+            'p50': quantile(summary['game_mean'], 0.5),
+            'p95': quantile(summary['game_mean'], 0.95),
+        },
+        'outcomes': {},
+    }
+    for (rnd, message), n in sorted(summary['messages'].items(), key=lambda kv: (kv[0][0], -kv[1])):
+        result['outcomes'].setdefault(rnd, {})[message] = n / games
+    return result
+
+
+def print_report(result, rules, label):
+    print(f"\n== {label} ==")
+    print(f"{result['games']} 局，{result['seconds']}s（{result['games_per_min']} 局/分钟）")
+    print(f"全体胜利：{result['won_by_all_rate']:.2%}")
+    print('结束轮次：' + '  '.join(f'{r}:{p:.2%}' for r, p in result['end_round'].items()))
+    b = result['player_balance']
+    print(f"玩家余额：均值 {b['mean']:.0f}，p5 {b['p5']}，p50 {b['p50']}，p95 {b['p95']}，"
+          f"破产 {b['bankrupt_rate']:.2%}")
+    g = result['game_mean_balance']
+    print(f"每局平均余额：p5 {g['p5']}，p50 {g['p50']}，p95 {g['p95']}")
+    for rnd, outcomes in result['outcomes'].items():
+        top = list(outcomes.items())[:3]
+        print(f'第{rnd}轮：' + '；'.join(f'{m} {p:.1%}' for m, p in top))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='伊甸园游戏蒙特卡洛模拟')
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--players', type=int, default=DEFAULT_PLAYERS)
+    parser.add_argument('--start-balance', type=int, default=DEFAULT_START_BALANCE)
+    parser.add_argument('--reward', type=int, default=DEFAULT_RULES.reward)
+    parser.add_argument('--penalty', type=int, default=DEFAULT_RULES.penalty)
+    parser.add_argument('--max-rounds', type=int, default=DEFAULT_RULES.max_rounds)
+    parser.add_argument('--margin', type=int, default=DEFAULT_RULES.final_round_margin,
+                        help='最后一轮：红 >= 有效玩家数 - margin 即全体胜利')
+    parser.add_argument('--strategy', default='uniform',
+                        help=f'所有玩家使用的策略，name 或 name:key=value,…（{", ".join(sorted(STRATEGIES))}）')
+    parser.add_argument('--mix', nargs='+', metavar='STRATEGY=WEIGHT',
+                        help='按比例混合策略，例如 uniform=0.7 red:p=0.9=0.3')
+    parser.add_argument('--sweep', action='append', default=[], metavar='PARAM=V1,V2',
+                        help='参数扫描（reward / penalty / max_rounds / margin / start_balance / players），可重复')
+    parser.add_argument('--workers', type=int, default=1, help=f'进程数（本机 {os.cpu_count()} 核）')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+    if np is None:
+        sys.exit('simulate.py 需要 NumPy：pip install numpy')
+
+    if args.mix:
+        mix = []
+        for item in args.mix:
+            spec, _, weight = item.rpartition('=')
+            mix.append((spec, float(weight)))
+    else:
+        mix = [(args.strategy, 1)]
+
+    base = {'reward': args.reward, 'penalty': args.penalty, 'max_rounds': args.max_rounds,
+            'margin': args.margin, 'start_balance': args.start_balance, 'players': args.players}
+    sweeps = []
+    for item in args.sweep:
+        key, _, values = item.partition('=')
+        if key not in base:
+            sys.exit(f'不能扫描参数 {key!r}，可选：{", ".join(base)}')
+        sweeps.append([(key, int(v)) for v in values.split(',')])
+
+    results = []
+    for combo in itertools.product(*sweeps):
+        params = {**base, **dict(combo)}
+        rules = Rules(params['max_rounds'], params['reward'], params['penalty'], params['margin'])
+        summary = simulate(args.games, params['players'], params['start_balance'], rules, mix,
+                           workers=args.workers, seed=args.seed)
+        result = report(summary, rules, params['players'])
+        label = ', '.join(f'{k}={v}' for k, v in combo) or '默认参数'
+        print_report(result, rules, label)
+        results.append({'params': params, 'strategy': mix, **result})
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
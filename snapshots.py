@@ -0,0 +1,174 @@
+# ===== 增量轮次快照 =====
+# 不再每轮深拷贝全部玩家并重写整个 snapshots.json：
+#   - base：某一轮结束时的完整状态（第一次结算前的状态，或被合并后的旧轮次）
+#   - deltas：之后每轮一条，只记录余额变化 (before, after)、本轮投票和结算后的 game_state
+# 快照由存储后端追加保存（snapshots.jsonl 或 SQLite 的 snapshots 表）；超过保留轮数时把最旧的增量
+# 合并进 base 并整体重写，内存和磁盘占用都有上限。回退时从当前状态撤销增量，或从 base 重放增量，取步数少的一种。
+# 启动时不读快照：第一次结算或回退时才加载。
+import json
+from collections import OrderedDict
+
+from players import PlayerStore
+
+
+class SnapshotLog:
+    def __init__(self, store, retention=8):
+        self.store = store              # storage.JsonStorage / SqliteStorage
+        self.retention = retention
+        self.base = None                # {'round', 'players': PlayerStore, 'game_state'}
+        self.deltas = OrderedDict()     # 轮次 -> {'round', 'balances', 'votes', 'game_state'}
+        self.loaded = False
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            self.load()
+        except Exception as e:
+            self.base = None
+            self.deltas.clear()
+            print(f"⚠️ 警告：加载快照失败，无法回退到之前的轮次。错误：{e}")
+
+    # ---------- 加载 / 保存 ----------
+    def load(self):
+        self.base = None
+        self.deltas.clear()
+        for entry in self.store.load_snapshots():
+            if entry.get('base'):
+                self.base = decode_base(entry)
+                self.deltas.clear()
+            else:
+                delta = decode_delta(entry)
+                self.deltas[delta['round']] = delta
+        legacy = self.store.load_legacy_snapshots()  # 旧版 snapshots.json（每轮完整拷贝）
+        if legacy:
+            self.convert_legacy(legacy)
+            self.rewrite()
+
+    def convert_legacy(self, legacy):
+        # {轮次: {'players', 'game_state'}} -> base + 相邻两轮之间的增量
+        rounds = sorted(int(r) for r in legacy)
+        if not rounds:
+            return
+        first = legacy[str(rounds[0])]
+        self.base = decode_base({'round': rounds[0], 'players': first['players'],
+                                 'game_state': first['game_state']})
+        prev = self.base['players']
+        for rnd in rounds[1:]:
+            snap = legacy[str(rnd)]
+            players = PlayerStore.from_json(snap['players'])
+            balances = {pid: (prev.balance(pid) if pid in prev else balance, balance)
+                        for pid, balance in players.balance_items()}
+            self.deltas[rnd] = {'round': rnd, 'game_state': snap['game_state'],
+                                'balances': {pid: b for pid, b in balances.items() if b[0] != b[1]},
+                                'votes': players.round_votes(rnd)}
+            prev = players
+
+    def entries(self):
+        # 存储 / 归档用的形式：可选的 base + 各轮增量
+        entries = []
+        if self.base is not None:
+            entries.append({'base': True, **self.base, 'players': self.base['players'].dump()})
+        entries.extend(self.deltas.values())
+        return entries
+
+    def rewrite(self):
+        self.store.replace_snapshots(self.entries())
+
+    def reset(self):
+        # 只清内存；文件 / 表由存储后端的 reset() 删除
+        self.base = None
+        self.deltas.clear()
+        self.loaded = True
+
+    # ---------- 记录 ----------
+    def record(self, round_num, changed, votes, game_state, base_fn):
+        # changed: pid -> (before, after)；votes: pid -> 本轮选择
+        # base_fn() 返回本轮结算前的完整状态，只在还没有 base 时调用一次
+        self.ensure_loaded()
+        if self.base is None:
+            self.base = base_fn()
+            self.deltas.clear()
+        stale = [r for r in self.deltas if r >= round_num]
+        for rnd in stale:
+            del self.deltas[rnd]  # 回退后重新结算同一轮
+        delta = {'round': round_num, 'balances': changed, 'votes': votes,
+                 'game_state': json.loads(json.dumps(game_state))}
+        self.deltas[round_num] = delta
+        if stale or len(self.deltas) > self.retention or len(self.deltas) == 1:
+            while len(self.deltas) > self.retention:
+                self.fold_oldest()
+            self.rewrite()  # 新的 base / 合并后的 base 要整体写入
+        else:
+            self.store.append_snapshot(delta)
+
+    def fold_oldest(self):
+        # 把最旧的增量合并进 base，超出保留范围的轮次不再能回退
+        rnd, delta = self.deltas.popitem(last=False)
+        apply_delta(self.base['players'], delta)
+        self.base['round'] = rnd
+        self.base['game_state'] = delta['game_state']
+
+    # ---------- 重建 ----------
+    def has_round(self, rnd):
+        self.ensure_loaded()
+        return rnd in self.deltas or (self.base is not None and self.base['round'] == rnd)
+
+    def rebuild(self, rnd, players):
+        # 返回第 rnd 轮结束时的 (PlayerStore, game_state)；players 为当前状态，不会被修改
+        later = [r for r in self.deltas if r > rnd]
+        base_round = self.base['round']
+        if len(later) <= len(self.deltas) - len(later) or rnd == base_round:
+            rebuilt = undo(players, [self.deltas[r] for r in reversed(later)], rnd)
+        else:
+            rebuilt = replay(self.base['players'], [self.deltas[r] for r in self.deltas if r <= rnd])
+        game_state = self.deltas[rnd]['game_state'] if rnd in self.deltas else self.base['game_state']
+        return rebuilt, dict(game_state)
+
+    def discard_after(self, rnd):
+        self.ensure_loaded()
+        later = [r for r in self.deltas if r > rnd]
+        if later:
+            for r in later:
+                del self.deltas[r]
+            self.rewrite()
+
+
+def undo(players, deltas, rnd):
+    # 从当前状态逐轮撤销：余额恢复为 before，丢弃第 rnd 轮之后的投票
+    rebuilt = players.copy()
+    for delta in deltas:
+        for pid, (before, after) in delta['balances'].items():
+            if pid in rebuilt:
+                rebuilt.set_balance(pid, before)
+    rebuilt.truncate(rnd)
+    return rebuilt
+
+
+def replay(base_players, deltas):
+    rebuilt = base_players.copy()
+    for delta in deltas:
+        apply_delta(rebuilt, delta)
+    return rebuilt
+
+
+def apply_delta(players, delta):
+    rnd = delta['round']
+    players.truncate(rnd - 1)
+    for pid, apple in delta['votes'].items():
+        players.set_vote(pid, rnd, apple)
+    for pid, (before, after) in delta['balances'].items():
+        players.set_balance(pid, after)
+
+
+def decode_base(entry):
+    return {'round': int(entry['round']), 'players': PlayerStore.from_json(entry['players']),
+            'game_state': entry['game_state']}
+
+
+def decode_delta(entry):
+    return {'round': int(entry['round']),
+            'balances': {int(pid): tuple(b) for pid, b in entry['balances'].items()},
+            'votes': {int(pid): apple for pid, apple in entry['votes'].items()},
+            'game_state': entry['game_state']}
@@ -0,0 +1,126 @@
+function startRound() {
+  if (gameEnded) {
+    alert('游戏已结束，无法开始新轮次。');
+    return;
+  }
+  fetch(base + '/admin/start_round', { method: 'POST' })
+    .then(r => r.json())
+    .then(data => {
+      if (data.success) {
+        location.reload();
+      } else {
+        alert('❌ ' + data.message);
+      }
+    })
+    .catch(err => {
+      console.error(err);
+      alert('网络错误');
+    });
+}
+
+function endRound() {
+  if (gameEnded) {
+    alert('游戏已结束。');
+    return;
+  }
+  if (!confirm('确定要手动结算本轮吗？')) return;
+  fetch(base + '/admin/end_round', { method: 'POST' })
+    .then(r => r.json())
+    .then(data => {
+      if (data.success) {
+        location.reload();
+      } else {
+        alert('❌ ' + data.message);
+      }
+    })
+    .catch(err => {
+      console.error(err);
+      alert('网络错误');
+    });
+}
+
+function resetCurrentRound() {
+  if (!confirm('确定要重置本轮吗？所有本轮投票将被清空，但玩家余额保留。')) return;
+  fetch(base + '/admin/reset_current_round', { method: 'POST' })
+    .then(r => r.json())
+    .then(data => {
+      alert(data.message);
+      location.reload();
+    })
+    .catch(err => {
+      console.error(err);
+      alert('操作失败');
+    });
+}
+
+function rollbackToPrevious() {
+  if (!confirm('⚠️ 确定要回退到上一轮吗？当前轮次所有数据将丢失！')) return;
+  fetch(base + '/admin/rollback_to_previous', { method: 'POST' })
+    .then(r => r.json())
+    .then(data => {
+      alert(data.message);
+      location.reload();
+    })
+    .catch(err => {
+      console.error(err);
+      alert('操作失败');
+    });
+}
+
+function resetAllData() {
+  if (!confirm('💥 警告：这将删除所有玩家和游戏进度！\n确定要彻底重置吗？')) return;
+  fetch(base + '/admin/reset_all', { method: 'POST' })
+    .then(r => r.json())
+    .then(data => {
+      alert(data.message);
+      location.reload();
+    })
+    .catch(err => {
+      console.error(err);
+      alert('操作失败');
+    });
+}
+
+// === 实时推送（SSE），取代每 2 秒轮询 ===
+function updateVoteStatus(data) {
+  const voteProgress = document.getElementById('voteProgress');
+  if (!voteProgress) return;
+  if (data.in_voting) {
+    voteProgress.style.display = 'block';
+    const votedEl = document.getElementById('votedCount');
+    const totalEl = document.getElementById('totalCount');
+    if (votedEl && totalEl) {
+      votedEl.textContent = data.voted_players;
+      totalEl.textContent = data.total_players;
+
+      if (data.voted_players === data.total_players && data.total_players > 0) {
+        voteProgress.innerHTML = '✅ 全员已投票，正在结算...';
+      }
+    }
+  } else {
+    voteProgress.style.display = 'none';
+  }
+}
+
+fetch('/admin/metrics_panel')
+  .then(r => r.text())
+  .then(html => { document.getElementById('metricsPanel').innerHTML = html; })
+  .catch(err => console.error(err));
+
+// 轮次状态变化（开始 / 结算 / 回退）时 subscribeRoom 会重新加载，刷新按钮和状态
+subscribeRoom(base, { currentRound, roundStatus, gameEnded }, {
+  votes: updateVoteStatus,
+
+  tick: data => {
+    const el = document.getElementById('remainingTime');
+    if (el && data.remaining !== null) el.textContent = data.remaining;
+  },
+
+  leaderboard: data => {
+    const board = document.getElementById('leaderboard');
+    board.innerHTML = data.top.slice(0, 15)
+      .map(p => `<div>#${p.id}：¥${p.balance}</div>`).join('');
+    const totalEl = document.getElementById('totalPlayers');
+    if (totalEl) totalEl.textContent = data.total_players;
+  }
+});
@@ -0,0 +1,58 @@
+function updateVoteStatus(data) {
+  const voteProgress = document.getElementById('voteProgress');
+  const voteText = document.getElementById('voteText');
+  const votedEl = document.getElementById('votedCount');
+  const totalEl = document.getElementById('totalCount');
+  if (!voteProgress || !voteText) return;
+
+  // 如果不在投票阶段，隐藏但保持占位
+  if (roundStatus !== 'voting' || gameEnded || !data.in_voting) {
+    voteProgress.style.visibility = 'hidden';
+    voteText.style.display = 'none';
+    return;
+  }
+
+  const voted = data.voted_players || 0;
+  const total = data.total_players || 0;
+
+  if (votedEl && totalEl) {
+    votedEl.textContent = voted;
+    totalEl.textContent = total;
+  }
+
+  // 显示文字
+  voteText.style.display = 'inline';
+
+  // 全员投完提示
+  if (total > 0 && voted >= total) {
+    voteText.innerHTML = '✅ 全员已投票！';
+  }
+
+  // 确保容器可见
+  voteProgress.style.visibility = 'visible';
+}
+
+// 初始化：非投票阶段直接隐藏
+updateVoteStatus({ in_voting: false });
+
+// 轮次状态变化时 subscribeRoom 重新渲染整页（结果面板、全体胜利界面等）
+subscribeRoom(base, { currentRound, roundStatus, gameEnded }, {
+  votes: updateVoteStatus,
+
+  tick: data => {
+    const el = document.getElementById('countdown');
+    if (el && data.remaining !== null) {
+      const mm = String(Math.floor(data.remaining / 60)).padStart(2, '0');
+      const ss = String(data.remaining % 60).padStart(2, '0');
+      el.textContent = `${mm}:${ss}`;
+    }
+  },
+
+  leaderboard: data => {
+    const board = document.getElementById('leaderboard');
+    if (!board) return;
+    board.innerHTML = data.top
+      .map(p => `<div class="player-item">#${p.id} ¥${p.balance}</div>`).join('');
+    document.getElementById('leaderboardSize').textContent = data.top.length;
+  }
+});
@@ -0,0 +1,128 @@
+// 按钮绑定
+const buttons = document.querySelectorAll('.apple-btn');
+const confirmBtn = document.getElementById('confirmBtn');
+const statusEl = document.getElementById('status');
+const balanceEl = document.getElementById('balance');
+const rankEl = document.getElementById('rank');
+const bankruptEl = document.getElementById('bankrupt');
+const outcomeEl = document.getElementById('lastOutcome');
+let selectedApple = null;
+let deadline = null;  // 本轮截止时间（本机时钟，毫秒）
+
+// 更新 UI
+function updateUI() {
+  const { voted, game_ended, bankrupt, round_status } = currentState;
+  const isDisabled = voted || game_ended || bankrupt;
+
+  buttons.forEach(btn => btn.classList.toggle('disabled', isDisabled));
+  confirmBtn.disabled = isDisabled;
+  confirmBtn.textContent = game_ended || voted ? '✅ 已提交' : '请选择后确认';
+  if (game_ended) {
+    statusEl.textContent = '🏁 游戏已结束！';
+  } else if (voted) {
+    statusEl.textContent = '✅ 你已提交选择';
+  } else if (round_status !== 'voting') {
+    statusEl.textContent = '⏳ 等待本轮开始';
+  } else {
+    const remaining = deadline === null ? null : Math.max(0, Math.round((deadline - Date.now()) / 1000));
+    statusEl.textContent = '请选择一个苹果，然后点击“确认”' + (remaining === null ? '' : `（剩余 ${remaining} 秒）`);
+  }
+}
+
+// 长轮询拿到的新状态
+function applyState(state) {
+  if (state.current_round !== currentState.current_round) {
+    selectedApple = null;
+    buttons.forEach(b => b.classList.remove('selected'));
+    voteKey = newVoteKey();  // 新的一轮用新的幂等键
+  }
+  currentState = state;
+  deadline = state.remaining_time === null ? null : Date.now() + state.remaining_time * 1000;
+
+  balanceEl.textContent = `余额：¥${state.balance}`;
+  rankEl.style.display = state.rank ? '' : 'none';
+  rankEl.textContent = `排名：第 ${state.rank} / ${state.total_players} 名`;
+  bankruptEl.style.display = state.bankrupt ? '' : 'none';
+  const outcome = state.last_outcome;
+  outcomeEl.style.display = outcome ? '' : 'none';
+  outcomeEl.textContent = outcome ? `第 ${outcome.round} 轮结果：${outcome.message}` : '';
+  updateUI();
+}
+
+// 苹果点击事件
+buttons.forEach(btn => {
+  btn.addEventListener('click', () => {
+    if (currentState.voted || currentState.game_ended || currentState.bankrupt) return;
+    buttons.forEach(b => b.classList.remove('selected'));
+    btn.classList.add('selected');
+    selectedApple = btn.dataset.type;
+    confirmBtn.textContent = '确认选择';
+  });
+});
+
+// 本轮投票的幂等键：网络重试时带同一个键，服务端不会报“你已投票”
+function newVoteKey() {
+  return (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID()
+    : `${playerId}-${currentState.current_round}-${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+let voteKey = newVoteKey();
+
+// 提交投票
+confirmBtn.addEventListener('click', () => {
+  if (!selectedApple || currentState.voted || currentState.game_ended) return;
+  fetch(base + '/api/vote', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ playerId, apple: selectedApple, idempotencyKey: voteKey })
+  })
+  .then(res => res.json())
+  .then(data => {
+    if (data.success) {
+      currentState.voted = true;
+      updateUI();
+    } else {
+      alert('❌ ' + data.message);
+    }
+  })
+  .catch(() => alert('网络错误，请重试'));
+});
+
+// 状态长轮询：带上已有的 version，服务端在轮次 / 状态变化时才返回（或超时后原样返回）
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+const stateUrl = `${base}/api/player/${playerId}/state`;
+
+async function fetchState(since) {
+  const url = since ? `${stateUrl}?since_version=${encodeURIComponent(since)}` : stateUrl;
+  const res = await fetch(url, { cache: 'no-store' });
+  if (res.status === 429 || res.status === 503) {
+    await sleep((parseInt(res.headers.get('Retry-After'), 10) || 2) * 1000);
+    return;
+  }
+  if (!res.ok) throw new Error(res.status);
+  applyState(await res.json());
+}
+
+async function pollState() {
+  while (true) {
+    try {
+      await fetchState(currentState.version);
+    } catch (e) {
+      await sleep(3000);  // 断网 / 服务重启：稍后重试
+    }
+  }
+}
+
+// 刷新按钮：立即取一次最新状态，不再整页重新加载
+document.getElementById('refreshBtn').addEventListener('click', () => {
+  fetchState(null).catch(() => alert('网络错误，请重试'));
+});
+
+// 投票中每秒更新剩余时间
+setInterval(() => {
+  if (deadline !== null && !currentState.voted && !currentState.game_ended) updateUI();
+}, 1000);
+
+// 初始化
+applyState(currentState);
+pollState();
@@ -0,0 +1,19 @@
+// 大屏和管理页共用：订阅 /api/stream，按事件名分发；
+// 轮次状态（轮次 / 状态 / 是否结束）和页面渲染时不一致就整页重新加载
+function subscribeRoom(base, page, handlers) {
+  const events = new EventSource(base + '/api/stream');
+
+  Object.entries(handlers).forEach(([name, handler]) => {
+    events.addEventListener(name, e => handler(JSON.parse(e.data)));
+  });
+
+  events.addEventListener('round', e => {
+    const data = JSON.parse(e.data);
+    if (data.current_round !== page.currentRound || data.round_status !== page.roundStatus
+        || data.game_ended !== page.gameEnded) {
+      events.close();
+      location.reload();
+    }
+  });
+  return events;
+}
@@ -0,0 +1,392 @@
+# ===== 存储后端 =====
+# 房间只通过这里读写磁盘，后端由 EDEN_STORAGE（或 GameConfig.storage）选择：
+#   json    默认。game_journal.jsonl 追加日志 + game_data.json 检查点 + snapshots.jsonl 增量快照
+#   sqlite  game_data.sqlite3（WAL 模式）。players / votes(round, pid, 幂等键) / round_outcomes / snapshots 各一张表，
+#           每个事件直接变成几条参数化 SQL，由后台写线程按批放进一个事务提交，一次投票只写一行。
+# 两个后端的接口相同：
+#   load() -> (检查点状态 或 None, 其后需要重放的事件)；状态里的 vote_keys 是投票幂等键 [(玩家ID, 键, 轮次)]
+#   append(event, game_state) -> Future（落盘后完成，失败时带 StorageError）
+#   needs_checkpoint()、checkpoint(state)、flush(timeout)、reset()
+#   recover()：一次写入失败后，之后排队的写入都直接失败、不落盘；recover() 等它们处理完再恢复写盘，
+#              调用方随后重新 load()，内存回到磁盘上最后一次成功落盘的状态
+#   load_snapshots() / append_snapshot(entry) / replace_snapshots(entries)
+# 文件损坏时不再静默重置：把损坏的文件改名为 *.corrupt-<时间戳> 留作排查，再从空状态开始。
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from journal import Journal, StorageError, WRITER_IDLE_SECONDS
+from players import PlayerStore
+
+DATA_FILE = 'game_data.json'
+JOURNAL_FILE = 'game_journal.jsonl'
+SNAPSHOT_FILE = 'snapshots.jsonl'         # 每轮增量快照（追加写）
+LEGACY_SNAPSHOT_FILE = 'snapshots.json'   # 旧版：每轮完整拷贝，加载时转换
+SQLITE_FILE = 'game_data.sqlite3'
+DEFAULT_BACKEND = 'json'
+COMMIT_ATTEMPTS = 3        # SQLite 暂时性错误（锁 / I/O）时整批重试几次
+COMMIT_RETRY_DELAY = 0.05  # 第一次重试前等待的秒数，之后每次翻倍
+
+
+def quarantine(*paths):
+    # 把损坏的文件移到一边（不删除），返回新路径
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    moved = []
+    for path in paths:
+        if os.path.exists(path):
+            target = f'{path}.corrupt-{stamp}'
+            os.replace(path, target)
+            moved.append(target)
+    return moved
+
+
+class JsonStorage:
+    name = 'json'
+
+    def __init__(self, data_dir, start_balance, checkpoint_every=500):
+        self.data_file = os.path.join(data_dir, DATA_FILE)
+        self.journal = Journal(os.path.join(data_dir, JOURNAL_FILE), self.data_file,
+                               compact_every=checkpoint_every)
+        self.snapshot_file = os.path.join(data_dir, SNAPSHOT_FILE)
+        self.legacy_snapshot_file = os.path.join(data_dir, LEGACY_SNAPSHOT_FILE)
+
+    # ---------- 游戏状态 ----------
+    def load(self):
+        try:
+            return self.journal.load()
+        except (OSError, ValueError) as e:
+            moved = quarantine(self.data_file, self.journal.journal_file)
+            print(f"⚠️ 警告：加载 {self.data_file} 失败（{e}），已移到 {', '.join(moved)}，使用默认状态")
+            return self.journal.load()
+
+    def append(self, event, game_state=None):
+        return self.journal.append(event)
+
+    def needs_checkpoint(self):
+        return self.journal.needs_checkpoint()
+
+    def checkpoint(self, state):
+        self.journal.checkpoint(state)
+
+    def flush(self, timeout=None):
+        return self.journal.flush(timeout)
+
+    def recover(self):
+        self.journal.recover()
+
+    def reset(self):
+        self.journal.reset()  # 删除 game_data.json 和日志
+        for path in (self.snapshot_file, self.legacy_snapshot_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ---------- 快照 ----------
+    def load_snapshots(self):
+        entries = []
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break  # 写了一半的尾行
+        return entries
+
+    def load_legacy_snapshots(self):
+        if os.path.exists(self.snapshot_file) or not os.path.exists(self.legacy_snapshot_file):
+            return None
+        with open(self.legacy_snapshot_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def append_snapshot(self, entry):
+        if not os.path.exists(self.snapshot_file):
+            return self.replace_snapshots([entry])
+        data = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.snapshot_file, 'ab') as f:
+            f.write(data)
+        metrics.BYTES_WRITTEN.inc(len(data), target='snapshot')
+
+    def replace_snapshots(self, entries):
+        tmp = self.snapshot_file + '.tmp'
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.snapshot_file)
+        metrics.BYTES_WRITTEN.inc(len(data), target='snapshot')
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS players (pid INTEGER PRIMARY KEY, balance INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS votes (
+    round INTEGER NOT NULL, pid INTEGER NOT NULL, apple TEXT NOT NULL, key TEXT,
+    PRIMARY KEY (round, pid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS round_outcomes (
+    round INTEGER PRIMARY KEY, red INTEGER, gold INTEGER, silver INTEGER, message TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshots (seq INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL);
+"""
+
+SET_GAME_STATE = "INSERT OR REPLACE INTO meta (key, value) VALUES ('game_state', ?)"
+INSERT_PLAYER = "INSERT OR REPLACE INTO players (pid, balance) VALUES (?, ?)"
+UPDATE_BALANCE = "UPDATE players SET balance = ? WHERE pid = ?"
+INSERT_VOTE = "INSERT OR REPLACE INTO votes (round, pid, apple, key) VALUES (?, ?, ?, ?)"
+# 回退时重写投票但保留原来的幂等键（回退事件里没有键）
+RESTORE_VOTE = ("INSERT INTO votes (round, pid, apple) VALUES (?, ?, ?) "
+                "ON CONFLICT (round, pid) DO UPDATE SET apple = excluded.apple")
+DELETE_VOTES_FROM = "DELETE FROM votes WHERE round >= ?"
+INSERT_OUTCOME = "INSERT OR REPLACE INTO round_outcomes (round, red, gold, silver, message) VALUES (?, ?, ?, ?, ?)"
+DELETE_OUTCOMES_AFTER = "DELETE FROM round_outcomes WHERE round > ?"
+INSERT_SNAPSHOT = "INSERT INTO snapshots (data) VALUES (?)"
+CLEAR_TABLES = ('DELETE FROM meta', 'DELETE FROM players', 'DELETE FROM votes',
+                'DELETE FROM round_outcomes', 'DELETE FROM snapshots')
+
+
+class SqliteStorage:
+    name = 'sqlite'
+
+    def __init__(self, data_dir, start_balance, checkpoint_every=500, batch_max=1000):
+        self.path = os.path.join(data_dir, SQLITE_FILE)
+        self.start_balance = start_balance
+        self.batch_max = batch_max
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()      # 保护连接：写线程提交事务 / 加载时读取
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self._failed = None                # 写入失败后的 StorageError；recover() 之前不再写盘
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.executescript(SCHEMA)
+            if 'key' not in {row[1] for row in conn.execute('PRAGMA table_info(votes)')}:
+                conn.execute('ALTER TABLE votes ADD COLUMN key TEXT')  # 旧库：补上幂等键列
+            self._conn = conn
+        return self._conn
+
+    # ---------- 游戏状态 ----------
+    def load(self):
+        # 表里始终是最新状态，没有需要重放的事件
+        with self._lock:
+            try:
+                return self._read_state(), []
+            except sqlite3.DatabaseError as e:
+                self._close()
+                moved = quarantine(self.path, self.path + '-wal', self.path + '-shm')
+                print(f"⚠️ 警告：加载 {self.path} 失败（{e}），已移到 {', '.join(moved)}，使用默认状态")
+                return self._read_state(), []
+
+    def _read_state(self):
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'game_state'").fetchone()
+        players = PlayerStore()
+        for pid, balance in conn.execute('SELECT pid, balance FROM players ORDER BY pid'):
+            players.add(pid, balance)
+        if row is None and not len(players):
+            return None
+        vote_keys = []
+        for rnd, pid, apple, key in conn.execute('SELECT round, pid, apple, key FROM votes ORDER BY round'):
+            if pid in players:
+                players.set_vote(pid, rnd, apple)
+                if key is not None:
+                    vote_keys.append((pid, key, rnd))
+        return {'game_state': json.loads(row[0]) if row else {}, 'players': players.dump(),
+                'vote_keys': vote_keys}
+
+    def append(self, event, game_state=None):
+        # 在调用方线程把事件翻译成 SQL（参数是当时状态的拷贝），写线程按批提交
+        op = event['op']
+        statements = []
+        if op == 'join':
+            statements.append((INSERT_PLAYER, (event['pid'], self.start_balance)))
+        elif op == 'vote':
+            statements.append((INSERT_VOTE, (event['round'], event['pid'], event['apple'], event.get('key'))))
+        elif op == 'votes':
+            statements.append((INSERT_VOTE, [(event['round'], pid, apple, key) for pid, apple, key in event['votes']]))
+        elif op == 'round_reset':
+            statements.append((DELETE_VOTES_FROM, (event['round'],)))
+        elif op == 'round_end':
+            statements.append((UPDATE_BALANCE, [(b, pid) for pid, b in event['balances'].items()]))
+            result = event['game_state'].get('round_results', {}).get(str(event['round']))
+            if result:
+                votes = result['votes']
+                statements.append((INSERT_OUTCOME, (event['round'], votes['red'], votes['gold'],
+                                                    votes['silver'], result['message'])))
+        elif op == 'rollback':
+            players = PlayerStore.from_json(event['players'])
+            statements.append(('DELETE FROM players', ()))
+            statements.append((DELETE_VOTES_FROM, (event['round'] + 1,)))
+            statements.append((DELETE_OUTCOMES_AFTER, (event['round'],)))
+            statements.append((INSERT_PLAYER, list(players.balance_items())))
+            statements.append((RESTORE_VOTE, [(rnd, pid, apple)
+                                             for rnd in range(1, len(players.rounds) + 1)
+                                             for pid, apple in players.round_votes(rnd).items()]))
+        if game_state is not None and op not in ('join', 'vote', 'votes'):
+            state = event.get('game_state', game_state)
+            statements.append((SET_GAME_STATE, (json.dumps(state, ensure_ascii=False),)))
+        written = Future()
+        self._put(('sql', statements, written))
+        return written
+
+    def needs_checkpoint(self):
+        return False
+
+    def checkpoint(self, state):
+        # 每个事件提交后表里就是完整状态；这里只保证 game_state 与内存一致
+        data = json.dumps(state['game_state'], ensure_ascii=False)
+        metrics.BYTES_WRITTEN.inc(len(data.encode('utf-8')), target='checkpoint')
+        self._put(('sql', [(SET_GAME_STATE, (data,))], None))
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self._put(('flush', done, None))
+        return done.wait(timeout)
+
+    def recover(self):
+        done = threading.Event()
+        self._put(('recover', done, None))
+        done.wait()
+
+    def reset(self):
+        done = threading.Event()
+        self._put(('recover', threading.Event(), None))  # 全部清空，之前失败的写入不用再管
+        self._put(('sql', [(sql, ()) for sql in CLEAR_TABLES], None))
+        self._put(('flush', done, None))
+        done.wait()
+
+    # ---------- 快照 ----------
+    def load_snapshots(self):
+        with self._lock:
+            rows = self._connect().execute('SELECT data FROM snapshots ORDER BY seq').fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def load_legacy_snapshots(self):
+        return None
+
+    def append_snapshot(self, entry):
+        data = json.dumps(entry, ensure_ascii=False)
+        metrics.BYTES_WRITTEN.inc(len(data.encode('utf-8')), target='snapshot')
+        self._put(('sql', [(INSERT_SNAPSHOT, (data,))], None))
+
+    def replace_snapshots(self, entries):
+        rows = [(json.dumps(e, ensure_ascii=False),) for e in entries]
+        metrics.BYTES_WRITTEN.inc(sum(len(data.encode('utf-8')) for data, in rows), target='snapshot')
+        self._put(('sql', [('DELETE FROM snapshots', ()), (INSERT_SNAPSHOT, rows)], None))
+
+    # ---------- 后台写线程 ----------
+    def _put(self, item):
+        self._queue.put(item)
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=WRITER_IDLE_SECONDS)]
+            except queue.Empty:
+                with self._thread_lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            statements, waiting = [], []
+            for kind, payload, written in batch:
+                if kind == 'sql':
+                    if self._failed is None:
+                        statements.extend(payload)
+                        waiting.append(written)
+                    elif written is not None:
+                        written.set_exception(self._failed)
+                    continue
+                # flush / recover 之前，先提交已排队的语句
+                self._commit_batch(statements, waiting)
+                statements, waiting = [], []
+                if kind == 'recover':
+                    self._failed = None
+                payload.set()
+            self._commit_batch(statements, waiting)
+
+    def _commit_batch(self, statements, waiting):
+        error = self._commit(statements)
+        if error is not None:
+            self._failed = error
+        for written in waiting:
+            if written is None:
+                continue
+            if error is None:
+                written.set_result(None)
+            else:
+                written.set_exception(error)
+
+    def _commit(self, statements):
+        # 整批一个事务：一次提交（一次 fsync）。事务回滚后整批可以原样重做，
+        # 暂时性错误（数据库被锁、I/O 错误）重试几次；仍然失败时返回 StorageError，整批的请求都会收到
+        if not statements:
+            return None
+        for attempt in range(COMMIT_ATTEMPTS):
+            started = time.perf_counter()
+            try:
+                self._transaction(statements)
+            except sqlite3.OperationalError as e:
+                if attempt + 1 < COMMIT_ATTEMPTS:
+                    print(f"⚠️ 写入 {self.path} 失败（{e!r}），重试第 {attempt + 1} 次")
+                    metrics.STORAGE_ERRORS.inc(target='sqlite', result='retried')
+                    time.sleep(COMMIT_RETRY_DELAY * 2 ** attempt)
+                    continue
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                metrics.FSYNC_SECONDS.observe(time.perf_counter() - started, target='sqlite')
+                return None
+            print(f"💥 写入 {self.path} 失败：", repr(error))
+            metrics.STORAGE_ERRORS.inc(target='sqlite', result='failed')
+            return StorageError(f'写入 {self.path} 失败：{error!r}')
+
+    def _transaction(self, statements):
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN')
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        conn.executemany(sql, params)
+                    else:
+                        conn.execute(sql, params)
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+BACKENDS = {'json': JsonStorage, 'sqlite': SqliteStorage}
+
+
+def open_storage(backend, data_dir, start_balance, checkpoint_every=500):
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f'未知存储后端 {backend!r}，可选：{", ".join(BACKENDS)}')
+    return BACKENDS[backend](data_dir, start_balance, checkpoint_every)
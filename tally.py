@@ -0,0 +1,69 @@
+# ===== 本轮计票索引 =====
+# 本轮各颜色票数、已投票人数、有效玩家数（balance > 0）和其中已投票的人数
+# 在投票、余额变化、进入新一轮时 O(1) 更新，/admin、投票进度轮询和结算直接读计数；
+# 回退 / 重置时按玩家数据（投票列的 bytearray.count）精确重建。
+# 已结束轮次的票数第一次查询时从投票列统计一次，之后直接用。
+from players import APPLES
+
+COLORS = tuple(apple for apple in APPLES if apple)
+
+
+class RoundTally:
+    def __init__(self, players):
+        self.players = players       # PlayerStore
+        self.rebuild(1)
+
+    def rebuild(self, current_round):
+        self.current_round = current_round
+        players = self.players
+        self.counts = players.counts(current_round)       # 本轮 颜色 -> 票数
+        self.voted = players.voted_count(current_round)   # 本轮已投票人数（含余额 <= 0 的）
+        self.past_counts = {}                             # 已结束轮次 -> 票数
+        col = players.column(current_round)
+        self.eligible = 0            # 余额 > 0 的玩家数
+        self.voted_eligible = 0      # 余额 > 0 且本轮已投票
+        for balance, code in zip(players.balances, col):
+            if balance > 0:
+                self.eligible += 1
+                if code:
+                    self.voted_eligible += 1
+
+    def round_counts(self, rnd):
+        if rnd == self.current_round:
+            return dict(self.counts)
+        counts = self.past_counts.get(rnd)
+        if counts is None:
+            counts = self.past_counts[rnd] = self.players.counts(rnd)
+        return dict(counts)
+
+    @property
+    def not_voted(self):
+        return len(self.players) - self.voted
+
+    def add_player(self, pid, balance):
+        if balance > 0:
+            self.eligible += 1
+
+    def on_vote(self, pid, apple, balance):
+        self.counts[apple] += 1
+        self.voted += 1
+        if balance > 0:
+            self.voted_eligible += 1
+
+    def on_balance(self, pid, old, new):
+        if (old > 0) == (new > 0):
+            return
+        delta = 1 if new > 0 else -1
+        self.eligible += delta
+        if self.players.has_voted(pid, self.current_round):
+            self.voted_eligible += delta
+
+    def advance_round(self, current_round):
+        # 进入新一轮：所有人回到未投票状态
+        if current_round == self.current_round:
+            return
+        self.past_counts[self.current_round] = self.counts
+        self.current_round = current_round
+        self.counts = {color: 0 for color in COLORS}
+        self.voted = 0
+        self.voted_eligible = 0
@@ -0,0 +1,330 @@
+# ===== 结算规则测试 =====
+# settle() + balance_delta() + PlayerStore.apply_deltas()（Room.end_round_logic 的做法）逐个玩家
+# 和原来 app.py 里的 end_round_logic() 对比。baseline_end_round_logic 是原函数的拷贝，
+# 只把全局的 players / game_state 改成参数、去掉了保存快照。
+import copy
+import itertools
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from players import APPLES, PlayerStore
+from settlement import Rules, settle, balance_delta
+
+MAX_ROUNDS = 8
+REWARD = 1000
+PENALTY = 2000
+RULES = Rules(MAX_ROUNDS, REWARD, PENALTY, 10)
+CHOICES = (None, 'red', 'gold', 'silver')  # None：本轮没投
+
+
+# ===== 原实现 =====
+def baseline_end_round_logic(players, game_state):
+    current_round = game_state['current_round']
+
+    # Step 1: 扣除未投票玩家 PENALTY（-2000）
+    for pid, p in players.items():
+        if len(p['votes']) < current_round:
+            p['balance'] = max(0, p['balance'] - PENALTY)
+
+    # Step 2: 收集本轮已投票玩家（用于计票）
+    voted_players = [p for p in players.values() if len(p['votes']) >= current_round]
+    total_voted = len(voted_players)
+
+    # 初始化计票
+    votes = {'red': 0, 'gold': 0, 'silver': 0}
+    for p in voted_players:
+        apple = p['votes'][current_round - 1]
+        if apple in votes:
+            votes[apple] += 1
+
+    red, gold, silver = votes['red'], votes['gold'], votes['silver']
+    game_won_by_all = False
+
+    # ====== 全体胜利条件（兼容旧规则 + 新增规则）======
+    game_won_by_all = False
+    if total_voted > 0:
+        # 原有规则：仅1人投票且投红 → 全体胜利
+        if total_voted == 1 and red == 1:
+            game_won_by_all = True
+        # 新增规则1：前7轮所有人投红
+        elif current_round < MAX_ROUNDS and red == total_voted:
+            game_won_by_all = True
+        # 新增规则2：第8轮红 >= 本轮有效玩家数 - 10
+        elif current_round == MAX_ROUNDS:
+            total_eligible = game_state.get('current_round_eligible', total_voted)
+            if red >= total_eligible - 10:
+                game_won_by_all = True
+
+    if game_won_by_all:
+        # ✅ 全体胜利：余额保持不变（不加奖励，不扣惩罚）
+        game_state['game_ended'] = True
+        game_state['round_status'] = 'ended'
+        game_state['won_by_all'] = True
+        return
+
+    # ====== 常规结算逻辑（与原逻辑一致，仅惩罚值改为 PENALTY）======
+    if total_voted == 0:
+        # 无人投票：已在 Step 1 扣款，无需额外操作
+        pass
+
+    elif total_voted == 1:
+        # 此时 red != 1（否则已触发全体胜利），所以是金或银
+        for p in players.values():
+            p['balance'] = max(0, p['balance'] - PENALTY)
+
+    else:
+        # 多人投票
+        if red == 0:
+            if gold < silver:
+                for p in voted_players:
+                    if p['votes'][current_round - 1] == 'gold':
+                        p['balance'] += REWARD
+                    else:
+                        p['balance'] = max(0, p['balance'] - PENALTY)
+            elif silver < gold:
+                for p in voted_players:
+                    if p['votes'][current_round - 1] == 'silver':
+                        p['balance'] += REWARD
+                    else:
+                        p['balance'] = max(0, p['balance'] - PENALTY)
+            else:
+                # 金 == 银（含全金、全银）
+                for p in players.values():
+                    p['balance'] = max(0, p['balance'] - PENALTY)
+        else:
+                # 有人投红（red > 0）
+                if current_round == MAX_ROUNDS:
+                   # ===== 第8轮：两阶段胜负判定 =====
+                    # 阶段1: 红能否胜？必须 red > 0 且严格小于所有有票的非红
+                    red_can_win = False
+                    if red > 0:
+                        active_non_red = []
+                        if gold > 0:
+                            active_non_red.append(gold)
+                        if silver > 0:
+                            active_non_red.append(silver)
+                        # 只有当存在非红投票时，才判断红是否更少
+                        if active_non_red and all(red < x for x in active_non_red):
+                            red_can_win = True
+
+                    if red_can_win:
+                        # --- 红胜 ---
+                        for p in players.values():
+                            if len(p['votes']) >= current_round:
+                                vote = p['votes'][current_round - 1]
+                                if vote == 'red':
+                                    p['balance'] += REWARD
+                                else:
+                                    p['balance'] = max(0, p['balance'] - PENALTY)
+                    else:
+                        # --- 红失败（或 red == 0），处理非红 ---
+                        if red == 0:
+                            # 情况A: 无人投红 → 金、银需至少两个活跃才能决胜
+                            non_red_active = []
+                            if gold > 0:
+                                non_red_active.append('gold')
+                            if silver > 0:
+                                non_red_active.append('silver')
+
+                            if len(non_red_active) < 2:
+                                # 如 (0,0,5)、(0,5,0) → 全体惩罚
+                                for p in players.values():
+                                    if len(p['votes']) >= current_round:
+                                        p['balance'] = max(0, p['balance'] - PENALTY)
+                            else:
+                                # 金、银都有票
+                                if gold < silver:
+                                    winner = 'gold'
+                                elif silver < gold:
+                                    winner = 'silver'
+                                else:
+                                    winner = None  # 平局
+
+                                if winner:
+                                    for p in players.values():
+                                        if len(p['votes']) >= current_round:
+                                            vote = p['votes'][current_round - 1]
+                                            if vote == winner:
+                                                p['balance'] += REWARD
+                                            else:
+                                                p['balance'] = max(0, p['balance'] - PENALTY)
+                                else:
+                                    for p in players.values():
+                                        if len(p['votes']) >= current_round:
+                                            p['balance'] = max(0, p['balance'] - PENALTY)
+                        else:
+                            # 情况B: red > 0 但红失败 → 非红单色也可胜
+                            if gold == 0 and silver == 0:
+                                # 理论上不会发生（因 red > 0 且 total > 0）
+                                for p in players.values():
+                                    if len(p['votes']) >= current_round:
+                                        p['balance'] = max(0, p['balance'] - PENALTY)
+                            elif gold == 0:
+                                # 只有银有票 → 银胜
+                                winner = 'silver'
+                                for p in players.values():
+                                    if len(p['votes']) >= current_round:
+                                        vote = p['votes'][current_round - 1]
+                                        if vote == winner:
+                                            p['balance'] += REWARD
+                                        else:
+                                            p['balance'] = max(0, p['balance'] - PENALTY)
+                            elif silver == 0:
+                                # 只有金有票 → 金胜
+                                winner = 'gold'
+                                for p in players.values():
+                                    if len(p['votes']) >= current_round:
+                                        vote = p['votes'][current_round - 1]
+                                        if vote == winner:
+                                            p['balance'] += REWARD
+                                        else:
+                                            p['balance'] = max(0, p['balance'] - PENALTY)
+                            else:
+                                # 金、银都有票 → 比多少
+                                if gold < silver:
+                                    winner = 'gold'
+                                elif silver < gold:
+                                    winner = 'silver'
+                                else:
+                                    winner = None
+
+                                if winner:
+                                    for p in players.values():
+                                        if len(p['votes']) >= current_round:
+                                            vote = p['votes'][current_round - 1]
+                                            if vote == winner:
+                                                p['balance'] += REWARD
+                                            else:
+                                                p['balance'] = max(0, p['balance'] - PENALTY)
+                                else:
+                                    for p in players.values():
+                                        if len(p['votes']) >= current_round:
+                                            p['balance'] = max(0, p['balance'] - PENALTY)
+
+                else:
+                   # ===== 非第8轮：红若严格小于所有【有票】的非红颜色，则红胜；否则非红全体胜 =====
+                    active_non_red = []
+                    if gold > 0:
+                        active_non_red.append(gold)
+                    if silver > 0:
+                        active_non_red.append(silver)
+
+                    # 判断红是否严格小于每一个活跃非红颜色
+                    if active_non_red and all(red < x for x in active_non_red):
+                        # 红胜
+                        for p in voted_players:
+                            vote = p['votes'][current_round - 1]
+                            if vote == 'red':
+                                p['balance'] += REWARD
+                            else:
+                                p['balance'] = max(0, p['balance'] - PENALTY)
+                    else:
+                        # 非红全体胜（包括：无非红活跃、或红不严格最少）
+                        for p in voted_players:
+                            if p['votes'][current_round - 1] == 'red':
+                                p['balance'] = max(0, p['balance'] - PENALTY)
+                            else:
+                                p['balance'] += REWARD
+
+    # ===== 游戏结束判断 =====
+    if current_round >= MAX_ROUNDS:
+        game_state['game_ended'] = True
+        game_state['round_status'] = 'ended'
+    else:
+        game_state['current_round'] += 1
+        game_state['round_status'] = 'waiting'
+        game_state['voting_start_time'] = None
+
+
+# ===== 新实现：按投票代码查表，整列更新 =====
+def engine_end_round(players, current_round, eligible):
+    store = PlayerStore()
+    for pid, p in players.items():
+        store.add(pid, p['balance'])
+        for rnd, apple in enumerate(p['votes'], 1):
+            store.set_vote(pid, rnd, apple)
+    counts = store.counts(current_round)
+    outcome = settle(RULES, current_round, counts['red'], counts['gold'], counts['silver'], eligible)
+    store.apply_deltas(current_round, [balance_delta(RULES, outcome, apple) for apple in APPLES])
+    return dict(store.balance_items()), outcome
+
+
+def make_players(balances, choices, current_round):
+    # 之前各轮都投红；本轮按 choices，None 表示没投
+    players = {}
+    for pid, (balance, apple) in enumerate(zip(balances, choices), 1):
+        votes = ['red'] * (current_round - 1)
+        if apple is not None:
+            votes.append(apple)
+        players[pid] = {'id': pid, 'balance': balance, 'votes': votes}
+    return players
+
+
+def run_both(balances, choices, current_round, eligible=None):
+    players = make_players(balances, choices, current_round)
+    if eligible is None:
+        eligible = sum(1 for b in balances if b > 0)  # 与 start_round 记录的相同
+    expected = copy.deepcopy(players)
+    game_state = {'current_round': current_round, 'current_round_eligible': eligible,
+                  'round_status': 'voting', 'game_ended': False, 'won_by_all': False}
+    baseline_end_round_logic(expected, game_state)
+    balances_after, outcome = engine_end_round(players, current_round, eligible)
+    assert balances_after == {pid: p['balance'] for pid, p in expected.items()}, \
+        (balances, choices, current_round, eligible, outcome)
+    assert outcome.won_by_all == game_state['won_by_all']
+    return [balances_after[pid] for pid in sorted(balances_after)], outcome
+
+
+def test_all_small_rounds_match_baseline():
+    # 4 名玩家的所有投票组合 × 余额（含 0 和不够扣的）× 每一轮
+    for current_round in range(1, MAX_ROUNDS + 1):
+        for choices in itertools.product(CHOICES, repeat=4):
+            run_both([10000, 1500, 0, 3000], choices, current_round)
+
+
+def test_random_rounds_match_baseline():
+    rng = random.Random(20261017)
+    for _ in range(3000):
+        n = rng.randint(0, 40)
+        balances = [rng.choice([0, 500, 1000, 2000, 2500, 4000, 10000]) for _ in range(n)]
+        choices = [rng.choice(CHOICES) for _ in range(n)]
+        current_round = rng.randint(1, MAX_ROUNDS)
+        eligible = rng.choice([None, rng.randint(0, n + 12)])
+        run_both(balances, choices, current_round, eligible)
+
+
+def test_balance_clamped_at_zero():
+    # 红不是最少：红 -PENALTY；余额不够扣时停在 0，不会变成负数
+    after, outcome = run_both([1500, 10000, 10000], ['red', 'red', 'gold'], 1)
+    assert outcome.winners == {'gold', 'silver'} and outcome.losers == {'red'}
+    assert after == [0, 8000, 11000]
+
+
+def test_non_voter_penalized_twice_when_everyone_is():
+    # 唯一投票者投金：全员 -PENALTY，没投的人再 -PENALTY
+    after, outcome = run_both([10000, 10000, 3000], ['gold', None, None], 2)
+    assert outcome.penalize_all
+    assert after == [8000, 6000, 0]
+
+
+def test_non_voter_penalized_even_when_all_win():
+    after, outcome = run_both([10000, 10000, 10000], ['red', 'red', None], 3)
+    assert outcome.won_by_all
+    assert after == [10000, 10000, 8000]
+
+
+def test_final_round_margin():
+    # 第 8 轮：红 >= 本轮有效玩家数 - 10 即全体胜利，差一票就按常规结算
+    choices = ['red'] * 10 + ['gold'] * 6 + ['silver'] * 4
+    after, outcome = run_both([10000] * 20, choices, MAX_ROUNDS, eligible=20)
+    assert outcome.won_by_all and after == [10000] * 20
+    after, outcome = run_both([10000] * 20, choices, MAX_ROUNDS, eligible=21)
+    assert not outcome.won_by_all
+    assert outcome.winners == {'silver'}
+    assert after == [8000] * 16 + [11000] * 4
+    # 前 7 轮没有这条规则
+    _, outcome = run_both([10000] * 20, choices, MAX_ROUNDS - 1, eligible=20)
+    assert not outcome.won_by_all